@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Benchmark query-cloudflare-docs.py against local stand-ins for Worker AI and MCP.
+
+A stub server (scripts/cfdocs/stub_server.py) is started with the requested
+latency, error rate and response size for each endpoint. For each question
+count, a synthetic question file is generated from the project's own source
+files, and the tool is run against the stubs in a subprocess with its own
+log directory. The report shows questions/sec, per-stage latency
+percentiles from the run's metrics.json, and the subprocess's peak RSS.
+"""
+
+import argparse
+import json
+import os
+import random
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from rich import print
+from rich.table import Table
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from cfdocs.file_index import ProjectFileIndex
+from cfdocs.stub_server import EndpointProfile, StubServer
+
+SCRIPT = Path(__file__).resolve().parent / "query-cloudflare-docs.py"
+SOURCE_ROOTS = ("src/", "worker/", "scripts/")
+STAGES = ("question", "worker_ai_rewrite", "mcp", "worker_ai_follow_up")
+BINDINGS = ("d1", "kv", "r2", "ai", "durable_objects", "queues", "workflows")
+LIBS = ("drizzle-orm", "hono", "react", "zod", "undici")
+TOPICS = ("bind a D1 database", "cache responses in KV", "stream AI output", "retry a workflow step",
+          "store uploads in R2", "hibernate a Durable Object websocket", "batch queue messages")
+
+
+def synthetic_questions(count, files, seed=0):
+    """Distinct questions referencing real project files."""
+    rng = random.Random(seed)
+    for i in range(count):
+        picked = rng.sample(files, min(len(files), rng.randint(1, 3)))
+        relevant = []
+        for path in picked:
+            start = rng.randint(1, 40)
+            relevant.append({"file_path": path, "start_line": start, "end_line": start + rng.randint(5, 30),
+                             "relation_to_question": "synthetic"})
+        yield {
+            "query": f"How do I {rng.choice(TOPICS)} in this project? (case {i})",
+            "cloudflare_bindings_involved": rng.sample(BINDINGS, 2),
+            "node_libs_involved": rng.sample(LIBS, 1),
+            "tags": [rng.choice(BINDINGS)],
+            "relevant_code_files": relevant,
+        }
+
+
+def run_once(count, files, server, workdir, tool_args):
+    """Run the tool over `count` synthetic questions; returns a result dict."""
+    run_dir = Path(workdir) / f"run-{count}"
+    run_dir.mkdir(parents=True, exist_ok=True)
+    questions = run_dir / "questions.jsonl"
+    with open(questions, "w") as f:
+        for q in synthetic_questions(count, files):
+            f.write(json.dumps(q) + "\n")
+
+    env = dict(os.environ)
+    env.update({
+        "CFDOCS_WORKER_URL": f"{server.base_url}/v1/chat/completions",
+        "CFDOCS_MCP_URL": f"{server.base_url}/mcp",
+        "CFDOCS_LOG_DIR": str(run_dir / "logs"),
+        "COLUMNS": "200",
+    })
+    before = dict(server.requests)
+    started = time.perf_counter()
+    with open(run_dir / "output.log", "w") as log:
+        proc = subprocess.Popen([sys.executable, str(SCRIPT), str(questions)] + tool_args,
+                                stdout=log, stderr=subprocess.STDOUT, env=env)
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - started
+
+    metrics_path = run_dir / "logs" / "metrics.json"
+    metrics = {}
+    if metrics_path.exists():
+        with open(metrics_path) as f:
+            metrics = json.load(f)
+    return {
+        "questions": count,
+        "exit_code": proc.returncode,
+        "wall_seconds": wall,
+        "questions_per_second": count / wall if wall else None,
+        # ru_maxrss is in kilobytes on Linux.
+        "peak_rss_mb": usage.ru_maxrss / 1024.0,
+        "stages": {stage: metrics.get("stages", {}).get(stage) for stage in STAGES},
+        "requests": {name: server.requests[name] - before[name] for name in server.requests},
+        "log": str(run_dir / "output.log"),
+    }
+
+
+def print_report(results):
+    table = Table(title="query-cloudflare-docs.py benchmark")
+    for column in ("questions", "q/s", "wall s", "question p50", "p95", "p99",
+                   "rewrite p95", "mcp p95", "follow-up p95", "peak RSS MB"):
+        table.add_column(column, justify="right")
+
+    def stage(result, name, key):
+        s = result["stages"].get(name)
+        return f"{s[key]:.3f}" if s else "-"
+
+    for r in results:
+        table.add_row(str(r["questions"]), f"{r['questions_per_second']:.1f}", f"{r['wall_seconds']:.2f}",
+                      stage(r, "question", "p50"), stage(r, "question", "p95"), stage(r, "question", "p99"),
+                      stage(r, "worker_ai_rewrite", "p95"), stage(r, "mcp", "p95"),
+                      stage(r, "worker_ai_follow_up", "p95"), f"{r['peak_rss_mb']:.1f}")
+    print(table)
+    for r in results:
+        if r["exit_code"] != 0:
+            print(f"[red]Run with {r['questions']} questions exited with {r['exit_code']}; see {r['log']}[/red]")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10,100,1000",
+                        help="Comma-separated question counts, 10 to 10000 (default: 10,100,1000)")
+    parser.add_argument("--worker-latency", type=float, default=0.05,
+                        help="Median Worker AI latency in seconds (default: 0.05)")
+    parser.add_argument("--mcp-latency", type=float, default=0.03,
+                        help="Median MCP latency in seconds (default: 0.03)")
+    parser.add_argument("--latency-sigma", type=float, default=0.5,
+                        help="Log-normal sigma of both latency distributions (default: 0.5)")
+    parser.add_argument("--worker-error-rate", type=float, default=0.0,
+                        help="Fraction of Worker AI calls answered with 429/503 (default: 0)")
+    parser.add_argument("--mcp-error-rate", type=float, default=0.0,
+                        help="Fraction of MCP calls answered with 429/503 (default: 0)")
+    parser.add_argument("--worker-response-bytes", type=int, default=1500,
+                        help="Worker AI completion size in bytes (default: 1500)")
+    parser.add_argument("--mcp-response-bytes", type=int, default=4000,
+                        help="MCP answer size in bytes (default: 4000)")
+    parser.add_argument("--tool-args", default="--concurrency 8 --no-cache",
+                        help="Arguments passed to query-cloudflare-docs.py "
+                             "(default: '--concurrency 8 --no-cache')")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the stubs (default: 0)")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary run directories")
+    parser.add_argument("--output", help="Also write the results as JSON to this path")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    for size in sizes:
+        if not 10 <= size <= 10000:
+            parser.error(f"question counts must be between 10 and 10000, got {size}")
+
+    files = [p for p in ProjectFileIndex.open(".").files
+             if p.startswith(SOURCE_ROOTS) and p.endswith((".ts", ".tsx", ".py"))]
+    if not files:
+        parser.error("no source files found under src/, worker/ or scripts/; run from the project root")
+
+    worker_ai = EndpointProfile(args.worker_latency, args.latency_sigma, args.worker_error_rate,
+                                args.worker_response_bytes)
+    mcp = EndpointProfile(args.mcp_latency, args.latency_sigma, args.mcp_error_rate,
+                          args.mcp_response_bytes)
+    tool_args = shlex.split(args.tool_args)
+    workdir = tempfile.mkdtemp(prefix="cfdocs-bench-")
+    results = []
+    with StubServer(worker_ai, mcp, seed=args.seed) as server:
+        print(f"[cyan]Stub endpoints on {server.base_url}; run directories in {workdir}[/cyan]")
+        for size in sizes:
+            print(f"[cyan]Running {size} questions...[/cyan]")
+            results.append(run_once(size, files, server, workdir, tool_args))
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+        print(f"[green]Results written to {args.output}[/green]")
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0 if all(r["exit_code"] == 0 for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
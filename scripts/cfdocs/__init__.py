@@ -0,0 +1 @@
+"""Support modules for scripts/query-cloudflare-docs.py."""
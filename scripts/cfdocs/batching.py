@@ -0,0 +1,115 @@
+"""
+Stable prompt prefix and batched rewrite requests.
+
+With --stable-prefix the rewrite call is sent as two messages: a system
+message holding the instructions and project tree, which is byte-for-byte
+identical for every question in a run, followed by the question-specific
+user message. Providers that cache prompt prefixes can then reuse the
+shared part instead of re-reading it for every question.
+
+With --batch-size, several questions that share the same tags are packed
+into one rewrite completion. The answer is split on its per-question
+headings, and any question whose section is missing falls back to a single
+rewrite call.
+"""
+
+import hashlib
+import re
+import threading
+
+BATCH_HEADING = re.compile(r"^#{2,4}\s*Question\s+(\d+)\s*:?\s*$", re.MULTILINE)
+
+PREFIX_INSTRUCTIONS = """You are preparing questions for the Cloudflare Docs MCP API.
+For each question you receive, rewrite it for MCP with full context and formal technical phrasing.
+The project's folder structure is listed below; the question will name the files relevant to it."""
+
+
+def project_prefix(tree_text):
+    """The system message shared by every rewrite call of a run."""
+    return {"role": "system", "content": f"{PREFIX_INSTRUCTIONS}\n\nFolder Structure:\n{tree_text}"}
+
+
+def group_questions(items, size, window_factor=4):
+    """Group (seq, question) pairs into batches of up to `size`.
+
+    Questions are read in windows of size * window_factor; within a window,
+    questions with the same tags are batched together and leftovers are
+    batched in input order.
+    """
+    if size <= 1:
+        for item in items:
+            yield [item]
+        return
+    window = []
+    for item in items:
+        window.append(item)
+        if len(window) >= size * window_factor:
+            yield from _chunk_window(window, size)
+            window = []
+    if window:
+        yield from _chunk_window(window, size)
+
+
+def _chunk_window(window, size):
+    buckets = {}
+    for seq, q in window:
+        buckets.setdefault(tuple(sorted(q.get("tags", []))), []).append((seq, q))
+    leftovers = []
+    for items in buckets.values():
+        full = len(items) // size * size
+        for i in range(0, full, size):
+            yield items[i:i + size]
+        leftovers.extend(items[full:])
+    leftovers.sort(key=lambda item: item[0])
+    for i in range(0, len(leftovers), size):
+        yield leftovers[i:i + size]
+
+
+def batch_message(prompts):
+    """Combine several user prompts into one batched rewrite request."""
+    n = len(prompts)
+    parts = [
+        f"You will receive {n} questions, each under a \"### Question <n>\" heading. "
+        f"Rewrite each one separately. Reply with exactly {n} sections, each starting with "
+        f"a line \"### Question <n>\" followed only by the rewritten question."
+    ]
+    for i, prompt in enumerate(prompts, 1):
+        parts.append(f"### Question {i}\n{prompt['content'].strip()}")
+    return {"role": "user", "content": "\n\n".join(parts)}
+
+
+def split_batch_answer(text, n):
+    """Split a batched answer into n sections; missing sections are None."""
+    sections = [None] * n
+    matches = list(BATCH_HEADING.finditer(text or ""))
+    for i, match in enumerate(matches):
+        index = int(match.group(1)) - 1
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        body = text[match.end():end].strip()
+        if 0 <= index < n and body and sections[index] is None:
+            sections[index] = body
+    return sections
+
+
+class PrefixTracker:
+    """Counts how many prefix bytes were sent again after their first use."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seen = set()
+        self.first_bytes = 0
+        self.reused_bytes = 0
+
+    def record(self, message):
+        data = message["content"].encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if digest in self._seen:
+                self.reused_bytes += len(data)
+            else:
+                self._seen.add(digest)
+                self.first_bytes += len(data)
+
+    def stats(self):
+        with self._lock:
+            return {"first_bytes": self.first_bytes, "reused_bytes": self.reused_bytes}
@@ -0,0 +1,179 @@
+"""
+BM25 code search used to pick relevant_code_files for bare questions.
+
+Source files under a few roots are split into fixed-size line spans. Each
+span is tokenised into lower-cased identifiers, with camelCase and
+snake_case names also split into their parts, and the file's path
+components are added to every span. Spans are ranked against the question
+with Okapi BM25 over an in-memory inverted index.
+
+Term counts per span are persisted to disk. On the next run a file is only
+read again if its mtime or size changed, and it is only re-tokenised if its
+SHA-256 changed too.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+INDEX_VERSION = 1
+DEFAULT_ROOTS = ("src/", "worker/", "scripts/")
+DEFAULT_EXTENSIONS = (".ts", ".tsx", ".js", ".jsx", ".py", ".sql", ".md")
+SPAN_LINES = 40
+
+WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in into is it my of on or "
+    "should the this to use using what when where which with".split())
+
+
+def tokenize(text):
+    terms = []
+    for word in WORD.findall(text):
+        lower = word.lower()
+        if lower not in STOPWORDS and len(lower) > 1:
+            terms.append(lower)
+        parts = [p.lower() for p in CAMEL.findall(word.replace("_", " ")) if len(p) > 1]
+        if len(parts) > 1:
+            terms.extend(p for p in parts if p not in STOPWORDS)
+    return terms
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class CodeSearchIndex:
+    """Persistent BM25 index over fixed-size spans of project source files."""
+
+    def __init__(self, root=".", cache_path=None, roots=DEFAULT_ROOTS,
+                 extensions=DEFAULT_EXTENSIONS, k1=1.2, b=0.75):
+        self.root = root
+        self.cache_path = cache_path
+        self.roots = tuple(roots)
+        self.extensions = tuple(extensions)
+        self.k1 = k1
+        self.b = b
+        self.files = {}
+        self.reindexed = 0
+        self.postings = {}
+        self.spans = []
+
+    def load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == INDEX_VERSION and data.get("span_lines") == SPAN_LINES:
+            self.files = data.get("files", {})
+
+    def save(self):
+        if not self.cache_path:
+            return
+        tmp = f"{self.cache_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": INDEX_VERSION, "span_lines": SPAN_LINES, "files": self.files}, f)
+        os.replace(tmp, self.cache_path)
+
+    def _index_file(self, rel, full):
+        with open(full, encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+        path_terms = tokenize(rel.replace("/", " ").replace(".", " "))
+        spans = []
+        for start in range(0, max(len(lines), 1), SPAN_LINES):
+            chunk = lines[start:start + SPAN_LINES]
+            counts = Counter(tokenize("\n".join(chunk)))
+            counts.update(path_terms)
+            spans.append([start + 1, start + max(len(chunk), 1), dict(counts)])
+        return spans
+
+    def refresh(self, paths):
+        """Bring the index up to date with `paths`, project-relative posix paths."""
+        wanted = {p for p in paths if p.startswith(self.roots) and p.endswith(self.extensions)}
+        changed = False
+        for rel in list(self.files):
+            if rel not in wanted:
+                del self.files[rel]
+                changed = True
+        for rel in sorted(wanted):
+            full = os.path.join(self.root, rel)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            entry = self.files.get(rel)
+            if entry and entry["mtime"] == st.st_mtime and entry["size"] == st.st_size:
+                continue
+            digest = _sha256(full)
+            if entry and entry["sha256"] == digest:
+                entry["mtime"], entry["size"] = st.st_mtime, st.st_size
+            else:
+                entry = {"sha256": digest, "spans": self._index_file(rel, full)}
+                entry["mtime"], entry["size"] = st.st_mtime, st.st_size
+                self.files[rel] = entry
+                self.reindexed += 1
+            changed = True
+        self._build_postings()
+        return changed
+
+    def _build_postings(self):
+        postings = defaultdict(list)
+        spans = []
+        for rel in sorted(self.files):
+            for start, end, counts in self.files[rel]["spans"]:
+                doc = len(spans)
+                spans.append((rel, start, end, sum(counts.values())))
+                for term, tf in counts.items():
+                    postings[term].append((doc, tf))
+        self.postings = dict(postings)
+        self.spans = spans
+        total = sum(span[3] for span in spans)
+        self.avgdl = total / len(spans) if spans else 0.0
+
+    def search(self, text, k=5):
+        """Top-k spans as relevant_code_files entries, best first."""
+        if not self.spans:
+            return []
+        n = len(self.spans)
+        scores = defaultdict(float)
+        matched = defaultdict(list)
+        for term in set(tokenize(text)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings:
+                length = self.spans[doc][3]
+                norm = tf + self.k1 * (1 - self.b + self.b * length / self.avgdl)
+                scores[doc] += idf * tf * (self.k1 + 1) / norm
+                matched[doc].append(term)
+        best = sorted(scores, key=lambda doc: (-scores[doc], doc))[:k]
+        results = []
+        for doc in best:
+            rel, start, end, _ = self.spans[doc]
+            results.append({
+                "file_path": rel,
+                "start_line": start,
+                "end_line": end,
+                "relation_to_question": f"BM25 {scores[doc]:.2f}: {', '.join(sorted(matched[doc]))}",
+            })
+        return results
+
+    @classmethod
+    def open(cls, paths, root=".", cache_path=None, **kwargs):
+        index = cls(root, cache_path, **kwargs)
+        index.load()
+        if index.refresh(paths):
+            index.save()
+        return index
@@ -0,0 +1,173 @@
+"""
+Project file index used to render the folder tree in prompts.
+
+The tree used to come from a full `Path(".").rglob("*")` on every question,
+walking node_modules, .git and build output each time. The index is built
+once per run instead, skips anything matched by the root .gitignore plus a
+few always-ignored directories, and is persisted to disk. On the next run
+only directories whose mtime changed are listed again.
+"""
+
+import json
+import os
+import re
+
+# Skipped even when the project's .gitignore does not mention them.
+DEFAULT_EXCLUDES = [".git/", "node_modules/", "__pycache__/", "client/dist/", ".wrangler/"]
+
+INDEX_VERSION = 1
+
+
+def _glob_to_regex(glob):
+    """Translate the glob part of a .gitignore pattern into a regex."""
+    out = []
+    i = 0
+    while i < len(glob):
+        if glob.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif glob.startswith("/**", i) and i + 3 == len(glob):
+            out.append("/.*")
+            i += 3
+        elif glob[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif glob[i] == "?":
+            out.append("[^/]")
+            i += 1
+        else:
+            out.append(re.escape(glob[i]))
+            i += 1
+    return "".join(out)
+
+
+class IgnoreRules:
+    """A subset of .gitignore semantics: globs, `**`, anchoring, `dir/` and `!`."""
+
+    def __init__(self, patterns):
+        self.rules = []
+        for raw in patterns:
+            pattern = raw.strip()
+            if not pattern or pattern.startswith("#"):
+                continue
+            negate = pattern.startswith("!")
+            if negate:
+                pattern = pattern[1:]
+            dir_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            anchored = "/" in pattern
+            pattern = pattern.lstrip("/")
+            regex = _glob_to_regex(pattern)
+            if not anchored:
+                regex = "(?:.*/)?" + regex
+            self.rules.append((re.compile(regex + "$"), negate, dir_only))
+
+    @classmethod
+    def from_file(cls, path, extra=()):
+        patterns = list(extra)
+        if os.path.exists(path):
+            with open(path) as f:
+                patterns.extend(f.read().splitlines())
+        return cls(patterns)
+
+    def ignored(self, rel_path, is_dir):
+        result = False
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                result = not negate
+        return result
+
+
+class ProjectFileIndex:
+    """Sorted list of project files, refreshed incrementally from directory mtimes."""
+
+    def __init__(self, root=".", cache_path=None, extra_excludes=()):
+        self.root = root
+        self.cache_path = cache_path
+        patterns = DEFAULT_EXCLUDES + list(extra_excludes)
+        self.ignore = IgnoreRules.from_file(os.path.join(root, ".gitignore"), patterns)
+        self.signature = self._signature(patterns)
+        self.dirs = {}
+        self.files = []
+        self.rescanned = 0
+
+    def _signature(self, patterns):
+        gitignore = os.path.join(self.root, ".gitignore")
+        content = ""
+        if os.path.exists(gitignore):
+            with open(gitignore) as f:
+                content = f.read()
+        return json.dumps([INDEX_VERSION, patterns, content])
+
+    def load(self):
+        """Load a previously saved index; ignored if the ignore rules changed."""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("signature") == self.signature:
+            self.dirs = data.get("dirs", {})
+
+    def save(self):
+        if not self.cache_path:
+            return
+        tmp = f"{self.cache_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"signature": self.signature, "dirs": self.dirs}, f)
+        os.replace(tmp, self.cache_path)
+
+    def _list_dir(self, rel, full):
+        files, subdirs = [], []
+        with os.scandir(full) as entries:
+            for entry in entries:
+                child = f"{rel}/{entry.name}" if rel else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if not self.ignore.ignored(child, True):
+                        subdirs.append(entry.name)
+                elif entry.is_file() and not self.ignore.ignored(child, False):
+                    files.append(entry.name)
+        return sorted(files), sorted(subdirs)
+
+    def refresh(self):
+        """Walk the tree, re-listing only directories whose mtime changed."""
+        cached = self.dirs
+        dirs = {}
+        self.rescanned = 0
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            full = os.path.join(self.root, rel) if rel else self.root
+            try:
+                mtime = os.stat(full).st_mtime_ns
+            except OSError:
+                continue
+            entry = cached.get(rel)
+            if entry is None or entry["mtime"] != mtime:
+                try:
+                    files, subdirs = self._list_dir(rel, full)
+                except OSError:
+                    continue
+                entry = {"mtime": mtime, "files": files, "subdirs": subdirs}
+                self.rescanned += 1
+            dirs[rel] = entry
+            stack.extend(f"{rel}/{d}" if rel else d for d in entry["subdirs"])
+
+        self.dirs = dirs
+        paths = [f"{rel}/{name}" if rel else name
+                 for rel, entry in dirs.items() for name in entry["files"]]
+        self.files = sorted(paths, key=lambda p: p.split("/"))
+        return self
+
+    @classmethod
+    def open(cls, root=".", cache_path=None, extra_excludes=()):
+        """Load the saved index (if any), refresh it and save it back."""
+        index = cls(root, cache_path, extra_excludes)
+        index.load()
+        index.refresh()
+        index.save()
+        return index
@@ -0,0 +1,161 @@
+"""
+Per-question deadlines and hedged requests.
+
+A Deadline splits one question's time budget across its three calls; each
+call gets its share of whatever is left, so time saved early carries over
+to later calls.
+
+The Hedger watches per-endpoint latency. Once a call has been running longer
+than the endpoint's recent p95, a duplicate is sent and whichever finishes
+first wins. A loser that has not started yet is cancelled; one already on
+the wire cannot be interrupted by requests, so its result is discarded, but
+its completion time is still recorded. That time is what the call would
+have taken without hedging, and it is used to report the p99 saved.
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .metrics import percentile
+from .transport import DeadlineExceeded
+
+STAGES = ("worker_ai_rewrite", "mcp", "worker_ai_follow_up")
+DEFAULT_SHARES = {"worker_ai_rewrite": 0.4, "mcp": 0.2, "worker_ai_follow_up": 0.4}
+
+
+class Deadline:
+    """Time budget for one question, shared out across its stages."""
+
+    def __init__(self, seconds, shares=None):
+        self.expires = time.monotonic() + seconds
+        self.shares = dict(shares or DEFAULT_SHARES)
+
+    def remaining(self):
+        return self.expires - time.monotonic()
+
+    def until(self, stage):
+        """Absolute monotonic time by which `stage` must finish."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"question deadline passed before {stage}")
+        later = STAGES[STAGES.index(stage):]
+        fraction = self.shares[stage] / sum(self.shares[s] for s in later)
+        return time.monotonic() + remaining * fraction
+
+
+class Hedger:
+    """Sends a duplicate request when a call runs past its endpoint's p95."""
+
+    def __init__(self, max_workers, hedge_percentile=95, min_samples=20, history=500):
+        self.pool = ThreadPoolExecutor(max_workers=max(2, max_workers * 2),
+                                       thread_name_prefix="hedge")
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self.history = defaultdict(lambda: deque(maxlen=history))
+        self.actual = defaultdict(list)
+        self.unhedged = defaultdict(list)
+        self.fired = defaultdict(int)
+        self.won = defaultdict(int)
+
+    def _threshold(self, endpoint):
+        with self._lock:
+            samples = list(self.history[endpoint])
+        if len(samples) < self.min_samples:
+            return None
+        return percentile(samples, self.hedge_percentile)
+
+    def _record(self, endpoint, latency, unhedged=None):
+        with self._lock:
+            self.history[endpoint].append(latency)
+            self.actual[endpoint].append(latency)
+            if unhedged is not None:
+                self.unhedged[endpoint].append(unhedged)
+
+    def call(self, endpoint, fn, until=None):
+        """Run fn(), hedging it if it outlives the endpoint's p95 latency."""
+        started = time.monotonic()
+        threshold = self._threshold(endpoint)
+        if threshold is None:
+            result = fn()
+            latency = time.monotonic() - started
+            self._record(endpoint, latency, latency)
+            return result
+
+        primary = self.pool.submit(fn)
+        done, _ = wait([primary], timeout=self._limit(threshold, started, until))
+        if done:
+            latency = time.monotonic() - started
+            self._record(endpoint, latency, latency)
+            return primary.result()
+        if until is not None and time.monotonic() >= until:
+            primary.cancel()
+            raise DeadlineExceeded(f"{endpoint}: stage deadline passed")
+
+        hedge = self.pool.submit(fn)
+        with self._lock:
+            self.fired[endpoint] += 1
+        pending = {primary, hedge}
+        winner = None
+        while pending and winner is None:
+            done, pending = wait(pending, timeout=self._limit(None, started, until),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    winner = future
+                    break
+            if winner is None and not pending:
+                winner = done.pop()
+
+        for future in pending:
+            future.cancel()
+        if winner is None:
+            raise DeadlineExceeded(f"{endpoint}: stage deadline passed")
+
+        latency = time.monotonic() - started
+        if winner is hedge:
+            with self._lock:
+                self.won[endpoint] += 1
+                self.history[endpoint].append(latency)
+                self.actual[endpoint].append(latency)
+            primary.add_done_callback(
+                lambda f: self._record_unhedged(endpoint, time.monotonic() - started))
+        else:
+            self._record(endpoint, latency, latency)
+        return winner.result()
+
+    def _record_unhedged(self, endpoint, latency):
+        with self._lock:
+            self.unhedged[endpoint].append(latency)
+
+    @staticmethod
+    def _limit(threshold, started, until):
+        limits = []
+        if threshold is not None:
+            limits.append(threshold - (time.monotonic() - started))
+        if until is not None:
+            limits.append(until - time.monotonic())
+        return max(0.0, min(limits)) if limits else None
+
+    def stats(self):
+        out = {}
+        with self._lock:
+            for endpoint in set(self.actual) | set(self.fired):
+                p99 = percentile(self.actual[endpoint], 99)
+                p99_unhedged = percentile(self.unhedged[endpoint], 99)
+                out[endpoint] = {
+                    "calls": len(self.actual[endpoint]),
+                    "hedges_fired": self.fired[endpoint],
+                    "hedges_won": self.won[endpoint],
+                    "p99": p99,
+                    "p99_unhedged": p99_unhedged,
+                    "p99_saved": (p99_unhedged - p99) if p99 is not None and p99_unhedged is not None else None,
+                }
+        return out
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,120 @@
+"""
+Run metrics for the docs query tool.
+
+Stages are timed with `Metrics.timer(name)` and kept as raw samples so exact
+p50/p95/p99 can be reported at the end of a run; counters accumulate byte and
+token totals. A run is written out as JSON and as a Prometheus textfile
+(for node_exporter's textfile collector).
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+PROM_PREFIX = "cfdocs"
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _atomic_write(path, text):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+class Metrics:
+    """Thread-safe stage timers and counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.counters = defaultdict(float)
+        self.started = time.time()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def add(self, counter, value=1):
+        with self._lock:
+            self.counters[counter] += value
+
+    def stage_summary(self):
+        with self._lock:
+            samples = {stage: list(values) for stage, values in self.samples.items()}
+        summary = {}
+        for stage, values in samples.items():
+            summary[stage] = {
+                "count": len(values),
+                "total": sum(values),
+                "mean": sum(values) / len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": max(values),
+            }
+        return summary
+
+    def to_dict(self, extra=None):
+        with self._lock:
+            counters = dict(self.counters)
+        data = {
+            "started_at": self.started,
+            "wall_time": time.time() - self.started,
+            "stages": self.stage_summary(),
+            "counters": counters,
+        }
+        if extra:
+            data.update(extra)
+        return data
+
+    def write_json(self, path, extra=None):
+        _atomic_write(path, json.dumps(self.to_dict(extra), indent=2) + "\n")
+
+    def write_prometheus(self, path, extra=None):
+        """Write stage quantiles, counters and numeric `extra` values as a textfile."""
+        lines = [
+            f"# HELP {PROM_PREFIX}_stage_seconds Wall time per pipeline stage.",
+            f"# TYPE {PROM_PREFIX}_stage_seconds summary",
+        ]
+        for stage, s in sorted(self.stage_summary().items()):
+            for q in ("p50", "p95", "p99"):
+                quantile = int(q[1:]) / 100.0
+                lines.append(f'{PROM_PREFIX}_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {s[q]:.6f}')
+            lines.append(f'{PROM_PREFIX}_stage_seconds_sum{{stage="{stage}"}} {s["total"]:.6f}')
+            lines.append(f'{PROM_PREFIX}_stage_seconds_count{{stage="{stage}"}} {s["count"]}')
+
+        with self._lock:
+            counters = dict(self.counters)
+        for name, value in sorted(counters.items()):
+            lines.append(f"# TYPE {PROM_PREFIX}_{name}_total counter")
+            lines.append(f"{PROM_PREFIX}_{name}_total {value:g}")
+
+        for group, values in sorted((extra or {}).items()):
+            if not isinstance(values, dict):
+                continue
+            for name, value in sorted(values.items()):
+                if isinstance(value, (int, float)):
+                    lines.append(f"# TYPE {PROM_PREFIX}_{group}_{name} gauge")
+                    lines.append(f"{PROM_PREFIX}_{group}_{name} {value:g}")
+        _atomic_write(path, "\n".join(lines) + "\n")
@@ -0,0 +1,171 @@
+"""
+Compact prompt builder (--compact-prompt).
+
+The default prompt embeds a tree of every project file and JSON-escaped
+snippets, so its size grows with the repository. The compact layout keeps
+what is relevant to the question:
+
+- the folder tree is pruned to the ancestors of highlighted files; only
+  directories that directly contain a highlighted file list their files,
+  everything else is collapsed to a directory name and file count,
+- snippets are merged per file, exact duplicates dropped, and emitted as
+  plain fenced blocks instead of JSON strings,
+- the result is fitted to a token budget, first by dropping sibling files
+  from the tree, then by truncating the largest snippets.
+
+Token counts are estimated at four characters per token.
+"""
+
+import hashlib
+import json
+import os
+
+from .snippets import merge_ranges
+
+MIN_SNIPPET_LINES = 4
+
+
+def estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+
+def _files(n):
+    return f"{n} file" if n == 1 else f"{n} files"
+
+
+def _build_dirs(files):
+    """Map each directory to (files, subdirectories, recursive file count)."""
+    dirs = {"": {"files": [], "subdirs": set(), "count": 0}}
+    for path in files:
+        parts = path.split("/")
+        for depth in range(len(parts)):
+            d = "/".join(parts[:depth])
+            dirs.setdefault(d, {"files": [], "subdirs": set(), "count": 0})
+            dirs[d]["count"] += 1
+            if depth < len(parts) - 1:
+                dirs[d]["subdirs"].add("/".join(parts[:depth + 1]))
+        dirs["/".join(parts[:-1])]["files"].append(parts[-1])
+    return dirs
+
+
+def compact_tree(files, highlighted, siblings=True):
+    """Render a pruned plain-text tree; highlighted files are marked with '*'."""
+    dirs = _build_dirs(files)
+    open_dirs = {""}
+    parents = set()
+    for path in highlighted:
+        parts = path.split("/")
+        parents.add("/".join(parts[:-1]))
+        for depth in range(len(parts)):
+            open_dirs.add("/".join(parts[:depth]))
+
+    lines = ["./"]
+
+    def walk(d, indent):
+        entry = dirs.get(d)
+        if entry is None:
+            return
+        for sub in sorted(entry["subdirs"]):
+            name = sub.rsplit("/", 1)[-1]
+            if sub in open_dirs:
+                lines.append(f"{indent}{name}/")
+                walk(sub, indent + "  ")
+            else:
+                lines.append(f"{indent}{name}/ ({_files(dirs[sub]['count'])})")
+        files_here = sorted(entry["files"])
+        if d in parents:
+            for name in files_here:
+                path = f"{d}/{name}" if d else name
+                if path in highlighted:
+                    lines.append(f"{indent}* {name}")
+                elif siblings:
+                    lines.append(f"{indent}{name}")
+            hidden = 0 if siblings else len(files_here) - sum(
+                1 for name in files_here if (f"{d}/{name}" if d else name) in highlighted)
+            if hidden:
+                lines.append(f"{indent}({hidden} other {'file' if hidden == 1 else 'files'})")
+        elif files_here:
+            lines.append(f"{indent}({_files(len(files_here))})")
+
+    walk("", "  ")
+    return "\n".join(lines) + "\n"
+
+
+def read_snippets(files, reader):
+    """Merged, deduplicated snippets as dicts with path, range, relation and code."""
+    snippets = []
+    seen = {}
+    for f in merge_ranges(files):
+        try:
+            code = reader.read(f["file_path"], f["start_line"], f["end_line"])
+        except (OSError, UnicodeDecodeError):
+            continue
+        digest = hashlib.sha256(code.encode("utf-8")).hexdigest()
+        if digest in seen:
+            first = seen[digest]
+            if f["relation_to_question"] not in first["relation"]:
+                first["relation"] += "; " + f["relation_to_question"]
+            continue
+        snippet = {
+            "file_path": f["file_path"],
+            "start_line": f["start_line"],
+            "end_line": f["end_line"],
+            "relation": f["relation_to_question"],
+            "code": code,
+        }
+        seen[digest] = snippet
+        snippets.append(snippet)
+    return snippets
+
+
+def format_snippets(snippets):
+    blocks = []
+    for s in snippets:
+        header = f"--- {s['file_path']}:{s['start_line']}-{s['end_line']} ({s['relation']})"
+        blocks.append(f"{header}\n```\n{s['code'].rstrip()}\n```")
+    return "\n\n".join(blocks)
+
+
+def _truncate_largest(snippets):
+    """Halve the largest snippet (or drop it once it is tiny). False if none left."""
+    if not snippets:
+        return False
+    largest = max(snippets, key=lambda s: len(s["code"]))
+    lines = largest["code"].splitlines(keepends=True)
+    if len(lines) <= MIN_SNIPPET_LINES:
+        snippets.remove(largest)
+        return True
+    keep = len(lines) // 2
+    largest["code"] = "".join(lines[:keep]) + "... (truncated)\n"
+    largest["end_line"] = largest["start_line"] + keep - 1
+    return True
+
+
+def render_compact(header, footer, files, highlighted, snippets, token_budget):
+    """Assemble the compact prompt, shrinking it to fit token_budget if needed."""
+    def assemble(tree, snippet_text):
+        return (f"{header}\nRelevant Code Snippets:\n{snippet_text}\n\n"
+                f"Folder Structure (relevant files marked *):\n{tree}\n{footer}")
+
+    tree = compact_tree(files, highlighted)
+    content = assemble(tree, format_snippets(snippets))
+    if token_budget and estimate_tokens(content) > token_budget:
+        tree = compact_tree(files, highlighted, siblings=False)
+        content = assemble(tree, format_snippets(snippets))
+    while token_budget and estimate_tokens(content) > token_budget:
+        if not _truncate_largest(snippets):
+            break
+        content = assemble(tree, format_snippets(snippets))
+    return tree, content
+
+
+def legacy_prompt_size(files, snippets):
+    """Approximate length of the default prompt's tree and snippet sections."""
+    tree = sum(len(path) + 5 for path in files)
+    legacy_snippets = [{"file_path": s["file_path"], "code": s["code"], "relation": s["relation"]}
+                       for s in snippets]
+    return tree + len(json.dumps(legacy_snippets, indent=2))
+
+
+def normalize_highlights(files):
+    return {os.path.normpath(f["file_path"]) for f in files}
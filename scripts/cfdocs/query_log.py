@@ -0,0 +1,187 @@
+"""
+Append-only query log.
+
+Each entry is one JSON line appended and fsync'd on its own, so writing costs
+the same however long the log gets, and a crash can at worst leave a torn
+final line (trimmed the next time the log is opened). A sidecar SQLite index
+maps query hash and timestamp to byte offsets for lookups without scanning
+the file. The index is derived data: it is caught up from the log on open,
+so it can always be deleted and rebuilt.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    offset INTEGER PRIMARY KEY,
+    query_hash TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_query_hash ON entries (query_hash);
+CREATE INDEX IF NOT EXISTS entries_timestamp ON entries (timestamp);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+"""
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+class QueryLog:
+    """JSONL query log with a sidecar index by query hash and timestamp."""
+
+    def __init__(self, path, index_path, legacy_path=None):
+        self.path = str(path)
+        self._lock = threading.Lock()
+
+        migrate = legacy_path is not None and not os.path.exists(self.path) \
+            and os.path.exists(str(legacy_path))
+        self._trim_torn_tail()
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+        self._index = sqlite3.connect(str(index_path), check_same_thread=False)
+        self._index.executescript(INDEX_SCHEMA)
+        self._catch_up_index()
+
+        if migrate:
+            with open(str(legacy_path)) as f:
+                for entry in json.load(f):
+                    self.append(entry)
+
+    def _trim_torn_tail(self):
+        """Drop a partial last line left behind by an interrupted append."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            keep = 0
+            pos = size
+            while pos > 0:
+                step = min(4096, pos)
+                pos -= step
+                f.seek(pos)
+                chunk = f.read(step)
+                nl = chunk.rfind(b"\n")
+                if nl != -1:
+                    keep = pos + nl + 1
+                    break
+            f.truncate(keep)
+
+    def _indexed_until(self):
+        row = self._index.execute("SELECT value FROM meta WHERE key = 'indexed_until'").fetchone()
+        return row[0] if row else 0
+
+    def _catch_up_index(self):
+        """Index any lines appended since the index was last written."""
+        start = self._indexed_until()
+        if start > os.path.getsize(self.path):
+            # The log was replaced underneath the index; rebuild from scratch.
+            self._index.execute("DELETE FROM entries")
+            start = 0
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self._index_entry(offset, entry)
+                except ValueError:
+                    pass
+                offset += len(line)
+        self._set_indexed_until(offset)
+        self._index.commit()
+
+    def _index_entry(self, offset, entry):
+        self._index.execute(
+            "INSERT OR REPLACE INTO entries (offset, query_hash, timestamp) VALUES (?, ?, ?)",
+            (offset, query_hash(entry.get("query", "")), entry.get("timestamp", "")))
+
+    def _set_indexed_until(self, offset):
+        self._index.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('indexed_until', ?)", (offset,))
+
+    def append(self, entry):
+        """Append one entry durably; a timestamp is added if it has none."""
+        entry = dict(entry)
+        entry.setdefault("timestamp", datetime.now(timezone.utc).isoformat())
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        with self._lock:
+            offset = os.lseek(self._fd, 0, os.SEEK_END)
+            os.write(self._fd, line)
+            os.fsync(self._fd)
+            self._index_entry(offset, entry)
+            self._set_indexed_until(offset + len(line))
+            self._index.commit()
+        return entry
+
+    def _read_at(self, f, offset):
+        f.seek(offset)
+        return json.loads(f.readline())
+
+    def find(self, query=None, since=None, until=None):
+        """Return entries matching an exact query and/or an ISO timestamp range."""
+        clauses, params = [], []
+        if query is not None:
+            clauses.append("query_hash = ?")
+            params.append(query_hash(query))
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        sql = "SELECT offset FROM entries"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY offset"
+        with self._lock:
+            offsets = [row[0] for row in self._index.execute(sql, params)]
+        with open(self.path, "rb") as f:
+            return [self._read_at(f, offset) for offset in offsets]
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def export_json(self, out_path, resolve=None):
+        """Write the log in the legacy JSON array format; returns the entry count.
+
+        Entries written since results moved to the archive carry a result_id
+        instead of the legacy log_file path. `resolve(result_id)`, if given,
+        returns that result, which is exported inline under "result", so the
+        export stays a single file.
+        """
+        count = 0
+        tmp = f"{out_path}.tmp"
+        with open(tmp, "w") as out:
+            out.write("[")
+            for entry in self:
+                if resolve and "result_id" in entry:
+                    result = resolve(entry["result_id"])
+                    if result is not None:
+                        entry["result"] = result
+                out.write(",\n" if count else "\n")
+                out.write("  " + json.dumps(entry, indent=2).replace("\n", "\n  "))
+                count += 1
+            out.write("\n]\n" if count else "]\n")
+        os.replace(tmp, out_path)
+        return count
+
+    def close(self):
+        with self._lock:
+            os.close(self._fd)
+            self._index.close()
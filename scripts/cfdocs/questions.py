@@ -0,0 +1,118 @@
+"""
+Streaming question input and run checkpoints.
+
+Questions are read lazily from either a JSONL file (one question per line)
+or a JSON array that is parsed incrementally, so the first question starts
+before a large file has been read in full. A checkpoint file records the
+hash of every question whose result has been written; `--resume` skips
+those on the next run.
+"""
+
+import hashlib
+import json
+import os
+
+READ_CHUNK = 64 * 1024
+
+
+def question_key(q):
+    """Stable hash identifying a question in checkpoints."""
+    blob = json.dumps(q, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _iter_jsonl(f):
+    for lineno, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"line {lineno}: {e}") from e
+
+
+def _iter_json_array(f):
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(READ_CHUNK)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def skip(chars):
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill()
+
+    skip(" \t\r\n")
+    if pos >= len(buf) or buf[pos] != "[":
+        raise ValueError("expected a JSON array of questions")
+    pos += 1
+
+    while True:
+        skip(" \t\r\n,")
+        if pos >= len(buf):
+            raise ValueError("unterminated JSON array")
+        if buf[pos] == "]":
+            return
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise
+                fill()
+                continue
+            # A value ending exactly at the buffer edge may be cut short.
+            if end == len(buf) and not eof:
+                fill()
+                continue
+            break
+        pos = end
+        yield item
+
+
+def iter_questions(path):
+    """Yield questions from a .jsonl file or a JSON array file, one at a time."""
+    with open(path) as f:
+        if str(path).endswith(".jsonl"):
+            yield from _iter_jsonl(f)
+        else:
+            yield from _iter_json_array(f)
+
+
+class Checkpoint:
+    """Append-only record of completed question hashes."""
+
+    def __init__(self, path, resume=False):
+        self.path = str(path)
+        self.done = set()
+        if resume and os.path.exists(self.path):
+            with open(self.path) as f:
+                self.done = {line.strip() for line in f if line.strip()}
+        self._file = open(self.path, "a" if resume else "w")
+
+    def __contains__(self, key):
+        return key in self.done
+
+    def mark(self, keys):
+        """Record keys as done and flush them to disk."""
+        for key in keys:
+            self._file.write(key + "\n")
+            self.done.add(key)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,123 @@
+"""
+Client-side rate governor for the Worker AI and MCP endpoints.
+
+Each endpoint gets its own RateGovernor, so throttling on one never holds
+back the other. A governor combines:
+
+- token buckets for requests per minute and (estimated) tokens per minute,
+- an AIMD concurrency limit: +1/limit per healthy response, halved on a 429
+  or a response slower than the latency target (at most once per cooldown),
+- a shared pause honouring Retry-After, so every caller backs off together
+  instead of each discovering the 429 on its own.
+"""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` tokens per minute."""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        """Take `amount` tokens and return how long the caller must wait.
+
+        Reservations may overdraw the bucket; later callers then wait for the
+        debt to be refilled, which keeps the long-run rate at `per_minute`
+        even for requests bigger than the bucket.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class RateGovernor:
+    """Per-endpoint request/token budgets plus AIMD concurrency control."""
+
+    def __init__(self, name, max_concurrency, rpm=None, tpm=None, latency_target=None,
+                 min_concurrency=1, cooldown=2.0):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.latency_target = latency_target
+        self.min_limit = min_concurrency
+        self.max_limit = max(max_concurrency, min_concurrency)
+        self.limit = float(self.max_limit)
+        self.cooldown = cooldown
+
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+
+        self.throttled = 0
+        self.slow = 0
+        self.waited = 0.0
+        self.lowest_limit = self.limit
+
+    def acquire(self, tokens=0):
+        """Block until a request of `tokens` estimated tokens may be sent."""
+        start = time.monotonic()
+        wait = self.requests.reserve(1) if self.requests else 0.0
+        if self.tokens and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        if wait:
+            time.sleep(wait)
+
+        with self._cond:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    self._cond.wait(pause)
+                elif self.in_flight >= int(self.limit):
+                    self._cond.wait()
+                else:
+                    break
+            self.in_flight += 1
+            self.waited += time.monotonic() - start
+
+    def release(self, status=None, latency=None, retry_after=None):
+        """Report the outcome of a request sent after acquire()."""
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            throttled = status == 429
+            slow = self.latency_target is not None and latency is not None \
+                and latency > self.latency_target
+            if throttled:
+                self.throttled += 1
+            if slow:
+                self.slow += 1
+
+            if throttled or slow:
+                if now - self.last_decrease >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self.last_decrease = now
+                    self.lowest_limit = min(self.lowest_limit, self.limit)
+            elif status is not None and status < 500:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": round(self.limit, 2),
+                "lowest_limit": round(self.lowest_limit, 2),
+                "throttled": self.throttled,
+                "slow": self.slow,
+                "wait_seconds": round(self.waited, 3),
+            }
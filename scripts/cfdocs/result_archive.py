@@ -0,0 +1,159 @@
+"""
+Deduplicated, compressed archive of question results.
+
+Instead of one pretty-printed JSON file per question, each large part of a
+result (original question, prompt, both Worker responses, MCP response) is
+stored once as a zlib-compressed blob keyed by its SHA-256, and a small
+result row references those blobs. Prompts and responses that repeat across
+questions are therefore stored only once. Rows are written in batched
+transactions and indexed by query hash and creation time. Reads may come from
+worker threads (--similar-threshold), so the connection is shared under a lock.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import uuid
+import zlib
+from datetime import date as Date, datetime, timedelta, timezone
+
+BLOB_FIELDS = ("original", "prompt", "worker_first", "mcp_response", "worker_second")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    id TEXT PRIMARY KEY,
+    query_hash TEXT NOT NULL,
+    query TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_query_hash ON results (query_hash);
+CREATE INDEX IF NOT EXISTS results_created_at ON results (created_at);
+"""
+
+
+def _hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultArchive:
+    """SQLite result store with content-addressed, compressed blobs."""
+
+    def __init__(self, path, batch_size=20):
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._blobs = {}
+        self._rows = []
+        self.blobs_written = 0
+        self.blobs_deduplicated = 0
+
+    def add(self, query, summary):
+        """Buffer a result and return its id; call flush() to persist it."""
+        record = {}
+        blobs = {}
+        for field, value in summary.items():
+            if field in BLOB_FIELDS:
+                data = json.dumps(value, sort_keys=True).encode("utf-8")
+                digest = _hash(data)
+                blobs[digest] = data
+                record[field] = {"blob": digest}
+            else:
+                record[field] = value
+        result_id = uuid.uuid4().hex
+        created_at = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            for digest, data in blobs.items():
+                self._blobs.setdefault(digest, data)
+            self._rows.append((result_id, _hash(query.encode("utf-8")), query, created_at,
+                               json.dumps(record)))
+        return result_id
+
+    @property
+    def pending(self):
+        return len(self._rows)
+
+    def flush(self):
+        """Write buffered results and any new blobs in one transaction."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        with self._conn:
+            for digest, data in self._blobs.items():
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO blobs (hash, size, data) VALUES (?, ?, ?)",
+                    (digest, len(data), zlib.compress(data, 6)))
+                if cur.rowcount:
+                    self.blobs_written += 1
+                else:
+                    self.blobs_deduplicated += 1
+            self._conn.executemany(
+                "INSERT INTO results (id, query_hash, query, created_at, record) VALUES (?, ?, ?, ?, ?)",
+                self._rows)
+        self._blobs.clear()
+        self._rows.clear()
+
+    def _blob(self, digest):
+        row = self._conn.execute("SELECT data FROM blobs WHERE hash = ?", (digest,)).fetchone()
+        return json.loads(zlib.decompress(row[0]))
+
+    def get(self, result_id):
+        """Return the full result for an id, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at, record FROM results WHERE id = ?", (result_id,)).fetchone()
+            if row is None:
+                return None
+            record = json.loads(row[1])
+            result = {"id": result_id, "created_at": row[0]}
+            for field, value in record.items():
+                if isinstance(value, dict) and set(value) == {"blob"}:
+                    value = self._blob(value["blob"])
+                result[field] = value
+        return result
+
+    def find(self, query=None, date=None):
+        """List (id, created_at, query) for an exact query and/or a YYYY-MM-DD date."""
+        clauses, params = [], []
+        if query is not None:
+            clauses.append("query_hash = ?")
+            params.append(_hash(query.encode("utf-8")))
+        if date is not None:
+            next_day = Date.fromisoformat(date) + timedelta(days=1)
+            clauses.append("created_at >= ? AND created_at < ?")
+            params.extend([date, next_day.isoformat()])
+        sql = "SELECT id, created_at, query FROM results"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created_at"
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def iter_results(self):
+        """Yield every stored result, oldest first."""
+        with self._lock:
+            ids = [row[0] for row in self._conn.execute("SELECT id FROM results ORDER BY created_at")]
+        for result_id in ids:
+            yield self.get(result_id)
+
+    def stats(self):
+        return {
+            "blobs_written": self.blobs_written,
+            "blobs_deduplicated": self.blobs_deduplicated,
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._conn.close()
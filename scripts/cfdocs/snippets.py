@@ -0,0 +1,114 @@
+"""
+Line-range reader for the code snippets embedded in prompts.
+
+Each file is memory-mapped once per run and a line-offset index is built the
+first time it is asked for, so later questions that cite the same file slice
+the mapping directly instead of re-reading and re-splitting it. Entries are
+rebuilt if the file's size or mtime changes during the run.
+"""
+
+import mmap
+import os
+import threading
+from array import array
+
+
+class LineIndexedFile:
+    """A memory-mapped file with the byte offset of every line start."""
+
+    def __init__(self, path):
+        st = os.stat(path)
+        self.signature = (st.st_size, st.st_mtime_ns)
+        with open(path, "rb") as f:
+            if st.st_size:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = b""
+
+        offsets = array("Q", [0])
+        find = self.data.find
+        pos = find(b"\n")
+        while pos != -1:
+            offsets.append(pos + 1)
+            pos = find(b"\n", pos + 1)
+        if offsets[-1] != len(self.data):
+            offsets.append(len(self.data))
+        self.offsets = offsets
+
+    @property
+    def line_count(self):
+        return len(self.offsets) - 1
+
+    def lines(self, start_line, end_line):
+        """Return lines start_line..end_line (1-based, inclusive) as text."""
+        start = min(max(start_line, 1) - 1, self.line_count)
+        end = min(max(end_line, start), self.line_count)
+        text = self.data[self.offsets[start]:self.offsets[end]].decode("utf-8")
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+def merge_ranges(files):
+    """Merge overlapping or adjacent ranges of the same file.
+
+    Files keep the order in which they are first mentioned; the relations of
+    merged ranges are joined with "; ".
+    """
+    by_path = {}
+    for f in files:
+        path = os.path.normpath(f["file_path"])
+        by_path.setdefault(path, []).append(f)
+
+    merged = []
+    for path, ranges in by_path.items():
+        ranges = sorted(ranges, key=lambda r: (r["start_line"], r["end_line"]))
+        current = None
+        for r in ranges:
+            if current and r["start_line"] <= current["end_line"] + 1:
+                current["end_line"] = max(current["end_line"], r["end_line"])
+                if r["relation_to_question"] not in current["relations"]:
+                    current["relations"].append(r["relation_to_question"])
+                continue
+            current = {
+                "file_path": r["file_path"],
+                "start_line": r["start_line"],
+                "end_line": r["end_line"],
+                "relations": [r["relation_to_question"]],
+            }
+            merged.append(current)
+
+    for m in merged:
+        m["relation_to_question"] = "; ".join(m.pop("relations"))
+    return merged
+
+
+class SnippetReader:
+    """Run-wide cache of LineIndexedFile objects, safe to share across threads."""
+
+    def __init__(self):
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def _get(self, path):
+        st = os.stat(path)
+        with self._lock:
+            cached = self._files.get(path)
+            if cached and cached.signature == (st.st_size, st.st_mtime_ns):
+                return cached
+            indexed = LineIndexedFile(path)
+            self._files[path] = indexed
+            return indexed
+
+    def read(self, path, start_line, end_line):
+        return self._get(os.path.normpath(path)).lines(start_line, end_line)
+
+    def close(self):
+        with self._lock:
+            for indexed in self._files.values():
+                indexed.close()
+            self._files.clear()
@@ -0,0 +1,75 @@
+"""
+Consumer for OpenAI-compatible server-sent-event chat completion streams.
+
+Tokens are handed to a callback as they arrive and the stream is assembled
+into the same shape as a non-streaming completion, so callers downstream of
+query_worker_ai do not need to know which mode was used. With
+stream_options.include_usage, servers send the token usage in one more chunk
+after the finish_reason, so the stream is read until that chunk arrives. It
+is closed as soon as both are in, without waiting for the trailing [DONE]
+event, so the next call can be dispatched immediately.
+"""
+
+import json
+import time
+
+
+def read_chat_stream(resp, started, on_token=None):
+    """Assemble a streamed chat completion.
+
+    `started` is the perf_counter() value taken just before the request was
+    sent; time-to-first-token and total generation time are measured from it
+    and returned under the "timing" key.
+    """
+    parts = []
+    role = "assistant"
+    finish_reason = None
+    usage = None
+    first_token = None
+    # text/event-stream is always UTF-8; without a charset in Content-Type,
+    # requests would decode it as ISO-8859-1.
+    resp.encoding = "utf-8"
+    try:
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            if chunk.get("usage"):
+                usage = chunk["usage"]
+            for choice in [] if finish_reason else chunk.get("choices", []):
+                delta = choice.get("delta") or {}
+                role = delta.get("role", role)
+                content = delta.get("content")
+                if content:
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                    parts.append(content)
+                    if on_token:
+                        on_token(content)
+                if choice.get("finish_reason"):
+                    finish_reason = choice["finish_reason"]
+            if finish_reason and usage is not None:
+                break
+    finally:
+        resp.close()
+
+    finished = time.perf_counter()
+    completion = {
+        "object": "chat.completion",
+        "choices": [{
+            "index": 0,
+            "message": {"role": role, "content": "".join(parts)},
+            "finish_reason": finish_reason,
+        }],
+        "timing": {
+            "time_to_first_token": None if first_token is None else first_token - started,
+            "total": finished - started,
+            "generation": None if first_token is None else finished - first_token,
+        },
+    }
+    if usage is not None:
+        completion["usage"] = usage
+    return completion
@@ -0,0 +1,166 @@
+"""
+Local stand-ins for the Worker AI and MCP endpoints, used for benchmarks.
+
+One threaded HTTP server answers both:
+
+- POST /v1/chat/completions returns an OpenAI-style chat completion, or an
+  SSE stream when the body asks for one. Batched rewrite prompts get one
+  "### Question <n>" section per question.
+- POST /mcp returns a JSON answer.
+
+Each endpoint has its own latency distribution (log-normal, given as a
+median and a sigma), error rate (errors alternate between 503 and 429 with
+Retry-After) and response size.
+"""
+
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUESTION_HEADING = re.compile(r"^### Question (\d+)$", re.MULTILINE)
+
+
+class EndpointProfile:
+    """Latency, error rate and response size of one stubbed endpoint."""
+
+    def __init__(self, median=0.05, sigma=0.5, error_rate=0.0, response_bytes=1000,
+                 retry_after=0.5):
+        self.median = median
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.response_bytes = response_bytes
+        self.retry_after = retry_after
+
+    def latency(self, rng):
+        if self.median <= 0:
+            return 0.0
+        return rng.lognormvariate(math.log(self.median), self.sigma)
+
+
+def _filler(size, seed):
+    words = ("cloudflare", "worker", "binding", "durable", "object", "namespace", "request",
+             "response", "configure", "deploy", "wrangler", "database", "cache", "route")
+    rng = random.Random(seed)
+    out = []
+    length = 0
+    while length < size:
+        word = rng.choice(words)
+        out.append(word)
+        length += len(word) + 1
+    return " ".join(out)[:size]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            body = {}
+        endpoint = "mcp" if self.path.startswith("/mcp") else "worker_ai"
+        profile = server.profiles[endpoint]
+        with server.lock:
+            server.requests[endpoint] += 1
+            delay = profile.latency(server.rng)
+            error = server.rng.random() < profile.error_rate
+        server.sleep(delay)
+
+        if error:
+            with server.lock:
+                server.errors[endpoint] += 1
+                status = 429 if server.errors[endpoint] % 2 else 503
+            headers = {"Retry-After": f"{profile.retry_after:g}"} if status == 429 else {}
+            self._send_json(status, {"error": "stubbed failure"}, headers)
+            return
+
+        if endpoint == "mcp":
+            self._send_json(200, {"answer": _filler(profile.response_bytes, length)})
+            return
+
+        messages = body.get("messages") or [{}]
+        last = messages[-1].get("content", "")
+        sections = QUESTION_HEADING.findall(last)
+        if len(sections) > 1:
+            size = max(1, profile.response_bytes // len(sections))
+            content = "\n\n".join(f"### Question {n}\n{_filler(size, n)}" for n in sections)
+        else:
+            content = _filler(profile.response_bytes, len(last))
+        usage = {"prompt_tokens": (length + 3) // 4, "completion_tokens": (len(content) + 3) // 4}
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage")
+            self._send_stream(content, usage if include_usage else None)
+            return
+        self._send_json(200, {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _send_stream(self, content, usage=None):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            chunk = {"choices": [{"index": 0, "delta": {"content": word + " "},
+                                  "finish_reason": "stop" if i == len(words) - 1 else None}]}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+        if usage:
+            self._write_chunk(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+
+class StubServer(ThreadingHTTPServer):
+    """Worker AI and MCP stand-ins on one local port; use as a context manager."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, worker_ai, mcp, port=0, seed=None, sleep=None):
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.profiles = {"worker_ai": worker_ai, "mcp": mcp}
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {"worker_ai": 0, "mcp": 0}
+        self.errors = {"worker_ai": 0, "mcp": 0}
+        self.sleep = sleep or time.sleep
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,180 @@
+"""
+Shared HTTP transport for the Worker AI and MCP endpoints.
+
+One requests.Session with a pooled adapter is reused for every call, so
+connections are kept alive across questions instead of paying a new TCP+TLS
+handshake per request. Each endpoint gets its own timeout, and 429/5xx
+responses or connection failures are retried with jittered exponential
+backoff (honouring Retry-After when the server sends it). Endpoints may also
+have a RateGovernor (see rate_limit.py) that every attempt passes through.
+"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DEFAULT_TIMEOUT = (10, 120)  # (connect, read) seconds
+
+
+class DeadlineExceeded(Exception):
+    """A call could not complete before its deadline."""
+
+
+class CountingAdapter(HTTPAdapter):
+    """HTTPAdapter that counts how many new connections its pools open."""
+
+    def __init__(self, *args, **kwargs):
+        self.new_connections = 0
+        self._lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def _count_new_connection(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            def _new_conn(pool):
+                adapter._count_new_connection()
+                return HTTPConnectionPool._new_conn(pool)
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            def _new_conn(pool):
+                adapter._count_new_connection()
+                return HTTPSConnectionPool._new_conn(pool)
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+
+def retry_after_seconds(resp):
+    """Return the Retry-After delay of a response in seconds, if it has one."""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class Transport:
+    """Pooled keep-alive HTTP client with per-endpoint timeouts and retries."""
+
+    def __init__(self, pool_size=10, timeouts=None, max_retries=4,
+                 backoff_base=0.5, backoff_cap=30.0, governors=None):
+        self.timeouts = dict(timeouts or {})
+        self.governors = dict(governors or {})
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self.adapter = CountingAdapter(pool_connections=4, pool_maxsize=max(pool_size, 1),
+                                       pool_block=False, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+        self._lock = threading.Lock()
+        self.requests_sent = 0
+        self.retries = 0
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff delay for the given attempt."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def _count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def _timeout(self, endpoint, deadline):
+        connect, read = self.timeouts.get(endpoint, DEFAULT_TIMEOUT)
+        if deadline is None:
+            return connect, read
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"{endpoint}: deadline passed")
+        return min(connect, remaining), min(read, remaining)
+
+    def post(self, endpoint, url, cost_tokens=0, deadline=None, **kwargs):
+        """POST to url, retrying 429/5xx and connection errors.
+
+        `endpoint` names the timeout and rate governor to use; `cost_tokens`
+        is the estimated token cost charged to the governor's token budget.
+        `deadline` is an optional time.monotonic() value: timeouts are capped
+        to it and no retry is started that would run past it. The final
+        response is returned whatever its status; the caller decides how to
+        handle a non-2xx that survived all retries.
+        """
+        governor = self.governors.get(endpoint)
+        attempt = 0
+        while True:
+            timeout = kwargs.get("timeout") or self._timeout(endpoint, deadline)
+            if governor:
+                governor.acquire(cost_tokens)
+            self._count("requests_sent")
+            started = time.monotonic()
+            try:
+                resp = self.session.post(url, **{**kwargs, "timeout": timeout})
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if governor:
+                    governor.release()
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise DeadlineExceeded(f"{endpoint}: deadline passed") from e
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt)
+            else:
+                retry_after = None
+                if resp.status_code in RETRY_STATUSES:
+                    retry_after = retry_after_seconds(resp)
+                if governor:
+                    governor.release(resp.status_code, time.monotonic() - started, retry_after)
+                if resp.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return resp
+                if deadline is not None and time.monotonic() + (retry_after or 0) >= deadline:
+                    return resp
+                if retry_after is None:
+                    delay = self.backoff(attempt)
+                elif governor:
+                    # The governor now holds every caller until Retry-After.
+                    delay = 0
+                else:
+                    delay = retry_after
+                resp.close()
+            if deadline is not None:
+                delay = min(delay, max(0.0, deadline - time.monotonic()))
+            self._count("retries")
+            attempt += 1
+            time.sleep(delay)
+
+    def stats(self):
+        """Connection reuse counters for the run summary."""
+        new = self.adapter.new_connections
+        return {
+            "requests": self.requests_sent,
+            "retries": self.retries,
+            "new_connections": new,
+            "reused_connections": max(0, self.requests_sent - new),
+        }
+
+    def governor_stats(self):
+        return {name: governor.stats() for name, governor in self.governors.items()}
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+D1 Workload Benchmark
+
+Predicts how the observability endpoints behave as the D1 tables grow.
+
+The migrations are applied to a local SQLite file (D1 is SQLite), which is
+then filled with synthetic requests in steps up to each scale. Each request
+has a trace, a child span about half the time, five trace events
+(trace_start, three steps, trace_end) and five log lines. Market snapshots
+are added at 1% of the log volume.
+
+At each scale:
+
+- every query shape that check_query_indexes.py finds in src/ and worker/ is
+  replayed with realistic parameters, reporting p50/p95/p99 latency, rows
+  returned and the query plan
+- the Logger's inserts into logs and trace_events are replayed one row per
+  statement (each its own transaction, as D1 commits every statement) and
+  in batches inside one transaction, reporting rows/sec and latency
+
+--extra-sql applies more statements after the migrations, e.g. the indexes
+from `check_query_indexes.py --sql`, so a schema change can be compared
+against the current one before it is deployed.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import datetime
+
+import d1_local
+from status import Colors, StatusLog
+from check_query_indexes import QueryIndexAdvisor, find_queries
+
+
+LEVELS = ('debug', 'info', 'warn', 'error')
+LEVEL_WEIGHTS = (40, 45, 10, 5)
+STATUSES = ('success', 'error', 'started')
+STATUS_WEIGHTS = (90, 5, 5)
+COMPONENTS = ('Worker', 'AdvisorAgent', 'MarketScanWorkflow', 'Logger', 'HealthMonitor', 'ChatRoute')
+TRACE_NAMES = ('chat_request', 'workflow_run', 'market_scan', 'health_check', 'logs_fetch')
+STEPS = ('start_fetch', 'start_parse', 'call_gemini', 'start_store', 'start_render')
+TOWNS = ('ANG MO KIO', 'BEDOK', 'BISHAN', 'BUKIT BATOK', 'CLEMENTI', 'HOUGANG', 'JURONG WEST',
+         'PUNGGOL', 'SENGKANG', 'TAMPINES', 'TOA PAYOH', 'WOODLANDS', 'YISHUN')
+FLAT_TYPES = ('2 ROOM', '3 ROOM', '4 ROOM', '5 ROOM', 'EXECUTIVE')
+EPOCH = datetime.datetime(2025, 1, 1)
+SAMPLE_SIZE = 1000
+LOAD_CHUNK = 5000
+
+
+def summarize(seconds):
+    values = sorted(seconds)
+    return {
+        'count': len(values),
+        'p50_ms': d1_local.percentile(values, 50) * 1000.0,
+        'p95_ms': d1_local.percentile(values, 95) * 1000.0,
+        'p99_ms': d1_local.percentile(values, 99) * 1000.0,
+        'max_ms': values[-1] * 1000.0,
+    }
+
+
+class TableLayout(object):
+    """Insertable columns of a migrated table, in declaration order."""
+
+    def __init__(self, conn, table):
+        self.table = table
+        self.columns = []
+        self.defaults = {}
+        for _, name, kind, notnull, _, pk in conn.execute('PRAGMA table_info("{}")'.format(table)):
+            if pk and kind.upper() == 'INTEGER':
+                continue  # rowid alias, assigned by SQLite
+            self.columns.append(name)
+            if notnull:
+                self.defaults[name] = 0 if 'INT' in kind.upper() else ''
+        self.sql = 'INSERT INTO "{}" ({}) VALUES ({})'.format(
+            table, ', '.join('"{}"'.format(c) for c in self.columns), ', '.join('?' * len(self.columns)))
+
+    def row(self, values):
+        return tuple(values.get(c, self.defaults.get(c)) for c in self.columns)
+
+
+class WorkloadData(object):
+    """Synthetic requests shaped like the Logger's writes."""
+
+    def __init__(self, conn, seed=0):
+        self.rng = random.Random(seed)
+        migrated = d1_local.tables(conn)
+        self.layouts = dict((t, TableLayout(conn, t)) for t in
+                            ('logs', 'traces', 'trace_events', 'market_snapshots') if t in migrated)
+        self.clock = 0.0
+        self.requests = 0
+        self.counts = dict((t, 0) for t in self.layouts)
+        self.samples = {'trace_id': [], 'id': []}
+
+    def _sample(self, key, value):
+        # Reservoir sample, so query parameters hit rows from the whole table.
+        pool = self.samples[key]
+        seen = self.requests + 1
+        if len(pool) < SAMPLE_SIZE:
+            pool.append(value)
+        else:
+            slot = self.rng.randrange(seen)
+            if slot < SAMPLE_SIZE:
+                pool[slot] = value
+
+    def _uuid(self):
+        return '%032x' % self.rng.getrandbits(128)
+
+    def _now(self):
+        self.clock += self.rng.expovariate(1.0 / 0.2)
+        stamp = EPOCH + datetime.timedelta(seconds=self.clock)
+        return stamp.strftime('%Y-%m-%dT%H:%M:%S.') + '%03dZ' % (stamp.microsecond // 1000)
+
+    def request(self):
+        """{table: [row dict, ...]} for one traced request."""
+        rng = self.rng
+        trace_id = '{}-{}'.format(rng.choice(TRACE_NAMES), self._uuid()[:12])
+        component = rng.choice(COMPONENTS)
+        status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+        rows = {'logs': [], 'traces': [], 'trace_events': []}
+
+        def event(level, action, message, data):
+            now = self._now()
+            rows['trace_events'].append({
+                'trace_id': trace_id, 'event_id': self._uuid(), 'timestamp': now, 'level': level,
+                'component': component, 'action': action, 'message': message,
+                'data': json.dumps(data), 'code_location': 'index.ts:{}'.format(rng.randint(1, 400)),
+                'created_at': now})
+
+        def log(level, message):
+            now = self._now()
+            rows['logs'].append({
+                'timestamp': now, 'level': level, 'component': component, 'message': message,
+                'trace_id': trace_id, 'user_id': 'user-{}'.format(rng.randint(1, 5000)),
+                'session_id': None, 'request_id': self._uuid()[:16],
+                'error': json.dumps({'name': 'Error', 'message': message}) if level == 'error' else None,
+                'metadata': json.dumps({'codeLocation': 'index.ts:{}'.format(rng.randint(1, 400))}),
+                'created_at': now})
+
+        start = self._now()
+        root = self._uuid()
+        event('info', 'trace_start', 'Started trace', {'name': trace_id})
+        log('debug', 'Request received')
+        total = 0
+        for step in rng.sample(STEPS, 3):
+            duration = int(rng.lognormvariate(4.5, 0.8))
+            total += duration
+            event('info', step, step.replace('_', ' '), {'duration': duration})
+            log(rng.choices(LEVELS, LEVEL_WEIGHTS)[0], '{} finished in {}ms'.format(step, duration))
+        end = self._now()
+        event('error' if status == 'error' else 'info', 'trace_end', 'Ended trace ({})'.format(status),
+              {'duration': total, 'status': status})
+        log('error' if status == 'error' else 'info', 'Request finished')
+
+        spans = [(root, None)]
+        if rng.random() < 0.5:
+            spans.append((self._uuid(), root))
+        for span_id, parent in spans:
+            rows['traces'].append({
+                'id': span_id, 'trace_id': trace_id, 'parent_id': parent, 'name': rng.choice(TRACE_NAMES),
+                'component': component, 'status': status, 'start_time': start,
+                'end_time': None if status == 'started' else end,
+                'duration': None if status == 'started' else total,
+                'metadata': json.dumps({'steps': 3}), 'created_at': start})
+            self._sample('id', span_id)
+        self._sample('trace_id', trace_id)
+
+        if rng.random() < 0.05:
+            price = rng.randint(250, 1400) * 1000
+            rows['market_snapshots'] = [{
+                'town': rng.choice(TOWNS), 'flat_type': rng.choice(FLAT_TYPES), 'price': price,
+                'yield': rng.randint(250, 600), 'yield_rate': rng.randint(250, 600), 'created_at': start}]
+        self.requests += 1
+        return rows
+
+    def populate(self, conn, target_logs):
+        """Add requests until `logs` holds `target_logs` rows; returns rows written."""
+        written = 0
+        while self.counts.get('logs', 0) < target_logs:
+            pending = dict((t, []) for t in self.layouts)
+            while len(pending.get('logs', ())) < LOAD_CHUNK and \
+                    self.counts.get('logs', 0) + len(pending.get('logs', ())) < target_logs:
+                for table, rows in self.request().items():
+                    if table in pending:
+                        layout = self.layouts[table]
+                        pending[table].extend(layout.row(r) for r in rows)
+            conn.execute('BEGIN')
+            for table, rows in pending.items():
+                if rows:
+                    conn.executemany(self.layouts[table].sql, rows)
+                    self.counts[table] += len(rows)
+                    written += len(rows)
+            conn.execute('COMMIT')
+        return written
+
+    def param(self, table, column, limit):
+        """A realistic value for one bound parameter."""
+        if column is None:
+            return limit
+        if column == 'level':
+            return self.rng.choices(LEVELS, LEVEL_WEIGHTS)[0]
+        if column == 'component':
+            return self.rng.choice(COMPONENTS)
+        if column == 'status':
+            return 'error'
+        if column == 'trace_id':
+            return self.rng.choice(self.samples['trace_id'])
+        if column == 'id':
+            if table == 'traces':
+                return self.rng.choice(self.samples['id'])
+            return self.rng.randint(1, max(1, self.counts.get(table, 1)))
+        return self._now()
+
+
+class WorkloadBenchmark(StatusLog):
+    """Grows a local D1 database and measures the app's queries at each scale."""
+
+    def __init__(self, project_root, db_path, args):
+        StatusLog.__init__(self)
+        self.project_root = project_root
+        self.db_path = db_path
+        self.args = args
+
+    def setup(self):
+        self.conn = sqlite3.connect(self.db_path, isolation_level=None)
+        migrations = self.args.migrations or d1_local.migrations_dir(self.project_root)
+        files = d1_local.apply_migrations(self.conn, migrations)
+        if not files:
+            raise SystemExit("No migrations found in {}".format(migrations))
+        self.log_success("Applied {} migration(s) to {}".format(len(files), self.db_path))
+        for path in self.args.extra_sql or []:
+            with open(path, 'r') as f:
+                for statement in d1_local.split_statements(f.read()):
+                    self.conn.executescript(statement)
+            self.log_success("Applied {}".format(path))
+
+        self.data = WorkloadData(self.conn, seed=self.args.seed)
+        schema = d1_local.load_schema(self.project_root)
+        self.advisor = QueryIndexAdvisor(self.project_root, migrations, schema=schema)
+        migrated = d1_local.tables(self.conn)
+        self.queries = []
+        for query in find_queries(self.project_root, schema):
+            if schema[query.variable]['table'] not in migrated:
+                self.log_warning("Skipping {}: table '{}' is not migrated".format(
+                    query.label(), schema[query.variable]['table']))
+                continue
+            sql, params = self.advisor.statement(query)
+            self.queries.append((query, schema[query.variable]['table'], sql, params))
+        self.log_info("Replaying {} query shapes from src/ and worker/".format(len(self.queries)))
+
+    def replay(self):
+        results = []
+        for query, table, sql, params in self.queries:
+            plan = [row[3] for row in self.conn.execute('EXPLAIN QUERY PLAN ' + sql, [None] * len(params))]
+            timings = []
+            rows = 0
+            for i in range(self.args.iterations + 1):
+                values = [self.data.param(table, column, self.args.limit) for column in params]
+                started = time.perf_counter()
+                fetched = self.conn.execute(sql, values).fetchall()
+                elapsed = time.perf_counter() - started
+                if i:  # the first run warms the page cache
+                    timings.append(elapsed)
+                    rows += len(fetched)
+            result = summarize(timings)
+            result.update({'query': query.label(), 'sql': sql, 'plan': plan,
+                           'rows_per_call': rows / float(self.args.iterations)})
+            results.append(result)
+        return results
+
+    def inserts(self):
+        results = []
+        count = self.args.insert_rows
+        for table in ('logs', 'trace_events'):
+            layout = self.data.layouts.get(table)
+            if not layout:
+                continue
+            rows = []
+            while len(rows) < 2 * count:
+                rows.extend(layout.row(r) for r in self.data.request()[table])
+            single, batched = rows[:count], rows[count:2 * count]
+
+            timings = []
+            started = time.perf_counter()
+            for row in single:
+                t = time.perf_counter()
+                self.conn.execute(layout.sql, row)
+                timings.append(time.perf_counter() - t)
+            wall = time.perf_counter() - started
+            result = summarize(timings)
+            result.update({'table': table, 'mode': 'per-row', 'rows': count, 'rows_per_second': count / wall})
+            results.append(result)
+
+            timings = []
+            size = self.args.batch_size
+            started = time.perf_counter()
+            for i in range(0, count, size):
+                t = time.perf_counter()
+                self.conn.execute('BEGIN')
+                self.conn.executemany(layout.sql, batched[i:i + size])
+                self.conn.execute('COMMIT')
+                timings.append(time.perf_counter() - t)
+            wall = time.perf_counter() - started
+            result = summarize(timings)
+            result.update({'table': table, 'mode': 'batch of {}'.format(size), 'rows': count,
+                           'rows_per_second': count / wall})
+            results.append(result)
+            self.data.counts[table] += 2 * count
+        return results
+
+    def run(self, scales):
+        self.setup()
+        results = []
+        for scale in scales:
+            started = time.perf_counter()
+            written = self.data.populate(self.conn, scale)
+            load = time.perf_counter() - started
+            self.conn.execute('ANALYZE')
+            counts = dict((t, self.conn.execute('SELECT count(*) FROM "{}"'.format(t)).fetchone()[0])
+                          for t in self.data.layouts)
+            self.log_info("Scale {}: loaded {} rows in {:.1f}s ({:.0f} rows/s); {}".format(
+                scale, written, load, written / load if load else 0,
+                ', '.join('{}={}'.format(t, n) for t, n in sorted(counts.items()))))
+            result = {'scale': scale, 'rows': counts, 'load_seconds': load,
+                      'db_bytes': os.path.getsize(self.db_path),
+                      'queries': self.replay(), 'inserts': self.inserts()}
+            print_scale(result)
+            results.append(result)
+        self.conn.close()
+        return results
+
+
+def print_scale(result):
+    print("\n{}Queries at {} log rows{}".format(Colors.BLUE, result['scale'], Colors.NC))
+    print("  {:<52} {:>9} {:>9} {:>9} {:>8}  {}".format('query', 'p50 ms', 'p95 ms', 'p99 ms', 'rows', 'plan'))
+    for q in result['queries']:
+        print("  {:<52} {:>9.3f} {:>9.3f} {:>9.3f} {:>8.1f}  {}".format(
+            q['query'][:52], q['p50_ms'], q['p95_ms'], q['p99_ms'], q['rows_per_call'], ' | '.join(q['plan'])))
+    print("\n{}Inserts{}".format(Colors.BLUE, Colors.NC))
+    print("  {:<14} {:<14} {:>10} {:>9} {:>9}".format('table', 'mode', 'rows/s', 'p50 ms', 'p95 ms'))
+    for i in result['inserts']:
+        print("  {:<14} {:<14} {:>10.0f} {:>9.3f} {:>9.3f}".format(
+            i['table'], i['mode'], i['rows_per_second'], i['p50_ms'], i['p95_ms']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app's D1 queries and inserts on a local "
+                                                 "SQLite copy of the migrated schema")
+    parser.add_argument("--project-root", default=".", help="Project root (default: .)")
+    parser.add_argument("--migrations", help="Migrations folder (default: drizzle.config.ts `out`)")
+    parser.add_argument("--scales", default="10000,100000,1000000",
+                        help="Comma-separated log row counts to measure at (default: 10000,100000,1000000)")
+    parser.add_argument("--extra-sql", action="append",
+                        help="SQL file applied after the migrations, e.g. proposed indexes (repeatable)")
+    parser.add_argument("--iterations", type=int, default=50, help="Runs per query shape (default: 50)")
+    parser.add_argument("--limit", type=int, default=100, help="Value bound to LIMIT (default: 100)")
+    parser.add_argument("--insert-rows", type=int, default=1000,
+                        help="Rows inserted per table and mode at each scale (default: 1000)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Rows per batched insert (default: 100)")
+    parser.add_argument("--db", help="SQLite file to build (default: a temporary file)")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary database")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--json", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    scales = sorted(int(s) for s in args.scales.split(',') if s.strip())
+    if not scales or scales[0] <= 0:
+        parser.error("--scales needs positive row counts")
+    if args.db and os.path.exists(args.db):
+        parser.error("{} already exists; the benchmark builds a fresh database".format(args.db))
+
+    workdir = None
+    db_path = args.db
+    if not db_path:
+        workdir = tempfile.mkdtemp(prefix='d1-bench-')
+        db_path = os.path.join(workdir, 'd1.sqlite')
+
+    print("\n{}D1 Workload Benchmark{}".format(Colors.BLUE, Colors.NC))
+    print("=" * 50)
+    bench = WorkloadBenchmark(os.path.abspath(args.project_root), db_path, args)
+    try:
+        results = bench.run(scales)
+    finally:
+        if workdir and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+        bench.log_info("Wrote {}".format(args.json))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
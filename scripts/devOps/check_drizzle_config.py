@@ -4,13 +4,36 @@
 Drizzle Configuration Validation Script
 
 Checks that all Drizzle-related configuration is properly set up for D1 database usage.
-Supports both wrangler.toml and wrangler.jsonc configuration formats.
+Supports both wrangler.toml and wrangler.jsonc configuration formats. Config files
+are parsed through project_model, so each one is read once per run.
+
+Check results are cached in <project>/.drizzle-check-cache.json, keyed on a
+content hash of the files each check reads (and of this script), so unchanged
+checks replay their recorded output instead of running again. --watch stays
+resident and re-validates whenever one of those files changes.
+
+--projects-root / --manifest validate many projects in parallel on a process
+pool and print one aggregated report (table, and JSON with --json).
 """
 
 import os
 import sys
+import time
 import json
-import re
+import hashlib
+import argparse
+
+try:
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+except ImportError:
+    ProcessPoolExecutor = None
+try:
+    from io import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+import project_model
+from status import Colors, StatusLog, Symbols
 
 try:
     from pathlib import Path
@@ -53,50 +76,138 @@ except ImportError:
     Any = object
 
 
-class Colors:
-    """ANSI color codes for terminal output."""
-    RED = '\033[0;31m'
-    GREEN = '\033[0;32m'
-    YELLOW = '\033[1;33m'
-    BLUE = '\033[0;34m'
-    NC = '\033[0m'  # No Color
+CACHE_VERSION = 1
+CACHE_FILE = ".drizzle-check-cache.json"
+WRANGLER_FILES = ("wrangler.jsonc", "wrangler.toml")
+CODE_FILES = (os.path.abspath(__file__), os.path.abspath(project_model.__file__))
 
+_FINGERPRINTS = {}
 
-class Symbols:
-    """Symbols for status indicators."""
-    SUCCESS = '+'
-    ERROR = 'x'
-    WARNING = '!'
-    INFO = 'i'
 
+def fingerprint(path):
+    """Content hash of a file, "dir" for a directory or "missing".
 
-class DrizzleValidator:
-    """Validates Drizzle configuration for Cloudflare D1."""
+    Hashes are reused while a file's mtime and size are unchanged.
+    """
+    path = str(path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "missing"
+    if os.path.isdir(path):
+        return "dir"
+    stamp = (st.st_mtime, st.st_size)
+    cached = _FINGERPRINTS.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    _FINGERPRINTS[path] = (stamp, digest)
+    return digest
 
-    def __init__(self, project_root):
-        self.project_root = project_root
-        self.errors = []
-        self.warnings = []
-        self.successes = []
 
-    def log_success(self, message):
-        """Log a successful check."""
-        print("{}{}{} {}".format(Colors.GREEN, Symbols.SUCCESS, Colors.NC, message))
-        self.successes.append(message)
+class CheckCache(object):
+    """Check results and their log records, keyed by a hash of the check's inputs."""
 
-    def log_error(self, message):
-        """Log an error."""
-        print("{}{}{} {}".format(Colors.RED, Symbols.ERROR, Colors.NC, message))
-        self.errors.append(message)
+    def __init__(self, path):
+        self.path = str(path)
+        self.entries = {}
+        self.dirty = False
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == CACHE_VERSION:
+                self.entries = data.get('checks', {})
+        except (IOError, OSError, ValueError):
+            pass
+
+    @staticmethod
+    def key(name, paths):
+        h = hashlib.sha256()
+        h.update(name.encode('utf-8'))
+        for path in sorted(set(str(p) for p in paths)):
+            h.update('\0{}={}'.format(path, fingerprint(path)).encode('utf-8'))
+        return h.hexdigest()
+
+    def get(self, name, key):
+        entry = self.entries.get(name)
+        if entry and entry.get('key') == key:
+            return entry
+        return None
+
+    def put(self, name, key, passed, records):
+        self.entries[name] = {'key': key, 'passed': bool(passed), 'records': records}
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump({'version': CACHE_VERSION, 'checks': self.entries}, f)
+            getattr(os, 'replace', os.rename)(tmp, self.path)
+        except (IOError, OSError):
+            return
+        self.dirty = False
 
-    def log_warning(self, message):
-        """Log a warning."""
-        print("{}{}{} {}".format(Colors.YELLOW, Symbols.WARNING, Colors.NC, message))
-        self.warnings.append(message)
 
-    def log_info(self, message):
-        """Log informational message."""
-        print("{}{}{} {}".format(Colors.BLUE, Symbols.INFO, Colors.NC, message))
+class DrizzleValidator(StatusLog):
+    """Validates Drizzle configuration for Cloudflare D1."""
+
+    def __init__(self, project_root, use_cache=False):
+        StatusLog.__init__(self)
+        self.project_root = project_root
+        self.model = project_model.ProjectModel(project_root)
+        self.cache = CheckCache(project_root / CACHE_FILE) if use_cache else None
+        self.checks_run = 0
+        self.checks_cached = 0
+        self._records = None
+
+    def _record(self, level, message):
+        if self._records is not None:
+            self._records.append([level, message])
+
+    def check_inputs(self):
+        """Files each check reads, relative to the project root."""
+        try:
+            drizzle = self.model.drizzle() or {}
+        except Exception:
+            drizzle = {}
+        schema, out, wrangler_path = [drizzle.get(name) for name in ('schema', 'out', 'wranglerConfigPath')]
+        inputs = {
+            'check_drizzle_config': ['drizzle.config.ts', schema, out],
+            'check_wrangler_config': list(WRANGLER_FILES),
+            'check_config_alignment': ['drizzle.config.ts', wrangler_path] + list(WRANGLER_FILES),
+            'check_dependencies': ['package.json', os.path.join('node_modules', 'drizzle-kit', 'package.json')],
+            'check_package_scripts': ['package.json'],
+        }
+        for name, paths in inputs.items():
+            inputs[name] = [str(self.project_root / p) for p in paths if p] + list(CODE_FILES)
+        return inputs
+
+    def run_check(self, name, *args):
+        """Run a check method, or replay its cached output if its inputs are unchanged."""
+        if self.cache is None:
+            self.checks_run += 1
+            return getattr(self, name)(*args)
+
+        key = CheckCache.key(name, self._inputs[name])
+        entry = self.cache.get(name, key)
+        if entry is not None:
+            self.checks_cached += 1
+            for level, message in entry['records']:
+                getattr(self, 'log_' + level)(message)
+            return entry['passed']
+
+        self.checks_run += 1
+        self._records = []
+        try:
+            passed = getattr(self, name)(*args)
+        finally:
+            records, self._records = self._records, None
+        self.cache.put(name, key, passed, records)
+        return passed
 
     def check_file_exists(self, file_path, description):
         """Check if a file exists and is readable."""
@@ -119,116 +230,17 @@ class DrizzleValidator:
         return True
 
     def parse_drizzle_config(self, config_path):
-        """Parse drizzle.config.ts file."""
+        """Parse drizzle.config.ts file (memoized in project_model)."""
         try:
-            with open(str(config_path), 'r') as f:
-                content = f.read()
-
-            config = {}
-
-            # Extract schema path
-            schema_match = re.search(r"schema:\s*['\"]([^'\"]+)['\"]", content)
-            if schema_match:
-                config['schema'] = schema_match.group(1)
-
-            # Extract out path
-            out_match = re.search(r"out:\s*['\"]([^'\"]+)['\"]", content)
-            if out_match:
-                config['out'] = out_match.group(1)
-
-            # Extract dialect
-            dialect_match = re.search(r"dialect:\s*['\"]([^'\"]+)['\"]", content)
-            if dialect_match:
-                config['dialect'] = dialect_match.group(1)
-
-            # Extract driver
-            driver_match = re.search(r"driver:\s*['\"]([^'\"]+)['\"]", content)
-            if driver_match:
-                config['driver'] = driver_match.group(1)
-
-            # Extract dbCredentials
-            db_creds_match = re.search(r"dbCredentials:\s*\{([^}]+)\}", content, re.DOTALL)
-            if db_creds_match:
-                creds_content = db_creds_match.group(1)
-                db_name_match = re.search(r"dbName:\s*['\"]([^'\"]+)['\"]", creds_content)
-                if db_name_match:
-                    config['dbName'] = db_name_match.group(1)
-
-                wrangler_path_match = re.search(r"wranglerConfigPath:\s*['\"]([^'\"]+)['\"]", creds_content)
-                if wrangler_path_match:
-                    config['wranglerConfigPath'] = wrangler_path_match.group(1)
-
-            return config
-
+            return project_model.load_file(config_path, project_model.parse_drizzle_config)
         except Exception as e:
             self.log_error("Failed to parse drizzle.config.ts: {}".format(e))
             return None
 
     def parse_wrangler_config(self, config_path):
-        """Parse wrangler.toml or wrangler.jsonc file."""
+        """Parse wrangler.toml or wrangler.jsonc file (memoized in project_model)."""
         try:
-            with open(str(config_path), 'r') as f:
-                content = f.read()
-
-            if config_path.suffix == '.jsonc':
-                # Remove comments for JSONC
-                content = re.sub(r"//.*$|/\*[\s\S]*?\*/", "", content, flags=re.MULTILINE)
-                return json.loads(content)
-            else:
-                # Basic TOML-like parsing (simplified)
-                config = {}
-                current_section = None
-                array_section = None
-
-                for line in content.split('\n'):
-                    line = line.strip()
-                    if not line or line.startswith('#'):
-                        continue
-
-                    # Section headers
-                    if line.startswith('['):
-                        if line.startswith('[['):
-                            # Array section
-                            section_name = line[2:-2]
-                            if section_name not in config:
-                                config[section_name] = []
-                            array_section = section_name
-                            current_section = None
-                        else:
-                            # Regular section
-                            section_name = line[1:-1]
-                            config[section_name] = {}
-                            current_section = section_name
-                            array_section = None
-                        continue
-
-                    # Key-value pairs
-                    if '=' in line:
-                        key, value = line.split('=', 1)
-                        key = key.strip()
-                        value = value.strip()
-
-                        # Remove quotes
-                        if value.startswith('"') and value.endswith('"'):
-                            value = value[1:-1]
-                        elif value.startswith("'") and value.endswith("'"):
-                            value = value[1:-1]
-
-                        # Parse arrays
-                        if value.startswith('[') and value.endswith(']'):
-                            value = [item.strip().strip('"').strip("'") for item in value[1:-1].split(',') if item.strip()]
-
-                        if array_section:
-                            if not config[array_section]:
-                                config[array_section].append({})
-                            config[array_section][-1][key] = value
-                        elif current_section:
-                            config[current_section][key] = value
-                        else:
-                            config[key] = value
-
-                return config
-
+            return project_model.load_file(config_path, project_model.wrangler_parser(config_path))
         except Exception as e:
             self.log_error("Failed to parse wrangler config: {}".format(e))
             return None
@@ -416,8 +428,7 @@ class DrizzleValidator:
             return False
 
         try:
-            with open(str(package_json), 'r') as f:
-                package_data = json.load(f)
+            package_data = self.model.package_json()
 
             # Check for drizzle-kit
             if 'drizzle-kit' in package_data.get('devDependencies', {}):
@@ -454,8 +465,7 @@ class DrizzleValidator:
             return False
 
         try:
-            with open(str(package_json), 'r') as f:
-                package_data = json.load(f)
+            package_data = self.model.package_json()
 
             scripts = package_data.get('scripts', {})
 
@@ -479,6 +489,14 @@ class DrizzleValidator:
 
     def validate(self):
         """Run all validation checks."""
+        self.errors = []
+        self.warnings = []
+        self.successes = []
+        self.checks_run = 0
+        self.checks_cached = 0
+        if self.cache is not None:
+            self._inputs = self.check_inputs()
+
         print("{}{}{}".format(Colors.BLUE, '=' * 80, Colors.NC))
         print("{}{}  Drizzle Configuration Validation{}".format(Colors.BLUE, ' ' * 20, Colors.NC))
         print("{}{}{}".format(Colors.BLUE, '=' * 80, Colors.NC))
@@ -511,15 +529,17 @@ class DrizzleValidator:
 
         # Run checks
         checks_passed = True
-        checks_passed &= self.check_drizzle_config()
+        checks_passed &= self.run_check('check_drizzle_config')
         print()
-        checks_passed &= self.check_wrangler_config()
+        checks_passed &= self.run_check('check_wrangler_config')
         print()
-        checks_passed &= self.check_config_alignment(drizzle_config, wrangler_config)
+        checks_passed &= self.run_check('check_config_alignment', drizzle_config, wrangler_config)
         print()
-        checks_passed &= self.check_dependencies()
+        checks_passed &= self.run_check('check_dependencies')
         print()
-        checks_passed &= self.check_package_scripts()
+        checks_passed &= self.run_check('check_package_scripts')
+        if self.cache is not None:
+            self.cache.save()
 
         # Summary
         print()
@@ -545,12 +565,208 @@ class DrizzleValidator:
             return False
 
 
+def watch(validator, interval):
+    """Re-validate whenever a file read by any check changes; runs until interrupted."""
+    def snapshot():
+        paths = set()
+        for inputs in validator.check_inputs().values():
+            paths.update(inputs)
+        stamps = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+                stamps[path] = (st.st_mtime, st.st_size)
+            except OSError:
+                stamps[path] = None
+        return stamps
+
+    def run():
+        start = time.time()
+        validator.validate()
+        print("{}{}{} {} check(s) run, {} replayed from cache in {:.1f} ms".format(
+            Colors.BLUE, Symbols.INFO, Colors.NC, validator.checks_run, validator.checks_cached,
+            (time.time() - start) * 1000))
+
+    run()
+    last = snapshot()
+    print("{}{}{} Watching for changes (Ctrl+C to stop)...".format(Colors.BLUE, Symbols.INFO, Colors.NC))
+    try:
+        while True:
+            time.sleep(interval)
+            current = snapshot()
+            if current != last:
+                changed = sorted(p for p in set(current) | set(last) if current.get(p) != last.get(p))
+                print()
+                print("{}{}{} Changed: {}".format(Colors.BLUE, Symbols.INFO, Colors.NC,
+                                                  ", ".join(os.path.relpath(p, str(validator.project_root))
+                                                            for p in changed)))
+                run()
+                last = snapshot()
+    except KeyboardInterrupt:
+        print()
+
+
+SKIP_DIRS = set(['node_modules', '.git', '.wrangler', 'dist', 'build', '.venv', 'venv', '__pycache__'])
+
+
+def find_projects(root):
+    """Directories under root that contain a drizzle.config.ts."""
+    projects = []
+    for dirpath, dirnames, filenames in os.walk(str(root)):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS)
+        if 'drizzle.config.ts' in filenames:
+            projects.append(dirpath)
+    return projects
+
+
+def read_manifest(path):
+    """Project paths from a JSON list or a text file with one path per line.
+
+    Relative paths are resolved against the manifest's directory.
+    """
+    with open(str(path), 'r') as f:
+        content = f.read()
+    try:
+        entries = json.loads(content)
+    except ValueError:
+        entries = [line.strip() for line in content.splitlines()
+                   if line.strip() and not line.strip().startswith('#')]
+    base = os.path.dirname(os.path.abspath(str(path)))
+    return [os.path.normpath(os.path.join(base, entry)) for entry in entries]
+
+
+def validate_project(project_root, use_cache=True):
+    """Validate one project with its output captured; runs in a worker process."""
+    start = time.time()
+    captured = StringIO()
+    stdout = sys.stdout
+    sys.stdout = captured
+    try:
+        validator = DrizzleValidator(Path(project_root), use_cache=use_cache)
+        try:
+            passed = validator.validate()
+        except Exception as e:
+            validator.log_error("Validation crashed: {}".format(e))
+            passed = False
+    finally:
+        sys.stdout = stdout
+    return {
+        'project': str(project_root),
+        'passed': bool(passed),
+        'errors': validator.errors,
+        'warnings': validator.warnings,
+        'successes': len(validator.successes),
+        'checks_run': validator.checks_run,
+        'checks_cached': validator.checks_cached,
+        'seconds': time.time() - start,
+        'output': captured.getvalue(),
+    }
+
+
+def validate_projects(projects, jobs, use_cache=True):
+    """Validate projects on a process pool; results are sorted by project path."""
+    if jobs <= 1 or ProcessPoolExecutor is None:
+        return [validate_project(p, use_cache) for p in projects]
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(validate_project, p, use_cache) for p in projects]
+        for future in as_completed(futures):
+            results.append(future.result())
+    return sorted(results, key=lambda r: r['project'])
+
+
+def print_fleet_report(results, root, wall, jobs):
+    width = max([len('project')] + [len(os.path.relpath(r['project'], root)) for r in results])
+    header = "{:<{w}}  {:<6}  {:>6}  {:>8}  {:>6}  {:>9}".format(
+        'project', 'status', 'errors', 'warnings', 'cached', 'time (ms)', w=width)
+    print("{}{}{}".format(Colors.BLUE, header, Colors.NC))
+    print('-' * len(header))
+    for r in results:
+        color = Colors.GREEN if r['passed'] else Colors.RED
+        print("{:<{w}}  {}{:<6}{}  {:>6}  {:>8}  {:>6}  {:>9.1f}".format(
+            os.path.relpath(r['project'], root), color, 'ok' if r['passed'] else 'FAIL', Colors.NC,
+            len(r['errors']), len(r['warnings']),
+            "{}/{}".format(r['checks_cached'], r['checks_cached'] + r['checks_run']),
+            r['seconds'] * 1000, w=width))
+    failed = [r for r in results if not r['passed']]
+    print()
+    print("{}{}{} {} project(s) validated in {:.2f}s with {} worker(s); {} failed".format(
+        Colors.BLUE, Symbols.INFO, Colors.NC, len(results), wall, jobs, len(failed)))
+    for r in failed:
+        for error in r['errors']:
+            print("{}{}{} {}: {}".format(Colors.RED, Symbols.ERROR, Colors.NC,
+                                         os.path.relpath(r['project'], root), error))
+
+
+def run_fleet(args, parser):
+    if args.manifest:
+        projects = read_manifest(args.manifest)
+        root = os.path.dirname(os.path.abspath(args.manifest))
+    else:
+        root = os.path.abspath(args.projects_root)
+        projects = find_projects(root)
+    if not projects:
+        parser.error("no projects found")
+
+    jobs = args.jobs or os.cpu_count() or 1
+    start = time.time()
+    results = validate_projects(projects, min(jobs, len(projects)), use_cache=not args.no_cache)
+    wall = time.time() - start
+
+    if args.verbose:
+        for r in results:
+            print("{}== {} =={}".format(Colors.BLUE, r['project'], Colors.NC))
+            print(r['output'])
+    print_fleet_report(results, root, wall, min(jobs, len(projects)))
+
+    if args.json:
+        report = {
+            'root': root,
+            'jobs': min(jobs, len(projects)),
+            'wall_seconds': wall,
+            'passed': all(r['passed'] for r in results),
+            'projects': [dict((k, v) for k, v in r.items() if k != 'output') for r in results],
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print("{}{}{} JSON report written to {}".format(Colors.BLUE, Symbols.INFO, Colors.NC, args.json))
+    return all(r['passed'] for r in results)
+
+
 def main():
     """Main entry point."""
+    parser = argparse.ArgumentParser(description="Validate Drizzle configuration for Cloudflare D1.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Run every check instead of replaying unchanged results from {}".format(CACHE_FILE))
+    parser.add_argument("--watch", action="store_true",
+                        help="Stay running and re-validate when a checked file changes")
+    parser.add_argument("--interval", type=float, default=0.25,
+                        help="Polling interval in seconds for --watch (default: 0.25)")
+    fleet = parser.add_mutually_exclusive_group()
+    fleet.add_argument("--projects-root",
+                       help="Validate every project (directory with a drizzle.config.ts) under this directory")
+    fleet.add_argument("--manifest",
+                       help="Validate the projects listed in this file (JSON list or one path per line)")
+    parser.add_argument("--jobs", type=int, default=0,
+                        help="Worker processes for --projects-root/--manifest (default: CPU count)")
+    parser.add_argument("--json", help="Write the aggregated multi-project report to this JSON file")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Print each project's full output in multi-project mode")
+    args = parser.parse_args()
+
+    if args.projects_root or args.manifest:
+        if args.watch:
+            parser.error("--watch validates a single project")
+        sys.exit(0 if run_fleet(args, parser) else 1)
+
     script_dir = Path(__file__).parent
     project_root = script_dir.parent.parent
 
-    validator = DrizzleValidator(project_root)
+    validator = DrizzleValidator(project_root, use_cache=not args.no_cache)
+    if args.watch:
+        watch(validator, args.interval)
+        sys.exit(0)
+
     success = validator.validate()
 
     sys.exit(0 if success else 1)
@@ -0,0 +1,656 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+D1 Query Index Advisor
+
+Finds the Drizzle queries in src/ and worker/ that SQLite will answer with a
+full table scan or a temporary sort, and the indexes that fix them.
+
+1. The sqliteTable() definitions are read to map Drizzle names to SQL names
+   (traceEvents.traceId -> trace_events.trace_id).
+2. Each select/update/delete chain is reduced to its table, where() columns,
+   orderBy() columns and limit(). A chain assigned to a variable picks up the
+   later `query = query.where(...)` calls too; since Drizzle keeps only the
+   last where(), each of those becomes its own query shape.
+3. The migrations are applied to an in-memory SQLite database and every
+   shape is run through EXPLAIN QUERY PLAN. `SCAN <table>` with a filter or
+   sort, and `USE TEMP B-TREE`, are reported.
+4. For each finding an index is proposed (equality columns, then one range
+   column or the ORDER BY columns), created, and the plan re-checked. The
+   proposals are merged where one is a prefix of another. An existing
+   index whose columns lead a proposal is redundant next to it and is
+   suggested for removal. The final set is verified against every query
+   together, without the indexes it replaces.
+
+Tables or columns that the schema declares but no migration creates are
+reported as drift.
+"""
+
+import os
+import re
+import sys
+import json
+import sqlite3
+import argparse
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = dict
+
+import d1_local
+from status import Colors, StatusLog
+
+
+QUERY_DIRS = ('src', 'worker')
+
+_CALL_RE = re.compile(r"\.\s*(\w+)\s*\(")
+_ASSIGN_RE = re.compile(r"^(?:export\s+)?(?:let|const|var)\s+(\w+)\s*=")
+_CONDITION_RE = re.compile(r"\b(eq|ne|gt|gte|lt|lte|like|notLike|inArray|notInArray|isNull|isNotNull|between)"
+                           r"\(\s*(\w+)\.(\w+)")
+_BARE_WHERE_RE = re.compile(r"^\s*(\w+)\.(\w+)\s*,")
+_ORDER_RE = re.compile(r"(?:\b(asc|desc)\(\s*)?\b(\w+)\.(\w+)")
+
+OPERATORS = {
+    'eq': '= ?', 'ne': '<> ?', 'gt': '> ?', 'gte': '>= ?', 'lt': '< ?', 'lte': '<= ?',
+    'like': 'LIKE ?', 'notLike': 'NOT LIKE ?', 'inArray': 'IN (?, ?)', 'notInArray': 'NOT IN (?, ?)',
+    'isNull': 'IS NULL', 'isNotNull': 'IS NOT NULL', 'between': 'BETWEEN ? AND ?',
+}
+EQUALITY = ('eq', 'inArray', 'isNull')
+RANGE = ('gt', 'gte', 'lt', 'lte', 'between')
+
+
+# ---------------------------------------------------------------------------
+# Source scanning
+
+
+def _skip_string(text, i):
+    """Index just past the string literal starting at text[i]."""
+    quote = text[i]
+    i += 1
+    while i < len(text):
+        if text[i] == '\\':
+            i += 2
+            continue
+        if text[i] == quote:
+            return i + 1
+        i += 1
+    return i
+
+
+def _matching(text, start):
+    """Index of the bracket closing the one at text[start]."""
+    depth = 0
+    i = start
+    while i < len(text):
+        c = text[i]
+        if c in '\'"`':
+            i = _skip_string(text, i)
+            continue
+        if c in '([{':
+            depth += 1
+        elif c in ')]}':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return len(text) - 1
+
+
+def _statement_bounds(text, pos):
+    """(start, end) of the statement containing text[pos].
+
+    Works with and without semicolons: a line break only ends a statement
+    when the next line does not continue the chain with `.`.
+    """
+    depth = 0
+    start = pos
+    while start > 0:
+        c = text[start - 1]
+        if c in ')]}':
+            if c == '}' and depth == 0:
+                break
+            depth += 1
+        elif c in '([{':
+            if depth == 0:
+                break
+            depth -= 1
+        elif c == ';' and depth == 0:
+            break
+        elif c == '\n' and depth == 0 and not text[start:].lstrip(' \t').startswith('.'):
+            break
+        start -= 1
+
+    depth = 0
+    end = pos
+    while end < len(text):
+        c = text[end]
+        if c in '\'"`':
+            end = _skip_string(text, end)
+            continue
+        if c in '([{':
+            depth += 1
+        elif c in ')]}':
+            if depth == 0:
+                break
+            depth -= 1
+        elif c == ';' and depth == 0:
+            break
+        elif c == '\n' and depth == 0 and not text[end + 1:].lstrip(' \t\r\n').startswith('.'):
+            break
+        end += 1
+    return start, end
+
+
+def _block_end(text, pos):
+    """Index of the `}` closing the block that contains text[pos]."""
+    depth = 0
+    i = pos
+    while i < len(text):
+        c = text[i]
+        if c in '\'"`':
+            i = _skip_string(text, i)
+            continue
+        if c in '([{':
+            depth += 1
+        elif c in ')]}':
+            if depth == 0:
+                return i
+            depth -= 1
+        i += 1
+    return len(text)
+
+
+def chain_calls(text):
+    """[(method, args)] of the top-level `.method(args)` calls in `text`."""
+    calls = []
+    pos = 0
+    while True:
+        match = _CALL_RE.search(text, pos)
+        if not match:
+            return calls
+        close = _matching(text, match.end() - 1)
+        calls.append((match.group(1), text[match.end():close]))
+        pos = close + 1
+
+
+class Query(object):
+    """One query shape: a table, its where/orderBy columns and a location."""
+
+    def __init__(self, location, kind, variable):
+        self.location = location
+        self.kind = kind
+        self.variable = variable
+        self.count = False
+        self.conditions = []
+        self.disjunction = False
+        self.order = []
+        self.limit = False
+        self.notes = []
+        self.variant = None
+
+    def copy(self):
+        other = Query(self.location, self.kind, self.variable)
+        other.__dict__.update(self.__dict__)
+        other.conditions = list(self.conditions)
+        other.order = list(self.order)
+        other.notes = list(self.notes)
+        return other
+
+    def label(self):
+        if self.variant:
+            return '{} ({})'.format(self.location, self.variant)
+        return self.location
+
+
+def _conditions(args):
+    """[(op, variable, field)] of a where() argument, and whether it is an or()."""
+    found = [(m.group(1), m.group(2), m.group(3)) for m in _CONDITION_RE.finditer(args)]
+    return found, bool(re.search(r"\bor\(", args))
+
+
+def _apply_calls(query, calls, where_variants):
+    """Fold a chain's calls into `query`; where() calls go to `where_variants`."""
+    for name, args in calls:
+        if name == 'select' and 'count(' in args:
+            query.count = True
+        elif name == 'where':
+            conditions, disjunction = _conditions(args)
+            if not conditions:
+                bare = _BARE_WHERE_RE.match(args)
+                if bare:
+                    conditions = [('eq', bare.group(1), bare.group(2))]
+                    query.notes.append(
+                        'where({}) passes two arguments; Drizzle uses only the first, so this '
+                        'filters on "{}.{} is truthy" and matches every row. Did you mean '
+                        'where(eq({}))?'.format(args.strip(), bare.group(1), bare.group(2), args.strip()))
+            where_variants.append((conditions, disjunction, args.strip()))
+        elif name == 'orderBy':
+            query.order = [(m.group(2), m.group(3), (m.group(1) or 'asc').upper())
+                           for m in _ORDER_RE.finditer(args)]
+        elif name == 'limit':
+            query.limit = True
+
+
+def extract_queries(path, text, schema):
+    """Query shapes of the Drizzle chains in one source file."""
+    queries = []
+    for match in re.finditer(r"\.\s*(from|update|delete)\s*\(\s*(\w+)\s*\)", text):
+        kind, variable = match.group(1), match.group(2)
+        if variable not in schema:
+            continue
+        start, end = _statement_bounds(text, match.start())
+        statement = text[start:end]
+        line = text.count('\n', 0, match.start()) + 1
+        query = Query('{}:{}'.format(path, line), 'select' if kind == 'from' else kind, variable)
+        where_variants = []
+        _apply_calls(query, chain_calls(statement), where_variants)
+
+        # `let query = db.select()...` followed by `query = query.where(...)`.
+        later = []
+        assigned = _ASSIGN_RE.match(statement.strip())
+        if assigned:
+            name = assigned.group(1)
+            scope = text[end:_block_end(text, end)]
+            pattern = re.compile(r"\b{0}\s*=\s*{0}\s*((?:\.\s*\w+\s*\()[^;\n]*)|\b{0}((?:\.\s*\w+\s*\()[^;\n]*)"
+                                 .format(re.escape(name)))
+            for use in pattern.finditer(scope):
+                rest = use.group(1) or use.group(2)
+                _apply_calls(query, chain_calls(rest), later)
+
+        base = where_variants[-1] if where_variants else None
+        if len(where_variants) + len(later) > 1:
+            query.notes.append('where() is called more than once; Drizzle keeps only the last call, '
+                               'so earlier conditions are dropped (combine them with and(...))')
+        shapes = [(base, None)]
+        for conditions in later:
+            shapes.append((conditions, 'where {}'.format(conditions[2])))
+        if later and base is None:
+            shapes[0] = (None, 'no filter')
+        for where, variant in shapes:
+            shape = query.copy()
+            shape.variant = variant
+            if where:
+                shape.conditions, shape.disjunction = where[0], where[1]
+            queries.append(shape)
+    return queries
+
+
+def find_queries(project_root, schema, dirs=QUERY_DIRS):
+    queries = []
+    for rel in d1_local.source_files(project_root, dirs):
+        with open(os.path.join(str(project_root), rel), 'r') as f:
+            text = f.read()
+        if '.from(' not in text and '.update(' not in text and '.delete(' not in text:
+            continue
+        queries.extend(extract_queries(rel, text, schema))
+    return queries
+
+
+# ---------------------------------------------------------------------------
+# Plans and advice
+
+
+def _quote(name):
+    return '"{}"'.format(name)
+
+
+class QueryIndexAdvisor(StatusLog):
+    """Checks the project's Drizzle queries against its migrated schema."""
+
+    def __init__(self, project_root, migrations=None, schema=None):
+        StatusLog.__init__(self)
+        self.project_root = project_root
+        self.migrations = migrations or d1_local.migrations_dir(project_root)
+        self.schema = schema
+        self.findings = []
+        self.suggestions = OrderedDict()
+        self.existing = {}
+        self.regressions = []
+
+    def column(self, variable, field):
+        table = self.schema.get(variable)
+        if not table:
+            return None
+        return table['columns'].get(field, field)
+
+    def statement(self, query):
+        """(sql, params): a SQLite statement with the same access path as the
+        Drizzle chain, and the column each `?` binds (None for LIMIT)."""
+        table = self.schema[query.variable]['table']
+        where = []
+        params = []
+        for op, variable, field in query.conditions:
+            column = self.column(variable, field)
+            where.append('{} {}'.format(_quote(column), OPERATORS[op]))
+            params.extend([column] * OPERATORS[op].count('?'))
+        where_sql = ' WHERE ' + (' OR ' if query.disjunction else ' AND ').join(where) if where else ''
+        if query.kind == 'update':
+            filtered = set(c[2] for c in query.conditions)
+            columns = [c for f, c in self.schema[query.variable]['columns'].items() if f not in filtered]
+            target = columns[-1] if columns else 'rowid'
+            return 'UPDATE {} SET {} = ?{}'.format(_quote(table), _quote(target), where_sql), [target] + params
+        if query.kind == 'delete':
+            return 'DELETE FROM {}{}'.format(_quote(table), where_sql), params
+        sql = 'SELECT {} FROM {}{}'.format('count(*)' if query.count else '*', _quote(table), where_sql)
+        if query.order:
+            sql += ' ORDER BY ' + ', '.join('{} {}'.format(_quote(self.column(v, f)), d)
+                                            for v, f, d in query.order)
+        if query.limit:
+            sql += ' LIMIT ?'
+            params.append(None)
+        return sql, params
+
+    def sql(self, query):
+        return self.statement(query)[0]
+
+    def plan(self, sql):
+        params = [None] * sql.count('?')
+        return [row[3] for row in self.conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+    @staticmethod
+    def problems(query, plan):
+        """Plan steps that get slower as the table grows."""
+        found = []
+        for step in plan:
+            if step.startswith('USE TEMP B-TREE'):
+                found.append(step)
+            elif step.startswith('SCAN '):
+                # A bare count(*) or an unsorted LIMIT has to scan anyway; an
+                # index walked in ORDER BY order stops after LIMIT rows.
+                if query.conditions or (query.order and 'USING' not in step):
+                    found.append(step)
+        return found
+
+    def propose(self, query):
+        """(table, [column, ...]) of an index serving `query`, or None."""
+        table = self.schema[query.variable]['table']
+        if query.disjunction:
+            return None
+        equality = []
+        ranges = []
+        for op, variable, field in query.conditions:
+            column = self.column(variable, field)
+            if op in EQUALITY and column not in equality:
+                equality.append(column)
+            elif op in RANGE and column not in ranges:
+                ranges.append(column)
+        columns = list(equality)
+        order = [(self.column(v, f), d) for v, f, d in query.order
+                 if self.schema.get(v, {}).get('table') == table]
+        if ranges:
+            columns.append(ranges[0])
+        elif query.kind == 'select' and order and len(order) == len(query.order):
+            mixed = len(set(d for _, d in order)) > 1
+            for column, direction in order:
+                if column not in columns:
+                    columns.append(column + (' DESC' if mixed and direction == 'DESC' else ''))
+        if not columns:
+            return None
+        return table, columns
+
+    @staticmethod
+    def index_name(table, columns):
+        return 'idx_{}_{}'.format(table, '_'.join(c.split(' ')[0] for c in columns))
+
+    def index_sql(self, table, columns, name=None):
+        name = name or self.index_name(table, columns)
+        cols = ', '.join(_quote(c.split(' ')[0]) + (' DESC' if c.endswith(' DESC') else '') for c in columns)
+        return 'CREATE INDEX {} ON {} ({});'.format(_quote(name), _quote(table), cols)
+
+    def try_index(self, table, columns, sql, query):
+        """Plan of `sql` with the proposed index in place."""
+        name = '__advisor_probe'
+        self.conn.execute(self.index_sql(table, columns, name))
+        try:
+            plan = self.plan(sql)
+        finally:
+            self.conn.execute('DROP INDEX {}'.format(_quote(name)))
+        return plan, not self.problems(query, plan)
+
+    def check_drift(self, used):
+        """Schema tables and columns that the migrations do not create."""
+        migrated = d1_local.tables(self.conn)
+        clean = True
+        for variable, table in sorted(self.schema.items()):
+            columns = migrated.get(table['table'])
+            if columns is None:
+                if variable in used:
+                    self.log_warning("Table '{}' ({} in {}) is not created by any migration; "
+                                     "queries on it will fail".format(table['table'], variable, table['file']))
+                    clean = False
+                continue
+            missing = [c for c in table['columns'].values() if c not in columns]
+            extra = [c for c in columns if c not in table['columns'].values()]
+            if missing or extra:
+                clean = False
+                detail = []
+                if missing:
+                    detail.append('schema only: {}'.format(', '.join(missing)))
+                if extra:
+                    detail.append('migrations only: {}'.format(', '.join(extra)))
+                self.log_warning("Table '{}' differs between {} and the migrations ({})".format(
+                    table['table'], table['file'], '; '.join(detail)))
+        if clean:
+            self.log_success("Schema matches the migrations for every queried table")
+
+    def merge(self):
+        """Fold proposals whose columns are a prefix of another on the same table
+        into the longest such proposal."""
+        keys = sorted(self.suggestions, key=lambda k: len(k[1]))
+        for key in keys:
+            table, columns = key
+            supersets = [other for other in self.suggestions
+                         if other != key and other[0] == table and other[1][:len(columns)] == columns]
+            if supersets:
+                target = max(supersets, key=lambda k: len(k[1]))
+                self.suggestions[target]['queries'].extend(self.suggestions.pop(key)['queries'])
+
+    def replaces(self, table, columns):
+        """Existing indexes on `table` made redundant by an index on `columns`."""
+        names = [c.split(' ')[0] for c in columns]
+        return [name for name, indexed in sorted(self.existing.get(table, {}).items())
+                if indexed == names[:len(indexed)]]
+
+    def verify(self, shapes):
+        """Create every suggestion, drop the indexes it replaces and re-plan
+        every query shape, so that a query that only stayed fast through a
+        dropped index shows up too; returns the shapes that still scan or sort."""
+        for table, columns in self.suggestions:
+            self.conn.execute(self.index_sql(table, list(columns)))
+            for name in self.replaces(table, columns):
+                self.conn.execute('DROP INDEX IF EXISTS {}'.format(_quote(name)))
+        findings = dict((id(f['query']), f) for f in self.findings)
+        migrated = d1_local.tables(self.conn)
+        remaining = []
+        for query in shapes:
+            if self.schema[query.variable]['table'] not in migrated:
+                continue
+            finding = findings.get(id(query))
+            sql = finding['sql'] if finding else self.sql(query)
+            try:
+                plan = self.plan(sql)
+            except sqlite3.Error:
+                continue  # already reported by advise()
+            if finding:
+                finding['plan_after'] = plan
+            if self.problems(query, plan):
+                remaining.append(finding or {'query': query, 'sql': sql, 'plan_after': plan,
+                                             'regression': True})
+        self.regressions = [r for r in remaining if r.get('regression')]
+        return remaining
+
+    def advise(self):
+        """Run all checks and return True when no query scans."""
+        print("\n{}D1 Query Index Advisor{}".format(Colors.BLUE, Colors.NC))
+        print("=" * 50)
+
+        if self.schema is None:
+            self.schema = d1_local.load_schema(self.project_root)
+        if not self.schema:
+            self.log_error("No sqliteTable() definitions found under {}".format(', '.join(QUERY_DIRS)))
+            return False
+        self.log_info("Schema: {} tables in {}".format(
+            len(self.schema), ', '.join(sorted(set(t['file'] for t in self.schema.values())))))
+
+        self.conn = sqlite3.connect(':memory:')
+        try:
+            files = d1_local.apply_migrations(self.conn, self.migrations)
+        except sqlite3.Error as e:
+            self.log_error("Migrations failed to apply: {}".format(e))
+            return False
+        if not files:
+            self.log_error("No migrations found in {}".format(self.migrations))
+            return False
+        self.log_success("Applied {} migration(s) from {}".format(
+            len(files), os.path.relpath(self.migrations, str(self.project_root))))
+
+        queries = find_queries(self.project_root, self.schema)
+        self.log_info("Found {} query shapes in {}".format(len(queries), ', '.join(QUERY_DIRS)))
+        migrated = d1_local.tables(self.conn)
+        self.existing = dict((table, d1_local.indexes(self.conn, table, unique=False)) for table in migrated)
+
+        print("\n{}Schema drift{}".format(Colors.BLUE, Colors.NC))
+        self.check_drift(set(q.variable for q in queries))
+
+        print("\n{}Query plans{}".format(Colors.BLUE, Colors.NC))
+        notes = OrderedDict()
+        for query in queries:
+            for note in query.notes:
+                notes.setdefault((query.location, note), None)
+            if self.schema[query.variable]['table'] not in migrated:
+                continue
+            sql = self.sql(query)
+            try:
+                plan = self.plan(sql)
+            except sqlite3.Error as e:
+                self.log_error("{}: {} ({})".format(query.label(), sql, e))
+                continue
+            slow = self.problems(query, plan)
+            if not slow:
+                self.log_success("{}: {}".format(query.label(), sql))
+                continue
+            self.log_warning("{}: {}".format(query.label(), sql))
+            print("    plan: {}".format(' | '.join(plan)))
+            finding = {'query': query, 'sql': sql, 'plan': plan, 'problems': slow}
+            self.findings.append(finding)
+            proposal = self.propose(query)
+            if not proposal:
+                print("    no single index avoids this scan")
+                continue
+            table, columns = proposal
+            after, fixed = self.try_index(table, columns, sql, query)
+            print("    with {} -> {} ({})".format(self.index_name(table, columns), ' | '.join(after),
+                                                  'fixed' if fixed else 'still slow'))
+            if fixed:
+                entry = self.suggestions.setdefault((table, tuple(columns)), {'queries': []})
+                entry['queries'].append(query.label())
+
+        if notes:
+            print("\n{}Query notes{}".format(Colors.BLUE, Colors.NC))
+            for location, note in notes:
+                self.log_warning("{}: {}".format(location, note))
+
+        self.merge()
+        remaining = self.verify(queries)
+        self.conn.close()
+        self.print_summary(remaining)
+        return not self.findings and not self.regressions
+
+    def print_summary(self, remaining):
+        print("\n" + "=" * 50)
+        if not self.findings and not remaining:
+            self.log_success("No query needs a full scan or a temporary sort")
+            return
+        print("{} of the queries scan or sort; suggested indexes:".format(len(self.findings)))
+        for (table, columns), entry in self.suggestions.items():
+            print("\n  {}".format(self.index_sql(table, list(columns))))
+            print("    drizzle: index('{}').on({})".format(
+                self.index_name(table, columns),
+                ', '.join('table.{}'.format(self.field(table, c.split(' ')[0])) for c in columns)))
+            for label in entry['queries']:
+                print("    serves {}".format(label))
+            for name in self.replaces(table, columns):
+                print("    replaces {} ({}); DROP INDEX {};".format(
+                    name, ', '.join(self.existing[table][name]), _quote(name)))
+        print("")
+        if remaining:
+            for finding in remaining:
+                self.log_warning("{}: {} ({})".format(
+                    'Slow once the replaced indexes are dropped' if finding.get('regression')
+                    else 'Still slow with the suggested indexes',
+                    finding['query'].label(), ' | '.join(finding['plan_after'])))
+        else:
+            self.log_success("Verified: with these indexes no query scans or sorts")
+
+    def field(self, table, column):
+        for variable, entry in self.schema.items():
+            if entry['table'] == table:
+                for field, name in entry['columns'].items():
+                    if name == column:
+                        return field
+        return column
+
+    def report(self):
+        """JSON-serialisable summary of the findings and suggestions."""
+        return {
+            'findings': [{
+                'location': f['query'].label(),
+                'sql': f['sql'],
+                'plan': f['plan'],
+                'plan_with_suggestions': f.get('plan_after'),
+                'problems': f['problems'],
+            } for f in self.findings],
+            'suggestions': [{
+                'table': table,
+                'columns': list(columns),
+                'sql': self.index_sql(table, list(columns)),
+                'queries': entry['queries'],
+                'replaces': self.replaces(table, columns),
+            } for (table, columns), entry in self.suggestions.items()],
+            'regressions': [{
+                'location': r['query'].label(),
+                'sql': r['sql'],
+                'plan_with_suggestions': r['plan_after'],
+            } for r in self.regressions],
+            'warnings': self.warnings,
+            'errors': self.errors,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report Drizzle queries that scan D1 tables and the "
+                                                 "indexes that fix them")
+    parser.add_argument("--project-root", default=".", help="Project root (default: .)")
+    parser.add_argument("--migrations", help="Migrations folder (default: drizzle.config.ts `out`)")
+    parser.add_argument("--sql", help="Write the suggested CREATE INDEX (and DROP INDEX) statements to this file")
+    parser.add_argument("--json", help="Write the findings as JSON to this file")
+    parser.add_argument("--strict", action="store_true",
+                        help="Exit with status 1 when any query scans (default: report only)")
+    args = parser.parse_args()
+
+    project_root = os.path.abspath(args.project_root)
+    advisor = QueryIndexAdvisor(project_root, args.migrations)
+    clean = advisor.advise()
+
+    if args.sql and advisor.suggestions:
+        statements = []
+        for table, columns in advisor.suggestions:
+            statements.append(advisor.index_sql(table, list(columns)))
+            statements.extend('DROP INDEX IF EXISTS {};'.format(_quote(name))
+                              for name in advisor.replaces(table, columns))
+        with open(args.sql, 'w') as f:
+            f.write('\n--> statement-breakpoint\n'.join(statements) + '\n')
+        advisor.log_info("Wrote {}".format(args.sql))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(advisor.report(), f, indent=2)
+        advisor.log_info("Wrote {}".format(args.json))
+
+    if advisor.errors:
+        return 1
+    return 1 if args.strict and not clean else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Local D1 Helpers
+
+D1 is SQLite. These helpers build a local copy of the project's database
+without wrangler:
+
+- migrations_dir() finds the migrations folder (the `out` option in
+  drizzle.config.ts, then `migrations_dir` of the first D1 binding, then
+  ./migrations)
+- apply_migrations() runs the migrations in journal order, splitting each
+  file on drizzle-kit's `--> statement-breakpoint` markers
+- load_schema() reads the sqliteTable() definitions in the TypeScript
+  sources, mapping Drizzle names (`traceEvents.traceId`) to SQL names
+  (`trace_events.trace_id`)
+- percentile() is the nearest-rank percentile the scripts report timings
+  with
+
+Used by check_query_indexes.py, bench_d1_workload.py, log_retention.py,
+trace_analyzer.py and log_tailer.py.
+"""
+
+import json
+import math
+import os
+import re
+import sqlite3
+
+import project_model
+
+
+BREAKPOINT = '--> statement-breakpoint'
+SCHEMA_DIRS = ('src', 'worker')
+SKIP_DIRS = ('node_modules', '.git', '.wrangler', 'dist', 'build')
+
+_TABLE_RE = re.compile(r"(?:export\s+)?const\s+(\w+)\s*=\s*sqliteTable\(\s*['\"`](\w+)['\"`]\s*,\s*\{")
+_COLUMN_RE = re.compile(r"^\s*(\w+)\s*:\s*\w+\(\s*['\"`](\w+)['\"`]", re.MULTILINE)
+
+
+def migrations_dir(project_root):
+    """Absolute path of the project's migrations folder."""
+    model = project_model.ProjectModel(project_root)
+    drizzle = model.drizzle() or {}
+    if drizzle.get('out'):
+        return os.path.normpath(model.path(drizzle['out']))
+    try:
+        wrangler = model.wrangler() or {}
+    except project_model.ConfigError:
+        wrangler = {}
+    for binding in wrangler.get('d1_databases') or []:
+        if isinstance(binding, dict) and binding.get('migrations_dir'):
+            return os.path.normpath(model.path(binding['migrations_dir']))
+    return model.path('migrations')
+
+
+def migration_files(directory):
+    """Migration files in apply order.
+
+    drizzle-kit lists its migrations in meta/_journal.json; other folders
+    (wrangler's own NNNN_name.sql) are applied in file name order.
+    """
+    journal = os.path.join(directory, 'meta', '_journal.json')
+    if os.path.isfile(journal):
+        with open(journal, 'r') as f:
+            entries = json.load(f).get('entries', [])
+        files = []
+        for entry in sorted(entries, key=lambda e: e.get('idx', 0)):
+            path = os.path.join(directory, entry['tag'] + '.sql')
+            if os.path.isfile(path):
+                files.append(path)
+        if files:
+            return files
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.endswith('.sql')]
+
+
+def split_statements(text):
+    """Statements of one migration file, split on drizzle-kit breakpoints."""
+    return [part.strip() for part in text.split(BREAKPOINT) if part.strip()]
+
+
+def apply_migrations(conn, directory):
+    """Run every migration in `directory` on `conn`; returns the files applied."""
+    files = migration_files(directory)
+    for path in files:
+        with open(path, 'r') as f:
+            text = f.read()
+        for statement in split_statements(text):
+            try:
+                conn.executescript(statement)
+            except sqlite3.Error as e:
+                raise sqlite3.Error('{}: {}'.format(os.path.basename(path), e))
+    return files
+
+
+def connect(path=':memory:', directory=None):
+    """Open a SQLite database, applying the migrations in `directory` if given."""
+    conn = sqlite3.connect(path)
+    if directory:
+        apply_migrations(conn, directory)
+    return conn
+
+
+def tables(conn):
+    """{table: [column, ...]} of the user tables in `conn`."""
+    result = {}
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                        "AND name NOT LIKE 'sqlite_%'").fetchall()
+    for (name,) in rows:
+        result[name] = [row[1] for row in conn.execute('PRAGMA table_info("{}")'.format(name))]
+    return result
+
+
+def indexes(conn, table, unique=True):
+    """{index name: [column, ...]} of `table`, including implicit ones.
+
+    unique=False leaves out UNIQUE and primary key indexes, which cannot be
+    dropped without dropping their constraint.
+    """
+    result = {}
+    for row in conn.execute('PRAGMA index_list("{}")'.format(table)):
+        name = row[1]
+        if row[2] and not unique:
+            continue
+        result[name] = [info[2] for info in conn.execute('PRAGMA index_info("{}")'.format(name))]
+    return result
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list (as in cfdocs/metrics.py)."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(math.ceil(p / 100.0 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+# ---------------------------------------------------------------------------
+# Drizzle schema
+
+
+def _braced(text, start):
+    """Text between the brace at text[start] and its match."""
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == '{':
+            depth += 1
+        elif text[i] == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start + 1:i]
+    return text[start + 1:]
+
+
+def parse_schema(text):
+    """{variable: {'table': name, 'columns': {field: column}}} of a schema file."""
+    result = {}
+    for match in _TABLE_RE.finditer(text):
+        body = _braced(text, match.end() - 1)
+        # Only top-level keys are columns; nested objects are column options.
+        columns = {}
+        for column in _COLUMN_RE.finditer(body):
+            columns[column.group(1)] = column.group(2)
+        result[match.group(1)] = {'table': match.group(2), 'columns': columns,
+                                  'line': text.count('\n', 0, match.start()) + 1}
+    return result
+
+
+def source_files(project_root, dirs=SCHEMA_DIRS, extensions=('.ts', '.tsx')):
+    """TypeScript files under `dirs`, relative to the project root."""
+    found = []
+    for top in dirs:
+        base = os.path.join(str(project_root), top)
+        for dirpath, dirnames, filenames in os.walk(base):
+            dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS)
+            for name in sorted(filenames):
+                if name.endswith(extensions) and not name.endswith('.d.ts'):
+                    found.append(os.path.relpath(os.path.join(dirpath, name), str(project_root)))
+    return found
+
+
+def load_schema(project_root, dirs=SCHEMA_DIRS):
+    """All sqliteTable() definitions under `dirs`, with the file defining each."""
+    schema = {}
+    for rel in source_files(project_root, dirs):
+        with open(os.path.join(str(project_root), rel), 'r') as f:
+            text = f.read()
+        if 'sqliteTable(' not in text:
+            continue
+        for name, table in parse_schema(text).items():
+            table['file'] = rel
+            schema[name] = table
+    return schema
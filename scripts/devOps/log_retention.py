@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Log Retention and Rollup
+
+Logger (src/lib/logger.ts) writes to logs, traces and trace_events on almost
+every step, and nothing prunes them. This script generates the SQL that does:
+
+1. Rollup: rows past their retention are summarized into
+   observability_daily, one row per (day, table, component, level or
+   status). Each row holds the event count, the error count (levels or
+   statuses `error` and `fatal`) and the duration count, p50, p95 and
+   max. Durations come from traces.duration
+   and from the `duration` field of trace_events.data. Percentiles are
+   computed in SQL with window functions, so D1 can run the same file.
+2. Compaction: the rolled up rows are deleted,
+   `DELETE ... WHERE rowid IN (SELECT rowid ... LIMIT n)`.
+
+Both run in bounded batches of --batch-size rows, so that no single
+statement runs near D1's per-query time limit: each batch rolls up the next
+n expired rows in rowid order, then deletes them. Every rollup row keeps
+the highest rowid it covers (last_rowid). A rollup only reads rows above
+that watermark and a delete only removes rows at or below it, so a file
+that is run twice, or stops between a rollup and its delete, never counts a
+row twice. The exception is a row inserted before, but timestamped after,
+rows that were already rolled up. It is deleted without being counted.
+
+Retention is set per table and per level (per status for traces), in whole
+days; rows expire at midnight UTC. The built-in policy can be overridden
+with a JSON file (--policy).
+
+Statements are separated by drizzle-kit's `--> statement-breakpoint`
+marker, which is a SQL comment to wrangler:
+
+    wrangler d1 execute DB --remote --file retention.sql
+
+Without --db the plan has --max-batches batches per group; batches past
+the last expired row do nothing. With --db pointing at a local SQLite copy
+(e.g. from `wrangler d1 export`), the number of batches is sized to the
+expired rows. --apply runs the file against a copy of that database and
+checks that every expired row was deleted and counted exactly once.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import sqlite3
+import argparse
+import datetime
+
+import d1_local
+from status import Colors, StatusLog, Symbols
+
+
+ROLLUP_TABLE = 'observability_daily'
+MAX_STATEMENT_BYTES = 100000  # D1's maximum SQL statement length
+
+# days: retention per level/status value; "*" covers every other value and
+# null keeps rows forever.
+DEFAULT_POLICY = {
+    'logs': {
+        'time_column': 'timestamp', 'group_column': 'level', 'duration': None,
+        'days': {'debug': 3, 'info': 14, 'warn': 30, 'error': 90, 'fatal': 90, '*': 14},
+    },
+    'trace_events': {
+        'time_column': 'timestamp', 'group_column': 'level',
+        'duration': "CASE WHEN json_valid(data) THEN CAST(json_extract(data, '$.duration') AS REAL) END",
+        'days': {'debug': 3, 'info': 14, 'warn': 30, 'error': 90, 'fatal': 90, '*': 14},
+    },
+    'traces': {
+        'time_column': 'start_time', 'group_column': 'status', 'duration': 'duration',
+        'days': {'success': 30, 'error': 90, '*': 30},
+    },
+}
+# Levels (statuses for traces) counted in the `errors` column.
+ERROR_VALUES = ('error', 'fatal')
+
+ROLLUP_DDL = """CREATE TABLE IF NOT EXISTS `{table}` (
+	`day` text NOT NULL,
+	`source` text NOT NULL,
+	`component` text NOT NULL,
+	`level` text NOT NULL,
+	`events` integer NOT NULL,
+	`errors` integer NOT NULL,
+	`durations` integer NOT NULL,
+	`p50_ms` real,
+	`p95_ms` real,
+	`max_ms` real,
+	`last_rowid` integer NOT NULL,
+	PRIMARY KEY (`day`, `source`, `component`, `level`)
+);""".format(table=ROLLUP_TABLE)
+
+# Highest rowid of `table` already rolled up for one retention group.
+WATERMARK_SQL = "(SELECT MAX(`last_rowid`) FROM `{rollup}` WHERE `source` = '{table}' AND {mark})"
+
+# Batches of one day are merged: counts add up, percentiles are averaged
+# weighted by their duration counts.
+ROLLUP_SQL = """INSERT INTO `{rollup}` (`day`, `source`, `component`, `level`, `events`, `errors`, `durations`, `p50_ms`, `p95_ms`, `max_ms`, `last_rowid`)
+SELECT day, '{table}', component, grp, COUNT(*), SUM(is_error), MAX(n),
+	MIN(CASE WHEN d IS NOT NULL AND rn >= 0.50 * n THEN d END),
+	MIN(CASE WHEN d IS NOT NULL AND rn >= 0.95 * n THEN d END),
+	MAX(d), MAX(id)
+FROM (
+	SELECT id, day, component, grp, is_error, d,
+		ROW_NUMBER() OVER (PARTITION BY day, component, grp ORDER BY d IS NULL, d) AS rn,
+		COUNT(d) OVER (PARTITION BY day, component, grp) AS n
+	FROM (
+		SELECT rowid AS id, substr(`{time}`, 1, 10) AS day, `component` AS component,
+			COALESCE(`{group}`, '') AS grp, COALESCE(`{group}` IN ({errors}), 0) AS is_error, {duration} AS d
+		FROM `{table}` WHERE {where} AND rowid > COALESCE({watermark}, 0)
+		ORDER BY rowid LIMIT {limit}
+	)
+)
+WHERE true
+GROUP BY day, component, grp
+ON CONFLICT (`day`, `source`, `component`, `level`) DO UPDATE SET
+	`p50_ms` = (COALESCE(`p50_ms` * `durations`, 0) + COALESCE(excluded.`p50_ms` * excluded.`durations`, 0)) / NULLIF(`durations` + excluded.`durations`, 0),
+	`p95_ms` = (COALESCE(`p95_ms` * `durations`, 0) + COALESCE(excluded.`p95_ms` * excluded.`durations`, 0)) / NULLIF(`durations` + excluded.`durations`, 0),
+	`max_ms` = MAX(COALESCE(`max_ms`, excluded.`max_ms`), COALESCE(excluded.`max_ms`, `max_ms`)),
+	`events` = `events` + excluded.`events`,
+	`errors` = `errors` + excluded.`errors`,
+	`durations` = `durations` + excluded.`durations`,
+	`last_rowid` = MAX(`last_rowid`, excluded.`last_rowid`);"""
+
+DELETE_SQL = """DELETE FROM `{table}` WHERE rowid IN (
+	SELECT rowid FROM `{table}` WHERE {where} AND rowid <= {watermark} ORDER BY rowid LIMIT {limit});"""
+
+
+def _literal(value):
+    return "'{}'".format(str(value).replace("'", "''"))
+
+
+def load_policy(path=None):
+    """The built-in policy, with the tables and day counts in `path` merged over it."""
+    policy = json.loads(json.dumps(DEFAULT_POLICY))
+    if not path:
+        return policy
+    with open(path, 'r') as f:
+        override = json.load(f)
+    if not isinstance(override, dict):
+        raise ValueError("{}: expected an object of tables".format(path))
+    for table, settings in override.items():
+        if not isinstance(settings, dict):
+            raise ValueError("{}: policy for '{}' must be an object".format(path, table))
+        entry = policy.setdefault(table, {'time_column': 'timestamp', 'group_column': 'level',
+                                          'duration': None, 'days': {}})
+        for key, value in settings.items():
+            if key == 'days':
+                entry['days'].update(value)
+            else:
+                entry[key] = value
+        for group, days in entry['days'].items():
+            if days is not None and (not isinstance(days, int) or days < 0):
+                raise ValueError("{}: {}.days.{} must be a whole number of days or null".format(
+                    path, table, group))
+    return policy
+
+
+class RetentionPlanner(StatusLog):
+    """Builds the rollup and batched delete statements for a retention policy."""
+
+    def __init__(self, policy, today, batch_size=1000, max_batches=50, conn=None):
+        StatusLog.__init__(self)
+        self.policy = policy
+        self.today = today
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.conn = conn
+        self.groups = []
+
+    def cutoff(self, days):
+        return (self.today - datetime.timedelta(days=days)).isoformat()
+
+    def expiring(self, table, settings):
+        """[(group label, SQL condition, rollup level condition)] of the rows `settings` expires."""
+        days = settings.get('days', {})
+        column = settings['group_column']
+        time_column = settings['time_column']
+        named = [g for g in days if g != '*']
+        conditions = []
+        for group in sorted(named):
+            if days[group] is not None:
+                conditions.append((group, "`{}` = {} AND `{}` < {}".format(
+                    column, _literal(group), time_column, _literal(self.cutoff(days[group]))),
+                    "`level` = {}".format(_literal(group))))
+        if days.get('*') is not None:
+            values = ', '.join(_literal(g) for g in sorted(named))
+            others = "`{}` NOT IN ({})".format(column, values) if named else '1'
+            conditions.append(('*', "({} OR `{}` IS NULL) AND `{}` < {}".format(
+                others, column, time_column, _literal(self.cutoff(days['*']))),
+                "`level` NOT IN ({})".format(values) if named else '1'))
+        return conditions
+
+    def watermark(self, table, mark):
+        return WATERMARK_SQL.format(rollup=ROLLUP_TABLE, table=table, mark=mark)
+
+    def rollup(self, table, settings, where, mark):
+        return ROLLUP_SQL.format(rollup=ROLLUP_TABLE, table=table, time=settings['time_column'],
+                                 group=settings['group_column'],
+                                 errors=', '.join(_literal(v) for v in ERROR_VALUES),
+                                 duration=settings.get('duration') or 'NULL', where=where,
+                                 watermark=self.watermark(table, mark), limit=self.batch_size)
+
+    def delete(self, table, where, mark):
+        return DELETE_SQL.format(table=table, where=where, watermark=self.watermark(table, mark),
+                                 limit=self.batch_size)
+
+    def statements(self):
+        """[(comment, sql)] of the whole plan."""
+        plan = [('rollup table', ROLLUP_DDL)]
+        existing = d1_local.tables(self.conn) if self.conn else None
+        for table in sorted(self.policy):
+            settings = self.policy[table]
+            if existing is not None:
+                columns = existing.get(table)
+                if columns is None:
+                    self.log_warning("Skipping '{}': not in the database".format(table))
+                    continue
+                needed = [settings['time_column'], settings['group_column'], 'component']
+                missing = [c for c in needed if c not in columns]
+                if missing:
+                    self.log_warning("Skipping '{}': no column {}".format(table, ', '.join(missing)))
+                    continue
+            for group, where, mark in self.expiring(table, settings):
+                rows, days = self.measure(table, settings, where)
+                batches = int(math.ceil(rows / float(self.batch_size))) if rows is not None else self.max_batches
+                self.groups.append({'table': table, 'group': group, 'where': where, 'rows': rows,
+                                    'days': len(days) if days is not None else None, 'batches': batches})
+                label = '{} {}={}'.format(table, settings['group_column'], group)
+                if rows == 0:
+                    continue
+                for i in range(batches):
+                    batch = '{} batch {}/{}'.format(label, i + 1, batches)
+                    plan.append(('rollup ' + batch, self.rollup(table, settings, where, mark)))
+                    plan.append(('delete ' + batch, self.delete(table, where, mark)))
+        for comment, sql in plan:
+            if len(sql.encode('utf-8')) > MAX_STATEMENT_BYTES:
+                raise ValueError("statement for {} exceeds D1's {} byte limit".format(comment, MAX_STATEMENT_BYTES))
+        return plan
+
+    def measure(self, table, settings, where):
+        """(expired rows, [day, ...]) from the local copy, or (None, None)."""
+        if not self.conn:
+            return None, None
+        rows = self.conn.execute("SELECT count(*) FROM `{}` WHERE {}".format(table, where)).fetchone()[0]
+        days = [row[0] for row in self.conn.execute(
+            "SELECT DISTINCT substr(`{0}`, 1, 10) FROM `{1}` WHERE {2} ORDER BY 1".format(
+                settings['time_column'], table, where))]
+        return rows, days
+
+
+def render(plan, today, policy_source):
+    lines = [
+        "-- Log retention plan generated {} (retention measured from {})".format(
+            datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC'), today.isoformat()),
+        "-- Policy: {}".format(policy_source),
+        "-- Statements are separated by drizzle-kit breakpoints; wrangler reads them as comments.",
+    ]
+    for i, (comment, sql) in enumerate(plan):
+        if i:
+            lines.append(d1_local.BREAKPOINT)
+        lines.append("-- {}".format(comment))
+        lines.append(sql)
+    return '\n'.join(lines) + '\n'
+
+
+def apply_plan(db_path, sql_text, groups):
+    """Run the plan on a copy of `db_path`; returns (copy path, report)."""
+    root, ext = os.path.splitext(db_path)
+    target = '{}-pruned{}'.format(root, ext or '.sqlite')
+    shutil.copyfile(db_path, target)
+    conn = sqlite3.connect(target, isolation_level=None)
+    before = dict((t, conn.execute("SELECT count(*) FROM `{}`".format(t)).fetchone()[0])
+                  for t in sorted(set(g['table'] for g in groups)))
+    events = "SELECT COALESCE(SUM(events), 0) FROM `{}`".format(ROLLUP_TABLE)
+    try:
+        counted = conn.execute(events).fetchone()[0]
+    except sqlite3.OperationalError:
+        counted = 0
+    timings = {'rollup': [], 'delete': []}
+    deleted = 0
+    for statement in d1_local.split_statements(sql_text):
+        kind = 'delete' if 'DELETE FROM' in statement else 'rollup'
+        started = time.perf_counter()
+        cursor = conn.execute('\n'.join(l for l in statement.splitlines() if not l.startswith('--')))
+        timings[kind].append(time.perf_counter() - started)
+        if kind == 'delete':
+            deleted += max(cursor.rowcount, 0)
+    left = 0
+    for group in groups:
+        left += conn.execute("SELECT count(*) FROM `{}` WHERE {}".format(group['table'], group['where'])).fetchone()[0]
+    rolled = conn.execute("SELECT COALESCE(SUM(events), 0), count(*) FROM `{}`".format(ROLLUP_TABLE)).fetchone()
+    after = dict((t, conn.execute("SELECT count(*) FROM `{}`".format(t)).fetchone()[0]) for t in before)
+    conn.close()
+    return target, {'before': before, 'after': after, 'deleted': deleted, 'left': left,
+                    'rolled_up_events': rolled[0] - counted, 'rollup_rows': rolled[1],
+                    'slowest_rollup_ms': max(timings['rollup'] or [0]) * 1000.0,
+                    'slowest_delete_ms': max(timings['delete'] or [0]) * 1000.0,
+                    'statements': len(timings['rollup']) + len(timings['delete'])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate retention SQL that rolls old log and trace rows "
+                                                 "up into daily aggregates and deletes them in batches")
+    parser.add_argument("--policy", help="JSON retention policy merged over the built-in one")
+    parser.add_argument("--db", help="Local SQLite copy of the D1 database used to size the plan")
+    parser.add_argument("--output", help="SQL file to write (default: retention-<date>.sql)")
+    parser.add_argument("--today", help="Date retention is measured from, YYYY-MM-DD (default: today, UTC)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows per DELETE (default: 1000)")
+    parser.add_argument("--max-batches", type=int, default=50,
+                        help="DELETE batches per group when --db is not given (default: 50)")
+    parser.add_argument("--apply", action="store_true",
+                        help="Run the SQL on a copy of --db (<name>-pruned.sqlite) and verify it")
+    parser.add_argument("--print-policy", action="store_true", help="Print the effective policy and exit")
+    args = parser.parse_args()
+
+    if args.apply and not args.db:
+        parser.error("--apply needs --db")
+    if args.batch_size <= 0:
+        parser.error("--batch-size must be positive")
+    try:
+        policy = load_policy(args.policy)
+    except (IOError, OSError, ValueError) as e:
+        parser.error(str(e))
+    if args.print_policy:
+        print(json.dumps(policy, indent=2, sort_keys=True))
+        return 0
+    try:
+        today = datetime.datetime.strptime(args.today, '%Y-%m-%d').date() if args.today \
+            else datetime.datetime.utcnow().date()
+    except ValueError:
+        parser.error("--today must be YYYY-MM-DD")
+
+    print("\n{}Log Retention Plan{}".format(Colors.BLUE, Colors.NC))
+    print("=" * 50)
+    conn = None
+    if args.db:
+        if not os.path.isfile(args.db):
+            parser.error("{} does not exist".format(args.db))
+        conn = sqlite3.connect(args.db)
+    planner = RetentionPlanner(policy, today, args.batch_size, args.max_batches, conn)
+    try:
+        plan = planner.statements()
+    except (ValueError, sqlite3.Error) as e:
+        print("{}{}{} {}".format(Colors.RED, Symbols.ERROR, Colors.NC, e))
+        return 1
+    finally:
+        if conn:
+            conn.close()
+
+    for group in planner.groups:
+        planner.log_info("{:<14} {:<10} {:>10} rows  {:>5} days  {:>5} batches".format(
+            group['table'], group['group'], '?' if group['rows'] is None else group['rows'],
+            '?' if group['days'] is None else group['days'], group['batches']))
+
+    output = args.output or 'retention-{}.sql'.format(today.isoformat())
+    text = render(plan, today, args.policy or 'built-in')
+    with open(output, 'w') as f:
+        f.write(text)
+    print("{}{}{} Wrote {} statements to {}".format(Colors.GREEN, Symbols.SUCCESS, Colors.NC, len(plan), output))
+
+    if args.apply:
+        target, report = apply_plan(args.db, text, planner.groups)
+        print("\n{}Applied to {}{}".format(Colors.BLUE, target, Colors.NC))
+        for table in sorted(report['before']):
+            print("  {:<14} {:>10} -> {:>10} rows".format(table, report['before'][table], report['after'][table]))
+        print("  {} statements; slowest rollup {:.1f} ms, slowest delete {:.1f} ms".format(
+            report['statements'], report['slowest_rollup_ms'], report['slowest_delete_ms']))
+        print("  {} rows deleted; {} events in {} {} rows".format(
+            report['deleted'], report['rolled_up_events'], report['rollup_rows'], ROLLUP_TABLE))
+        if report['left']:
+            print("{}{}{} {} expired rows remain; raise --max-batches or size the plan with --db".format(
+                Colors.YELLOW, Symbols.WARNING, Colors.NC, report['left']))
+            return 1
+        if report['rolled_up_events'] != report['deleted']:
+            print("{}{}{} {} events rolled up for {} rows deleted".format(
+                Colors.RED, Symbols.ERROR, Colors.NC, report['rolled_up_events'], report['deleted']))
+            return 1
+        print("{}{}{} Every expired row was rolled up once and deleted".format(Colors.GREEN, Symbols.SUCCESS, Colors.NC))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Log Tailer and Metrics Exporter
+
+Follows the logs and trace_events tables of a local or exported copy of the
+D1 database and publishes per-component/level metrics, without asking the
+Worker's /api/logs endpoint (which sorts the whole table) for anything.
+
+Both tables have INTEGER PRIMARY KEY AUTOINCREMENT ids, so ids only grow
+and are never reused, even after log_retention.py deletes rows. Each poll
+reads `WHERE id > <high-water mark> ORDER BY id LIMIT n`, a range scan of
+the rowid B-tree, so it costs the new rows rather than the table size. The
+marks are persisted with the counters and the rolling window in a state
+file, so a restart (or the next --once run from cron) picks up where the
+last run stopped.
+
+Kept in memory per table, component and level:
+
+- total row counters (Prometheus counters, persisted across restarts)
+- rolling row counts and error ratios over --window seconds of log time
+  (row timestamps, so an old export replays the way it was written)
+- duration histograms in ms, from trace_events.data.duration and
+  logs.metadata.duration
+
+Each poll rewrites a Prometheus textfile (for node_exporter's textfile
+collector) and/or a JSON snapshot, atomically through a temporary file.
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import datetime
+
+import d1_local
+from status import StatusLog
+
+
+STATE_VERSION = 1
+STATE_FILE = ".log-tailer-state.json"
+TABLES = {
+    'logs': ('timestamp', 'metadata'),
+    'trace_events': ('timestamp', 'data'),
+}
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+SLOTS = 30  # rolling window resolution
+ERROR_LEVELS = ('error', 'fatal')
+
+
+def _epoch(value):
+    """Seconds since the epoch of an ISO timestamp, or None."""
+    if not value:
+        return None
+    text = str(value).rstrip('Z').replace(' ', 'T')[:26]
+    for fmt in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            stamp = datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        return (stamp - datetime.datetime(1970, 1, 1)).total_seconds()
+    return None
+
+
+def _duration(blob):
+    if not blob or 'duration' not in blob:
+        return None
+    try:
+        value = json.loads(blob).get('duration')
+    except (ValueError, AttributeError):
+        return None
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _write_atomic(path, text):
+    tmp = '{}.tmp'.format(path)
+    with open(tmp, 'w') as f:
+        f.write(text)
+    getattr(os, 'replace', os.rename)(tmp, path)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _key(*parts):
+    return '\x1f'.join(parts)
+
+
+def _split(key):
+    return key.split('\x1f')
+
+
+class RollingWindow(object):
+    """Counts per key over the last `seconds` of log time, in SLOTS slots."""
+
+    def __init__(self, seconds):
+        self.width = max(1.0, float(seconds) / SLOTS)
+        self.slots = {}  # slot number -> {key: [rows, errors]}
+        self.latest = None
+
+    def add(self, at, key, error):
+        slot = int(at // self.width)
+        counts = self.slots.setdefault(slot, {}).setdefault(key, [0, 0])
+        counts[0] += 1
+        if error:
+            counts[1] += 1
+        if self.latest is None or slot > self.latest:
+            self.latest = slot
+
+    def dump(self):
+        return {'width': self.width, 'latest': self.latest,
+                'slots': dict((str(slot), counts) for slot, counts in self.slots.items())}
+
+    def restore(self, state):
+        """Load dump() output; a window saved with another width is dropped."""
+        if not state or state.get('width') != self.width:
+            return
+        self.latest = state.get('latest')
+        self.slots = dict((int(slot), counts) for slot, counts in state.get('slots', {}).items())
+
+    def forget(self, prefix):
+        """Drop the counts of every key starting with `prefix`."""
+        for counts in self.slots.values():
+            for key in [k for k in counts if k.startswith(prefix)]:
+                del counts[key]
+
+    def totals(self):
+        if self.latest is None:
+            return {}
+        oldest = self.latest - SLOTS + 1
+        for slot in [s for s in self.slots if s < oldest]:
+            del self.slots[slot]
+        totals = {}
+        for counts in self.slots.values():
+            for key, (rows, errors) in counts.items():
+                entry = totals.setdefault(key, [0, 0])
+                entry[0] += rows
+                entry[1] += errors
+        return totals
+
+
+class LogTailer(StatusLog):
+    """Polls new rows by id and keeps counters, windows and histograms."""
+
+    def __init__(self, db_path, state_path, batch=5000, window=300):
+        StatusLog.__init__(self)
+        self.db_path = db_path
+        self.state_path = state_path
+        self.batch = batch
+        self.window = RollingWindow(window)
+        self.window_seconds = window
+        self.marks = {}
+        self.totals = {}      # table\x1fcomponent\x1flevel -> rows
+        self.histograms = {}  # table\x1fcomponent\x1flevel -> [bucket counts..., +Inf], sum
+        self.last_poll = {'rows': 0, 'seconds': 0.0, 'at': None}
+
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+        if state.get('version') != STATE_VERSION or state.get('db') != os.path.abspath(self.db_path):
+            return False
+        self.marks = state.get('marks', {})
+        self.totals = state.get('totals', {})
+        self.histograms = state.get('histograms', {})
+        self.window.restore(state.get('window'))
+        return True
+
+    def save_state(self):
+        _write_atomic(self.state_path, json.dumps({
+            'version': STATE_VERSION, 'db': os.path.abspath(self.db_path), 'marks': self.marks,
+            'totals': self.totals, 'histograms': self.histograms, 'window': self.window.dump()}))
+
+    def connect(self):
+        # Reopened every poll, so an export replaced on disk is picked up.
+        return sqlite3.connect('file:{}?mode=ro'.format(os.path.abspath(self.db_path)), uri=True)
+
+    def start_at_end(self, conn):
+        for table in self.tables(conn):
+            self.marks[table] = conn.execute('SELECT COALESCE(max(id), 0) FROM "{}"'.format(table)).fetchone()[0]
+
+    def tables(self, conn):
+        present = d1_local.tables(conn)
+        return [t for t in sorted(TABLES) if t in present]
+
+    def observe(self, table, row):
+        _, stamp, level, component, blob = row
+        key = _key(table, component or '', level or '')
+        self.totals[key] = self.totals.get(key, 0) + 1
+        at = _epoch(stamp)
+        if at is not None:
+            self.window.add(at, key, level in ERROR_LEVELS)
+        duration = _duration(blob)
+        if duration is not None:
+            hist = self.histograms.setdefault(key, {'buckets': [0] * (len(BUCKETS_MS) + 1), 'sum': 0.0})
+            index = len(BUCKETS_MS)
+            for i, bound in enumerate(BUCKETS_MS):
+                if duration <= bound:
+                    index = i
+                    break
+            hist['buckets'][index] += 1
+            hist['sum'] += duration
+
+    def reset(self, table):
+        """Forget everything counted from `table`, which is about to be read again."""
+        prefix = _key(table, '')
+        for counters in (self.totals, self.histograms):
+            for key in [k for k in counters if k.startswith(prefix)]:
+                del counters[key]
+        self.window.forget(prefix)
+
+    def poll(self):
+        """Read every row past the high-water marks; returns rows read."""
+        started = time.time()
+        read = 0
+        conn = self.connect()
+        try:
+            for table in self.tables(conn):
+                time_column, blob_column = TABLES[table]
+                mark = self.marks.get(table, 0)
+                newest = conn.execute('SELECT COALESCE(max(id), 0) FROM "{}"'.format(table)).fetchone()[0]
+                if newest < mark:
+                    self.log_warning("{}: max id {} is below the mark {}; the copy was replaced, "
+                                     "reading it from the start".format(table, newest, mark))
+                    self.reset(table)
+                    mark = 0
+                sql = ('SELECT id, "{}", level, component, "{}" FROM "{}" WHERE id > ? ORDER BY id LIMIT ?'
+                       .format(time_column, blob_column, table))
+                while True:
+                    rows = conn.execute(sql, (mark, self.batch)).fetchall()
+                    for row in rows:
+                        self.observe(table, row)
+                    if rows:
+                        mark = rows[-1][0]
+                        read += len(rows)
+                    if len(rows) < self.batch:
+                        break
+                self.marks[table] = mark
+        finally:
+            conn.close()
+        self.last_poll = {'rows': read, 'seconds': time.time() - started, 'at': time.time()}
+        return read
+
+    def snapshot(self):
+        window = self.window.totals()
+        series = []
+        for key in sorted(set(self.totals) | set(window)):
+            table, component, level = _split(key)
+            rows, errors = window.get(key, [0, 0])
+            entry = {'table': table, 'component': component, 'level': level,
+                     'rows_total': self.totals.get(key, 0), 'rows_window': rows}
+            hist = self.histograms.get(key)
+            if hist:
+                entry['duration_ms'] = {'buckets': dict(zip([str(b) for b in BUCKETS_MS] + ['+Inf'],
+                                                            _cumulative(hist['buckets']))),
+                                        'sum': hist['sum'], 'count': sum(hist['buckets'])}
+            series.append(entry)
+        ratios = {}
+        for key, (rows, errors) in window.items():
+            table, component, _ = _split(key)
+            entry = ratios.setdefault((table, component), [0, 0])
+            entry[0] += rows
+            entry[1] += errors
+        return {
+            'generated_at': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'window_seconds': self.window_seconds,
+            'high_water_marks': dict(self.marks),
+            'last_poll': self.last_poll,
+            'series': series,
+            'error_ratio_window': [{'table': t, 'component': c, 'rows': r, 'errors': e,
+                                    'ratio': float(e) / r if r else 0.0}
+                                   for (t, c), (r, e) in sorted(ratios.items())],
+        }
+
+    def prometheus(self, snap):
+        lines = [
+            '# HELP d1_log_rows_total Rows read from the table since the tailer state was created.',
+            '# TYPE d1_log_rows_total counter',
+        ]
+        for s in snap['series']:
+            lines.append('d1_log_rows_total{{table="{}",component="{}",level="{}"}} {}'.format(
+                _label(s['table']), _label(s['component']), _label(s['level']), s['rows_total']))
+        lines += ['# HELP d1_log_rows_window Rows in the last window_seconds of log time.',
+                  '# TYPE d1_log_rows_window gauge']
+        for s in snap['series']:
+            lines.append('d1_log_rows_window{{table="{}",component="{}",level="{}"}} {}'.format(
+                _label(s['table']), _label(s['component']), _label(s['level']), s['rows_window']))
+        lines += ['# HELP d1_log_error_ratio_window Share of error and fatal rows in the last window_seconds.',
+                  '# TYPE d1_log_error_ratio_window gauge']
+        for r in snap['error_ratio_window']:
+            lines.append('d1_log_error_ratio_window{{table="{}",component="{}"}} {:.6f}'.format(
+                _label(r['table']), _label(r['component']), r['ratio']))
+        lines += ['# HELP d1_log_duration_ms Durations recorded in data/metadata, in milliseconds.',
+                  '# TYPE d1_log_duration_ms histogram']
+        for s in snap['series']:
+            hist = s.get('duration_ms')
+            if not hist:
+                continue
+            labels = 'table="{}",component="{}",level="{}"'.format(
+                _label(s['table']), _label(s['component']), _label(s['level']))
+            for bound, count in hist['buckets'].items():
+                lines.append('d1_log_duration_ms_bucket{{{},le="{}"}} {}'.format(labels, bound, count))
+            lines.append('d1_log_duration_ms_sum{{{}}} {}'.format(labels, hist['sum']))
+            lines.append('d1_log_duration_ms_count{{{}}} {}'.format(labels, hist['count']))
+        lines += ['# HELP d1_tailer_high_water_mark Last id read from the table.',
+                  '# TYPE d1_tailer_high_water_mark gauge']
+        for table, mark in sorted(snap['high_water_marks'].items()):
+            lines.append('d1_tailer_high_water_mark{{table="{}"}} {}'.format(_label(table), mark))
+        lines += ['# HELP d1_tailer_poll_rows Rows read by the last poll.',
+                  '# TYPE d1_tailer_poll_rows gauge',
+                  'd1_tailer_poll_rows {}'.format(snap['last_poll']['rows']),
+                  '# HELP d1_tailer_poll_seconds Duration of the last poll.',
+                  '# TYPE d1_tailer_poll_seconds gauge',
+                  'd1_tailer_poll_seconds {:.6f}'.format(snap['last_poll']['seconds'])]
+        return '\n'.join(lines) + '\n'
+
+    def publish(self, prom_path=None, json_path=None):
+        snap = self.snapshot()
+        if prom_path:
+            _write_atomic(prom_path, self.prometheus(snap))
+        if json_path:
+            _write_atomic(json_path, json.dumps(snap, indent=2))
+        return snap
+
+
+def _cumulative(buckets):
+    total = 0
+    out = []
+    for count in buckets:
+        total += count
+        out.append(total)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tail the D1 logs and trace_events tables of a local copy "
+                                                 "and export per-component metrics")
+    parser.add_argument("db", help="Local or exported SQLite copy of the D1 database")
+    parser.add_argument("--state", default=STATE_FILE,
+                        help="High-water marks and counters (default: {})".format(STATE_FILE))
+    parser.add_argument("--prom", help="Prometheus textfile to rewrite after each poll")
+    parser.add_argument("--json", help="JSON snapshot to rewrite after each poll")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between polls (default: 5)")
+    parser.add_argument("--window", type=int, default=300,
+                        help="Rolling window in seconds of log time (default: 300)")
+    parser.add_argument("--batch", type=int, default=5000, help="Rows read per query (default: 5000)")
+    parser.add_argument("--from-start", action="store_true",
+                        help="Without saved state, read existing rows instead of starting at the end")
+    parser.add_argument("--once", action="store_true", help="Poll once and exit (for cron)")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.db):
+        parser.error("{} does not exist".format(args.db))
+    if not args.prom and not args.json:
+        parser.error("give --prom and/or --json")
+
+    tailer = LogTailer(args.db, args.state, batch=args.batch, window=args.window)
+    if tailer.load_state():
+        tailer.log_info("Resuming from {} ({})".format(
+            args.state, ', '.join('{}>{}'.format(t, m) for t, m in sorted(tailer.marks.items()))))
+    elif not args.from_start:
+        conn = tailer.connect()
+        try:
+            tailer.start_at_end(conn)
+        finally:
+            conn.close()
+        tailer.log_info("Starting at the end of {} ({})".format(
+            args.db, ', '.join('{}>{}'.format(t, m) for t, m in sorted(tailer.marks.items()))))
+
+    try:
+        while True:
+            try:
+                rows = tailer.poll()
+            except sqlite3.Error as e:
+                # The copy may be mid-replace; try again next interval.
+                tailer.log_warning("Poll failed: {}".format(e))
+                rows = None
+            if rows is not None:
+                tailer.publish(args.prom, args.json)
+                tailer.save_state()
+                if rows or args.once:
+                    tailer.log_success("Read {} rows in {:.3f}s".format(rows, tailer.last_poll['seconds']))
+            if args.once:
+                return 0 if rows is not None else 1
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        tailer.save_state()
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,539 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Project Model
+
+Parses the project's configuration files once and shares the result:
+
+- wrangler.jsonc / wrangler.json (JSONC: comments and trailing commas allowed)
+- wrangler.toml (tomllib when available, otherwise a built-in parser that
+  handles tables, nested arrays of tables such as [[durable_objects.bindings]],
+  dotted keys, inline arrays/tables and multi-line strings)
+- drizzle.config.ts
+- package.json
+
+Parsed files are memoized by path. A file is read again only when its mtime
+or size changes, and parsed again only when its content hash changes.
+Callers get a deep copy, so editing the returned config never changes the
+cached one.
+
+Used by check_drizzle_config.py and manageBindings.py.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import re
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+
+WRANGLER_CONFIGS = ("wrangler.jsonc", "wrangler.json", "wrangler.toml")
+
+
+class ConfigError(ValueError):
+    """Raised when a configuration file cannot be parsed."""
+
+
+# ---------------------------------------------------------------------------
+# JSONC
+
+
+def strip_jsonc(text):
+    """Remove // and /* */ comments and trailing commas, leaving strings intact."""
+    out = []
+    i = 0
+    n = len(text)
+    in_string = False
+    while i < n:
+        c = text[i]
+        if in_string:
+            out.append(c)
+            if c == '\\' and i + 1 < n:
+                out.append(text[i + 1])
+                i += 2
+                continue
+            if c == '"':
+                in_string = False
+            i += 1
+        elif c == '"':
+            in_string = True
+            out.append(c)
+            i += 1
+        elif text.startswith('//', i):
+            end = text.find('\n', i)
+            i = n if end < 0 else end
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = n if end < 0 else end + 2
+        else:
+            out.append(c)
+            i += 1
+    return _strip_trailing_commas("".join(out))
+
+
+def _strip_trailing_commas(text):
+    out = []
+    i = 0
+    n = len(text)
+    in_string = False
+    while i < n:
+        c = text[i]
+        if in_string:
+            out.append(c)
+            if c == '\\' and i + 1 < n:
+                out.append(text[i + 1])
+                i += 2
+                continue
+            if c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+            out.append(c)
+        elif c == ',':
+            j = i + 1
+            while j < n and text[j] in ' \t\r\n':
+                j += 1
+            if j >= n or text[j] not in '}]':
+                out.append(c)
+        else:
+            out.append(c)
+        i += 1
+    return "".join(out)
+
+
+def parse_jsonc(text):
+    try:
+        return json.loads(strip_jsonc(text))
+    except ValueError as e:
+        raise ConfigError("invalid JSONC: {}".format(e))
+
+
+# ---------------------------------------------------------------------------
+# TOML
+
+
+_BARE_KEY = re.compile(r'[A-Za-z0-9_-]+')
+_SCALAR = re.compile(r'[0-9A-Za-z_+\-.:]+')
+_ESCAPES = {'b': '\b', 't': '\t', 'n': '\n', 'f': '\f', 'r': '\r', '"': '"', '\\': '\\'}
+
+
+class _TomlParser(object):
+    """Fallback TOML parser for interpreters without tomllib."""
+
+    def __init__(self, text):
+        self.text = text.replace('\r\n', '\n')
+        self.pos = 0
+        self.root = {}
+        self.current = self.root
+
+    def error(self, message):
+        line = self.text.count('\n', 0, self.pos) + 1
+        raise ConfigError("invalid TOML at line {}: {}".format(line, message))
+
+    def peek(self, s):
+        return self.text.startswith(s, self.pos)
+
+    def skip_space(self):
+        while self.pos < len(self.text) and self.text[self.pos] in ' \t':
+            self.pos += 1
+
+    def skip_blank(self):
+        """Skip whitespace, newlines and comments."""
+        while self.pos < len(self.text):
+            c = self.text[self.pos]
+            if c in ' \t\n':
+                self.pos += 1
+            elif c == '#':
+                end = self.text.find('\n', self.pos)
+                self.pos = len(self.text) if end < 0 else end
+            else:
+                break
+
+    def end_of_line(self):
+        self.skip_space()
+        if self.peek('#'):
+            end = self.text.find('\n', self.pos)
+            self.pos = len(self.text) if end < 0 else end
+        if self.pos < len(self.text) and not self.peek('\n'):
+            self.error("expected end of line")
+
+    def parse(self):
+        while True:
+            self.skip_blank()
+            if self.pos >= len(self.text):
+                return self.root
+            if self.peek('[['):
+                self.pos += 2
+                keys = self.key_path(']]')
+                self.pos += 2
+                parent = self.walk(self.root, keys[:-1])
+                tables = parent.setdefault(keys[-1], [])
+                if not isinstance(tables, list):
+                    self.error("{} is not an array of tables".format('.'.join(keys)))
+                tables.append({})
+                self.current = tables[-1]
+            elif self.peek('['):
+                self.pos += 1
+                keys = self.key_path(']')
+                self.pos += 1
+                self.current = self.walk(self.root, keys)
+            else:
+                keys = self.key_path('=')
+                self.pos += 1
+                self.skip_space()
+                table = self.walk(self.current, keys[:-1])
+                table[keys[-1]] = self.value()
+            self.end_of_line()
+
+    def walk(self, table, keys):
+        """Descend through keys, creating tables; arrays resolve to their last table."""
+        for key in keys:
+            table = table.setdefault(key, {})
+            if isinstance(table, list):
+                table = table[-1]
+            if not isinstance(table, dict):
+                self.error("{} is not a table".format(key))
+        return table
+
+    def key_path(self, terminator):
+        keys = []
+        while True:
+            self.skip_space()
+            if self.peek('"'):
+                keys.append(self.basic_string())
+            elif self.peek("'"):
+                keys.append(self.literal_string())
+            else:
+                match = _BARE_KEY.match(self.text, self.pos)
+                if not match:
+                    self.error("expected a key")
+                keys.append(match.group(0))
+                self.pos = match.end()
+            self.skip_space()
+            if self.peek('.'):
+                self.pos += 1
+                continue
+            if not self.peek(terminator):
+                self.error("expected '{}'".format(terminator))
+            return keys
+
+    def value(self):
+        if self.peek('"""'):
+            return self.multiline_string('"""', escapes=True)
+        if self.peek("'''"):
+            return self.multiline_string("'''", escapes=False)
+        if self.peek('"'):
+            return self.basic_string()
+        if self.peek("'"):
+            return self.literal_string()
+        if self.peek('['):
+            return self.array()
+        if self.peek('{'):
+            return self.inline_table()
+        match = _SCALAR.match(self.text, self.pos)
+        if not match:
+            self.error("expected a value")
+        self.pos = match.end()
+        return self.scalar(match.group(0))
+
+    def scalar(self, token):
+        if token == 'true':
+            return True
+        if token == 'false':
+            return False
+        plain = token.replace('_', '')
+        try:
+            if plain.startswith(('0x', '0o', '0b')):
+                return int(plain, 0)
+            return int(plain)
+        except ValueError:
+            pass
+        try:
+            return float(plain)
+        except ValueError:
+            return token  # dates and times are kept as strings
+
+    def unescape(self, raw):
+        out = []
+        i = 0
+        while i < len(raw):
+            c = raw[i]
+            if c != '\\':
+                out.append(c)
+                i += 1
+                continue
+            nxt = raw[i + 1:i + 2]
+            if nxt in _ESCAPES:
+                out.append(_ESCAPES[nxt])
+                i += 2
+            elif nxt in ('u', 'U'):
+                width = 4 if nxt == 'u' else 8
+                out.append(chr(int(raw[i + 2:i + 2 + width], 16)))
+                i += 2 + width
+            elif nxt == '\n':
+                # Line-ending backslash in a multi-line string trims whitespace.
+                i += 2
+                while i < len(raw) and raw[i] in ' \t\n':
+                    i += 1
+            else:
+                self.error("invalid escape \\{}".format(nxt))
+        return "".join(out)
+
+    def basic_string(self):
+        i = self.pos + 1
+        while i < len(self.text):
+            c = self.text[i]
+            if c == '\\':
+                i += 2
+                continue
+            if c == '"':
+                raw = self.text[self.pos + 1:i]
+                self.pos = i + 1
+                return self.unescape(raw)
+            if c == '\n':
+                break
+            i += 1
+        self.error("unterminated string")
+
+    def literal_string(self):
+        end = self.text.find("'", self.pos + 1)
+        if end < 0 or '\n' in self.text[self.pos:end]:
+            self.error("unterminated string")
+        value = self.text[self.pos + 1:end]
+        self.pos = end + 1
+        return value
+
+    def multiline_string(self, quote, escapes):
+        start = self.pos + 3
+        end = self.text.find(quote, start)
+        if end < 0:
+            self.error("unterminated multi-line string")
+        raw = self.text[start:end]
+        self.pos = end + 3
+        if raw.startswith('\n'):
+            raw = raw[1:]
+        return self.unescape(raw) if escapes else raw
+
+    def array(self):
+        self.pos += 1
+        items = []
+        while True:
+            self.skip_blank()
+            if self.peek(']'):
+                self.pos += 1
+                return items
+            items.append(self.value())
+            self.skip_blank()
+            if self.peek(','):
+                self.pos += 1
+            elif not self.peek(']'):
+                self.error("expected ',' or ']' in array")
+
+    def inline_table(self):
+        self.pos += 1
+        table = {}
+        self.skip_space()
+        if self.peek('}'):
+            self.pos += 1
+            return table
+        while True:
+            keys = self.key_path('=')
+            self.pos += 1
+            self.skip_space()
+            self.walk(table, keys[:-1])[keys[-1]] = self.value()
+            self.skip_space()
+            if self.peek(','):
+                self.pos += 1
+            elif self.peek('}'):
+                self.pos += 1
+                return table
+            else:
+                self.error("expected ',' or '}' in inline table")
+
+
+def parse_toml(text):
+    if tomllib is not None:
+        try:
+            return tomllib.loads(text)
+        except tomllib.TOMLDecodeError as e:
+            raise ConfigError("invalid TOML: {}".format(e))
+    return _TomlParser(text).parse()
+
+
+def _toml_key(key):
+    return key if _BARE_KEY.match(key) and _BARE_KEY.match(key).end() == len(key) else json.dumps(key)
+
+
+def _toml_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, dict):
+        return "{{ {} }}".format(", ".join(
+            "{} = {}".format(_toml_key(k), _toml_value(v)) for k, v in value.items() if v is not None))
+    if isinstance(value, (list, tuple)):
+        return "[{}]".format(", ".join(_toml_value(v) for v in value))
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _is_table_array(value):
+    return isinstance(value, list) and bool(value) and all(isinstance(v, dict) for v in value)
+
+
+def _is_scalar(value):
+    return value is not None and not isinstance(value, dict) and not _is_table_array(value)
+
+
+def _dump_table(table, path, lines):
+    for key, value in table.items():
+        if _is_scalar(value):
+            lines.append("{} = {}".format(_toml_key(key), _toml_value(value)))
+    for key, value in table.items():
+        sub = path + [_toml_key(key)]
+        if isinstance(value, dict):
+            # A table holding only sub-tables needs no header of its own.
+            if not value or any(_is_scalar(v) for v in value.values()):
+                lines.append("")
+                lines.append("[{}]".format(".".join(sub)))
+            _dump_table(value, sub, lines)
+        elif _is_table_array(value):
+            for item in value:
+                lines.append("")
+                lines.append("[[{}]]".format(".".join(sub)))
+                _dump_table(item, sub, lines)
+
+
+def dump_toml(data):
+    """Serialize a config dict as TOML (comments in the original are not kept)."""
+    lines = []
+    _dump_table(data, [], lines)
+    return "\n".join(lines).strip("\n") + "\n"
+
+
+def toml_has_comments(text):
+    """True if `text` has a comment, which dump_toml() would drop."""
+    pos = 0
+    while pos < len(text):
+        c = text[pos]
+        if c == '#':
+            return True
+        if c in '"\'':
+            quote = c * 3 if text.startswith(c * 3, pos) else c
+            pos += len(quote)
+            while pos < len(text) and not text.startswith(quote, pos):
+                if text[pos] == '\n' and len(quote) == 1:
+                    break
+                # Only basic strings have escapes.
+                pos += 2 if c == '"' and text[pos] == '\\' else 1
+            pos += len(quote)
+        else:
+            pos += 1
+    return False
+
+
+# ---------------------------------------------------------------------------
+# drizzle.config.ts
+
+
+def _string_option(name, content):
+    match = re.search(r"{}:\s*['\"]([^'\"]+)['\"]".format(name), content)
+    return match.group(1) if match else None
+
+
+def parse_drizzle_config(text):
+    """Extract the string options of drizzle.config.ts with regular expressions."""
+    config = {}
+    for name in ('schema', 'out', 'dialect', 'driver'):
+        value = _string_option(name, text)
+        if value:
+            config[name] = value
+
+    creds = re.search(r"dbCredentials:\s*\{([^}]+)\}", text, re.DOTALL)
+    if creds:
+        for name in ('dbName', 'wranglerConfigPath'):
+            value = _string_option(name, creds.group(1))
+            if value:
+                config[name] = value
+    return config
+
+
+def parse_package_json(text):
+    try:
+        return json.loads(text)
+    except ValueError as e:
+        raise ConfigError("invalid package.json: {}".format(e))
+
+
+# ---------------------------------------------------------------------------
+# Memoized loading
+
+
+_CACHE = {}
+
+
+def load_file(path, parser):
+    """Parse a file with `parser`, reusing the last result while it is unchanged."""
+    path = os.path.abspath(str(path))
+    st = os.stat(path)
+    stamp = (st.st_mtime, st.st_size)
+    key = (path, parser)
+    entry = _CACHE.get(key)
+    if entry is None or entry['stamp'] != stamp:
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if entry is None or entry['digest'] != digest:
+            entry = {'digest': digest, 'value': parser(data.decode('utf-8'))}
+            _CACHE[key] = entry
+        entry['stamp'] = stamp
+    return copy.deepcopy(entry['value'])
+
+
+def wrangler_parser(path):
+    return parse_toml if str(path).endswith('.toml') else parse_jsonc
+
+
+class ProjectModel(object):
+    """Parsed view of a project's wrangler, drizzle and package.json files."""
+
+    def __init__(self, root):
+        self.root = str(root)
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def wrangler_path(self):
+        """Path of the first wrangler config found (JSONC preferred), or None."""
+        for name in WRANGLER_CONFIGS:
+            path = self.path(name)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def wrangler(self):
+        path = self.wrangler_path()
+        if path is None:
+            return None
+        return load_file(path, wrangler_parser(path))
+
+    def drizzle_path(self):
+        return self.path('drizzle.config.ts')
+
+    def drizzle(self):
+        path = self.drizzle_path()
+        return load_file(path, parse_drizzle_config) if os.path.isfile(path) else None
+
+    def package_json(self):
+        path = self.path('package.json')
+        return load_file(path, parse_package_json) if os.path.isfile(path) else None
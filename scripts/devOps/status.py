@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Status Output
+
+The colored status lines every devOps script prints:
+
+    + passed    x failed    ! warning    i info
+
+Used by check_drizzle_config.py, check_query_indexes.py,
+bench_d1_workload.py, log_retention.py, trace_analyzer.py and
+log_tailer.py.
+"""
+
+
+class Colors:
+    """ANSI color codes for terminal output."""
+    RED = '\033[0;31m'
+    GREEN = '\033[0;32m'
+    YELLOW = '\033[1;33m'
+    BLUE = '\033[0;34m'
+    NC = '\033[0m'  # No Color
+
+
+class Symbols:
+    """Symbols for status indicators."""
+    SUCCESS = '+'
+    ERROR = 'x'
+    WARNING = '!'
+    INFO = 'i'
+
+
+class StatusLog:
+    """Colored status lines shared by the devOps scripts.
+
+    Successes, errors and warnings are also kept in lists, for summaries and
+    exit codes; _record() sees every message and is a hook for subclasses.
+    """
+
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+        self.successes = []
+
+    def _record(self, level, message):
+        pass
+
+    def log_success(self, message):
+        """Log a successful check."""
+        print("{}{}{} {}".format(Colors.GREEN, Symbols.SUCCESS, Colors.NC, message))
+        self.successes.append(message)
+        self._record('success', message)
+
+    def log_error(self, message):
+        """Log an error."""
+        print("{}{}{} {}".format(Colors.RED, Symbols.ERROR, Colors.NC, message))
+        self.errors.append(message)
+        self._record('error', message)
+
+    def log_warning(self, message):
+        """Log a warning."""
+        print("{}{}{} {}".format(Colors.YELLOW, Symbols.WARNING, Colors.NC, message))
+        self.warnings.append(message)
+        self._record('warning', message)
+
+    def log_info(self, message):
+        """Log informational message."""
+        print("{}{}{} {}".format(Colors.BLUE, Symbols.INFO, Colors.NC, message))
+        self._record('info', message)
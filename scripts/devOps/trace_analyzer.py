@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Trace Critical-Path Analyzer
+
+Reads the traces and trace_events tables from a local SQLite export of D1
+(`wrangler d1 export`, or a database built by bench_d1_workload.py) and
+rebuilds one timeline per trace_id:
+
+- spans: traces rows, nested by parent_id. A trace_id with events but no
+  traces row (the agent logs events only) gets a synthetic root that spans
+  its first to last event.
+- steps: MarketScanWorkflow logs a `start_<step>` event before each
+  step.do(), so a step runs from its start event to the next one, or to
+  trace_end. Traces without start_ events get one step per action, lasting
+  until the next event.
+- Gemini calls: an action starting with `call_gemini` lasts until the next
+  event of the trace; when that event has a data.duration
+  (ai_analysis_complete), the call starts that long before it.
+
+The critical path of a span walks back from its end through the children
+that finished last and did not overlap, recursing into each. Time not
+covered by a child is the span's own time.
+
+Output:
+- a collapsed-stack file (`root;step;call <ms>`, one line per stack, summed
+  over all traces) for flamegraph.pl, speedscope or inferno
+- a JSON summary: p50/p95/max per span, step and Gemini call across runs,
+  how often and for how long each frame is on the critical path, and the
+  slowest traces with their critical paths
+"""
+
+import os
+import sys
+import re
+import json
+import argparse
+import datetime
+import itertools
+
+import d1_local
+from status import Colors, StatusLog
+
+
+STEP_PREFIX = 'start_'
+CALL_PREFIX = 'call_gemini'
+END_ACTIONS = ('trace_end',)
+SKIP_ACTIONS = ('trace_start', 'trace_end')
+
+
+def parse_time(value):
+    """Milliseconds since the epoch of an ISO timestamp, or None."""
+    if not value:
+        return None
+    text = str(value).rstrip('Z').replace(' ', 'T')
+    for fmt in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            stamp = datetime.datetime.strptime(text[:26], fmt)
+        except ValueError:
+            continue
+        return (stamp - datetime.datetime(1970, 1, 1)).total_seconds() * 1000.0
+    return None
+
+
+def stats(values):
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'p50_ms': d1_local.percentile(values, 50),
+        'p95_ms': d1_local.percentile(values, 95),
+        'max_ms': values[-1] if values else None,
+        'total_ms': sum(values),
+    }
+
+
+class Node(object):
+    """A span, step or call on a trace's timeline."""
+
+    def __init__(self, name, kind, start, end):
+        self.name = name
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.children = []
+
+    @property
+    def duration(self):
+        return max(0.0, self.end - self.start)
+
+    def frame(self):
+        return '{}:{}'.format(self.kind, self.name).replace(';', ':').replace(' ', '_')
+
+
+def critical_path(node):
+    """[(node, time on the path that is the node's own)] through `node`."""
+    path = []
+    covered = 0.0
+    cursor = node.end
+    chosen = []
+    for child in sorted(node.children, key=lambda c: c.end, reverse=True):
+        if child.end <= cursor + 1e-6 and child.start >= node.start - 1e-6:
+            chosen.append(child)
+            cursor = child.start
+    for child in reversed(chosen):
+        covered += child.duration
+        path.extend(critical_path(child))
+    path.insert(0, (node, max(0.0, node.duration - covered)))
+    return path
+
+
+def build_timeline(trace_id, spans, events):
+    """Root Node of one trace_id from its traces rows and ordered events."""
+    nodes = {}
+    for span in spans:
+        start = parse_time(span['start_time'])
+        if start is None:
+            continue
+        end = parse_time(span['end_time'])
+        if end is None and span['duration'] is not None:
+            end = start + float(span['duration'])
+        nodes[span['id']] = (span, Node(span['name'], 'span', start, end if end is not None else start))
+    roots = []
+    for span, node in nodes.values():
+        parent = nodes.get(span['parent_id'])
+        if parent:
+            parent[1].children.append(node)
+        else:
+            roots.append(node)
+
+    times = [parse_time(e['timestamp']) for e in events]
+    if times and None not in times:
+        first, last = times[0], times[-1]
+    else:
+        first = last = None
+    if not roots:
+        if first is None:
+            return None
+        # agent-message-1733000000000 -> agent-message
+        name = re.sub(r'[-_]\d+$', '', trace_id) or events[0]['component']
+        roots.append(Node(name, 'span', first, last))
+    root = min(roots, key=lambda n: n.start)
+    for other in roots:
+        if other is not root:
+            root.children.append(other)
+    if first is not None:
+        root.end = max(root.end, last)
+        attach_steps(root, events, times)
+    return root
+
+
+def attach_steps(root, events, times):
+    """Add step and Gemini call nodes under `root` from the trace's events."""
+    marked = any(e['action'].startswith(STEP_PREFIX) for e in events)
+    step = None
+    steps = []
+    for i, event in enumerate(events):
+        action = event['action']
+        at = times[i]
+        boundary = action.startswith(STEP_PREFIX) if marked else action not in SKIP_ACTIONS
+        if step and (boundary or action in END_ACTIONS):
+            step.end = at
+            step = None
+        call = action.startswith(CALL_PREFIX)
+        if boundary and not (call and not marked):
+            name = action[len(STEP_PREFIX):] if marked else action
+            step = Node(name, 'step', at, at)
+            steps.append(step)
+        if call and i + 1 < len(events):
+            # data.duration is measured around the call itself, so it ends
+            # at the next event and starts `duration` before it.
+            end = times[i + 1]
+            duration = _event_duration(events[i + 1])
+            start = max(at, end - duration) if duration is not None else at
+            (step or root).children.append(Node(action, 'gemini', start, end))
+    if step:
+        step.end = max(step.start, times[-1], root.end)
+    for s in steps:
+        if s.children:
+            s.end = max(s.end, max(c.end for c in s.children))
+        root.children.append(s)
+    root.end = max([root.end] + [s.end for s in steps])
+
+
+def _event_duration(event):
+    data = event.get('data')
+    if not data:
+        return None
+    try:
+        value = json.loads(data).get('duration')
+    except (ValueError, AttributeError):
+        return None
+    return float(value) if isinstance(value, (int, float)) else None
+
+
+def _stacks(node, prefix, collapsed):
+    frame = prefix + [node.frame()]
+    own = node.duration - sum(min(c.duration, node.duration) for c in node.children)
+    key = ';'.join(frame)
+    collapsed[key] = collapsed.get(key, 0.0) + max(0.0, own)
+    for child in node.children:
+        _stacks(child, frame, collapsed)
+
+
+def _walk(node):
+    yield node
+    for child in node.children:
+        for n in _walk(child):
+            yield n
+
+
+class TraceAnalyzer(StatusLog):
+    """Aggregates span trees, steps and Gemini calls over many traces."""
+
+    def __init__(self, top=10):
+        StatusLog.__init__(self)
+        self.top = top
+        self.traces = 0
+        self.durations = {}
+        self.critical = {}
+        self.collapsed = {}
+        self.slowest = []
+
+    def add(self, trace_id, root):
+        self.traces += 1
+        for node in _walk(root):
+            key = (node.kind, node.name)
+            self.durations.setdefault(key, []).append(node.duration)
+        path = critical_path(root)
+        seen = set()
+        for node, own in path:
+            entry = self.critical.setdefault(node.frame(), {'traces': 0, 'own_ms': 0.0})
+            if node.frame() not in seen:
+                entry['traces'] += 1
+                seen.add(node.frame())
+            entry['own_ms'] += own
+        _stacks(root, [], self.collapsed)
+
+        self.slowest.append((root.duration, trace_id, [
+            {'frame': node.frame(), 'duration_ms': node.duration, 'own_ms': own} for node, own in path]))
+        if len(self.slowest) > self.top * 4:
+            self.slowest = sorted(self.slowest, key=lambda s: -s[0])[:self.top]
+
+    def summary(self):
+        total = sum(e['own_ms'] for e in self.critical.values()) or 1.0
+        by_kind = {}
+        for (kind, name), values in sorted(self.durations.items()):
+            by_kind.setdefault(kind, {})[name] = stats(values)
+        return {
+            'traces': self.traces,
+            'spans': by_kind.get('span', {}),
+            'steps': by_kind.get('step', {}),
+            'gemini_calls': by_kind.get('gemini', {}),
+            'critical_path': dict((frame, {'traces': e['traces'], 'own_ms': e['own_ms'],
+                                           'share': e['own_ms'] / total})
+                                  for frame, e in sorted(self.critical.items(), key=lambda i: -i[1]['own_ms'])),
+            'slowest': [{'trace_id': trace_id, 'duration_ms': duration, 'critical_path': path}
+                        for duration, trace_id, path in sorted(self.slowest, key=lambda s: -s[0])[:self.top]],
+        }
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as f:
+            for stack, ms in sorted(self.collapsed.items()):
+                value = int(round(ms))
+                if value > 0:
+                    f.write('{} {}\n'.format(stack, value))
+
+
+def read_traces(conn, since=None, component=None):
+    """(trace_id, spans, events) per trace_id, streamed in trace_id order."""
+    filters = []
+    params = []
+    if since:
+        filters.append('trace_id IN (SELECT trace_id FROM trace_events WHERE timestamp >= ?)')
+        params.append(since)
+    if component:
+        filters.append('trace_id IN (SELECT trace_id FROM trace_events WHERE component = ?)')
+        params.append(component)
+    where = ' WHERE ' + ' AND '.join(filters) if filters else ''
+
+    def rows(sql):
+        cursor = conn.execute(sql.format(where=where), params)
+        names = [d[0] for d in cursor.description]
+        for row in cursor:
+            yield dict(zip(names, row))
+
+    spans = itertools.groupby(rows(
+        "SELECT id, trace_id, parent_id, name, component, start_time, end_time, duration "
+        "FROM traces{where} ORDER BY trace_id, start_time"), key=lambda r: r['trace_id'])
+    events = itertools.groupby(rows(
+        "SELECT id, trace_id, timestamp, component, action, data "
+        "FROM trace_events{where} ORDER BY trace_id, timestamp, id"), key=lambda r: r['trace_id'])
+
+    # Merge the two sorted streams on trace_id.
+    span_item = next(spans, None)
+    event_item = next(events, None)
+    while span_item or event_item:
+        span_id = span_item[0] if span_item else None
+        event_id = event_item[0] if event_item else None
+        if event_item is None or (span_item and span_id < event_id):
+            yield span_id, list(span_item[1]), []
+            span_item = next(spans, None)
+        elif span_item is None or event_id < span_id:
+            yield event_id, [], list(event_item[1])
+            event_item = next(events, None)
+        else:
+            yield span_id, list(span_item[1]), list(event_item[1])
+            span_item = next(spans, None)
+            event_item = next(events, None)
+
+
+def print_summary(summary):
+    def table(title, entries):
+        if not entries:
+            return
+        print("\n{}{}{}".format(Colors.BLUE, title, Colors.NC))
+        print("  {:<40} {:>7} {:>10} {:>10} {:>10}".format('name', 'count', 'p50 ms', 'p95 ms', 'max ms'))
+        for name, s in sorted(entries.items(), key=lambda i: -i[1]['total_ms']):
+            print("  {:<40} {:>7} {:>10.1f} {:>10.1f} {:>10.1f}".format(
+                name[:40], s['count'], s['p50_ms'], s['p95_ms'], s['max_ms']))
+
+    table('Spans', summary['spans'])
+    table('Steps', summary['steps'])
+    table('Gemini calls', summary['gemini_calls'])
+    print("\n{}Critical path{}".format(Colors.BLUE, Colors.NC))
+    print("  {:<40} {:>7} {:>12} {:>7}".format('frame', 'traces', 'own ms', 'share'))
+    for frame, c in list(summary['critical_path'].items())[:15]:
+        print("  {:<40} {:>7} {:>12.1f} {:>6.1f}%".format(frame[:40], c['traces'], c['own_ms'], c['share'] * 100))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild span trees from a local D1 export and report "
+                                                 "critical paths, step and Gemini call timings")
+    parser.add_argument("db", help="SQLite export of the D1 database")
+    parser.add_argument("--since", help="Only traces with events at or after this ISO timestamp")
+    parser.add_argument("--component", help="Only traces with events from this component, "
+                                            "e.g. MarketScanWorkflow")
+    parser.add_argument("--collapsed", default="traces.folded",
+                        help="Collapsed-stack output for flamegraph tools (default: traces.folded)")
+    parser.add_argument("--json", default="trace-summary.json",
+                        help="JSON summary output (default: trace-summary.json)")
+    parser.add_argument("--top", type=int, default=10, help="Slowest traces to include (default: 10)")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.db):
+        parser.error("{} does not exist".format(args.db))
+    conn = d1_local.connect(args.db)
+    missing = [t for t in ('traces', 'trace_events') if t not in d1_local.tables(conn)]
+    if missing:
+        parser.error("{} has no {} table".format(args.db, ' or '.join(missing)))
+
+    print("\n{}Trace Critical-Path Analyzer{}".format(Colors.BLUE, Colors.NC))
+    print("=" * 50)
+    analyzer = TraceAnalyzer(top=args.top)
+    skipped = 0
+    for trace_id, spans, events in read_traces(conn, args.since, args.component):
+        root = build_timeline(trace_id, spans, events)
+        if root is None:
+            skipped += 1
+            continue
+        analyzer.add(trace_id, root)
+    conn.close()
+
+    if not analyzer.traces:
+        analyzer.log_warning("No traces found")
+        return 1
+    analyzer.log_info("Analyzed {} traces".format(analyzer.traces))
+    if skipped:
+        analyzer.log_warning("Skipped {} traces without usable timestamps".format(skipped))
+    summary = analyzer.summary()
+    print_summary(summary)
+
+    print("")
+    analyzer.write_collapsed(args.collapsed)
+    analyzer.log_success("Wrote collapsed stacks to {}".format(args.collapsed))
+    with open(args.json, 'w') as f:
+        json.dump(summary, f, indent=2)
+    analyzer.log_success("Wrote summary to {}".format(args.json))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
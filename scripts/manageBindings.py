@@ -13,9 +13,14 @@ Supports:
 import argparse
 import json
 import os
+import sys
 from pathlib import Path
 from datetime import datetime
 
+sys.path.insert(0, str(Path(__file__).resolve().parent / "devOps"))
+
+from project_model import ProjectModel, dump_toml, toml_has_comments
+
 try:
     from rich import print
     from rich.prompt import Prompt, Confirm
@@ -28,18 +33,17 @@ except ImportError:
 
 console = Console()
 
-WRANGLER_CONFIGS = ["wrangler.jsonc", "wrangler.toml"]
 DEFAULT_CONFIG = "wrangler.jsonc"
 BACKUP_DIR = Path("scripts/bindings_backup")
 BACKUP_DIR.mkdir(parents=True, exist_ok=True)
 
 
 def load_existing_config():
-    """Load existing wrangler configuration if it exists."""
-    for cfg in WRANGLER_CONFIGS:
-        if Path(cfg).exists():
-            with open(cfg, "r") as f:
-                return json.load(f), cfg
+    """Load existing wrangler configuration (JSONC or TOML) if it exists."""
+    model = ProjectModel(".")
+    path = model.wrangler_path()
+    if path:
+        return model.wrangler(), os.path.basename(path)
     return None, DEFAULT_CONFIG
 
 
@@ -48,14 +52,33 @@ def save_backup(config):
     now = datetime.utcnow().isoformat().replace(":", "-")
     backup_path = BACKUP_DIR / f"bindings_{now}.json"
     with open(backup_path, "w") as f:
-        json.dump(config, f, indent=2)
+        json.dump(config, f, indent=2, default=str)
     console.print(f":floppy_disk: Backup saved to [green]{backup_path}[/green]")
 
 
 def save_config(config, path):
-    """Save configuration to the wrangler config file."""
-    with open(path, "w") as f:
-        json.dump(config, f, indent=2)
+    """Save configuration to the wrangler config file in its own format.
+
+    Rewriting a TOML file drops its comments, so a commented wrangler.toml is
+    left alone and the new configuration goes to <path>.new instead.
+    """
+    if str(path).endswith(".toml"):
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                commented = toml_has_comments(f.read())
+            if commented:
+                new_path = f"{path}.new"
+                with open(new_path, "w") as f:
+                    f.write(dump_toml(config))
+                console.print(f"[yellow]:warning: {path} has comments that rewriting it would drop; "
+                              f"wrote the new configuration to {new_path} instead. "
+                              f"Copy the changes over by hand.[/yellow]")
+                return
+        with open(path, "w") as f:
+            f.write(dump_toml(config))
+    else:
+        with open(path, "w") as f:
+            json.dump(config, f, indent=2)
     console.print(f":gear: Updated [yellow]{path}[/yellow]")
 
 
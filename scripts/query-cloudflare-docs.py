@@ -1,23 +1,95 @@
 #!/usr/bin/env python3
 
+import io
 import os
 import json
 import argparse
-import requests
+import cProfile
+import hashlib
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
 from pathlib import Path
 from rich import print
+from rich.console import Console
+from rich.table import Table
 from rich.tree import Tree
 from rich.prompt import Prompt
-from datetime import datetime
+
+from cfdocs.batching import (PrefixTracker, batch_message, group_questions, project_prefix,
+                             split_batch_answer)
+from cfdocs.code_search import CodeSearchIndex
+from cfdocs.file_index import ProjectFileIndex
+from cfdocs.hedging import Deadline, Hedger
+from cfdocs.metrics import Metrics
+from cfdocs.prompt import (compact_tree, estimate_tokens, format_snippets, legacy_prompt_size,
+                           normalize_highlights, read_snippets, render_compact)
+from cfdocs.query_log import QueryLog
+from cfdocs.questions import Checkpoint, iter_questions, question_key
+from cfdocs.rate_limit import RateGovernor
+from cfdocs.response_cache import ResponseCache
+from cfdocs.result_archive import ResultArchive
+from cfdocs.similarity import SimilarityIndex
+from cfdocs.snippets import SnippetReader, merge_ranges
+from cfdocs.streaming import read_chat_stream
+from cfdocs.transport import DeadlineExceeded, Transport
 
 # Configs
 CF_MODEL = "@cf/openai/gpt-oss-120b"
-CF_API_URL = "https://openai-api-worker.hacolby.workers.dev/v1/chat/completions"
-MCP_API_URL = "https://docs.mcp.cloudflare.com/mcp"
+# Endpoints and the log directory can be overridden from the environment,
+# e.g. by scripts/bench-query-cloudflare-docs.py pointing them at local stubs.
+CF_API_URL = os.getenv("CFDOCS_WORKER_URL", "https://openai-api-worker.hacolby.workers.dev/v1/chat/completions")
+MCP_API_URL = os.getenv("CFDOCS_MCP_URL", "https://docs.mcp.cloudflare.com/mcp")
 DEV_VARS_PATH = Path(".dev.vars")
-LOG_DIR = Path("docs/cloudflare-docs")
+LOG_DIR = Path(os.getenv("CFDOCS_LOG_DIR", "docs/cloudflare-docs"))
 LOG_DIR.mkdir(parents=True, exist_ok=True)
-QUERY_LOG_PATH = LOG_DIR / "query-log.json"
+QUERY_LOG_PATH = LOG_DIR / "query-log.jsonl"
+QUERY_LOG_INDEX_PATH = LOG_DIR / "query-log.idx.sqlite"
+# Pre-JSONL log, imported once into QUERY_LOG_PATH and the export format.
+LEGACY_QUERY_LOG_PATH = LOG_DIR / "query-log.json"
+FILE_INDEX_PATH = LOG_DIR / "file-index.json"
+CODE_INDEX_PATH = LOG_DIR / "code-index.json"
+RESPONSE_CACHE_PATH = LOG_DIR / "response-cache.sqlite"
+RESULT_ARCHIVE_PATH = LOG_DIR / "results.sqlite"
+# Similarity index over archived questions; written as .npz + .json.
+SIMILARITY_INDEX_PATH = LOG_DIR / "similarity-index"
+METRICS_JSON_PATH = LOG_DIR / "metrics.json"
+METRICS_PROM_PATH = LOG_DIR / "metrics.prom"
+
+# Shared by every Worker AI / MCP call; main() resizes it to --concurrency.
+TRANSPORT = Transport()
+# Built once per run by load_file_index().
+FILE_INDEX = None
+# BM25 index over src/, worker/ and scripts/, built on the first question
+# without relevant_code_files.
+CODE_INDEX = None
+CODE_INDEX_LOCK = threading.Lock()
+CODE_TOP_K = 5
+SNIPPET_READER = SnippetReader()
+METRICS = Metrics()
+# Set up by main() unless --no-cache is given.
+RESPONSE_CACHE = None
+# --stream: request SSE completions; tokens are echoed only when one question
+# is in flight, otherwise concurrent streams would interleave on stdout.
+STREAM = False
+STREAM_ECHO = False
+# --hedge / --deadline
+HEDGER = None
+QUESTION_DEADLINE = None
+# --compact-prompt / --token-budget
+COMPACT_PROMPT = False
+TOKEN_BUDGET = None
+# --stable-prefix / --batch-size: system message shared by every rewrite call.
+PROJECT_PREFIX = None
+PREFIX_TRACKER = PrefixTracker()
+# --similar-threshold: near-duplicates reuse (or seed from) an archived result.
+RESULT_ARCHIVE = None
+SIMILARITY_INDEX = None
+SIMILAR_THRESHOLD = None
+SIMILAR_MODE = "reuse"
 
 
 def load_env_token():
@@ -29,124 +101,730 @@ def load_env_token():
     return os.getenv("CF_API_KEY")
 
 
+def load_file_index():
+    global FILE_INDEX
+    if FILE_INDEX is None:
+        FILE_INDEX = ProjectFileIndex.open(".", cache_path=FILE_INDEX_PATH,
+                                           extra_excludes=[f"/{LOG_DIR.as_posix()}/"])
+    return FILE_INDEX
+
+
+def load_code_index():
+    global CODE_INDEX
+    with CODE_INDEX_LOCK:
+        if CODE_INDEX is None:
+            start = time.perf_counter()
+            CODE_INDEX = CodeSearchIndex.open(load_file_index().files, cache_path=CODE_INDEX_PATH)
+            elapsed = time.perf_counter() - start
+            METRICS.observe("code_index_build", elapsed)
+            print(f"[cyan]Code index: {len(CODE_INDEX.spans)} spans from {len(CODE_INDEX.files)} files "
+                  f"({CODE_INDEX.reindexed} reindexed) in {elapsed:.2f}s[/cyan]")
+    return CODE_INDEX
+
+
+def auto_code_files(q):
+    """Pick relevant_code_files for a question that has none."""
+    index = load_code_index()
+    text = " ".join([q["query"]] + q.get("tags", []) + q.get("cloudflare_bindings_involved", [])
+                    + q.get("node_libs_involved", []))
+    with METRICS.timer("code_search"):
+        files = index.search(text, CODE_TOP_K)
+    picked = ", ".join(f"{f['file_path']}:{f['start_line']}-{f['end_line']}" for f in files)
+    print(f"[dim]Code search for {q['query'][:60]!r}: {picked or 'no matches'}[/dim]")
+    return files
+
+
 def render_tree(highlights):
+    highlighted = {os.path.normpath(h["file_path"]) for h in highlights}
     tree = Tree("[bold cyan]Project Root[/bold cyan]")
-    for path in sorted(Path(".").rglob("*")):
-        if path.is_file():
-            rel = str(path.relative_to("."))
-            if any(h["file_path"] == rel for h in highlights):
-                tree.add(f"[bold green]{rel}[/bold green]")
-            else:
-                tree.add(rel)
+    for rel in load_file_index().files:
+        if rel in highlighted:
+            tree.add(f"[bold green]{rel}[/bold green]")
+        else:
+            tree.add(rel)
     return tree
 
 
+def tree_text(tree):
+    """Render a rich Tree as plain text for embedding in a prompt."""
+    buf = io.StringIO()
+    Console(file=buf, width=200, color_system=None).print(tree)
+    return buf.getvalue()
+
+
 def extract_snippets(files):
     snippets = []
-    for f in files:
+    for f in merge_ranges(files):
         try:
-            with open(f["file_path"]) as src:
-                lines = src.readlines()
-                snippet = "".join(lines[f["start_line"] - 1:f["end_line"]])
-                snippets.append({
-                    "file_path": f["file_path"],
-                    "code": snippet,
-                    "relation": f["relation_to_question"]
-                })
+            snippet = SNIPPET_READER.read(f["file_path"], f["start_line"], f["end_line"])
+            snippets.append({
+                "file_path": f["file_path"],
+                "code": snippet,
+                "relation": f["relation_to_question"]
+            })
         except Exception as e:
             print(f"[red]Error reading {f['file_path']}: {e}[/red]")
     return snippets
 
 
-def build_prompt_block(q):
-    tree = render_tree(q["relevant_code_files"])
-    print(tree)
-    code_context = extract_snippets(q["relevant_code_files"])
-    return {
-        "role": "user",
-        "content": f"""
+def prompt_header(q):
+    return f"""
 You are preparing a question for the Cloudflare Docs MCP API.
 
 Original Query: {q['query']}
-Cloudflare Bindings: {', '.join(q['cloudflare_bindings_involved'])}
-Node Libraries: {', '.join(q['node_libs_involved'])}
-Tags: {', '.join(q['tags'])}
+Cloudflare Bindings: {', '.join(q.get('cloudflare_bindings_involved', []))}
+Node Libraries: {', '.join(q.get('node_libs_involved', []))}
+Tags: {', '.join(q.get('tags', []))}
+"""
+
+
+PROMPT_FOOTER = "Please rewrite the question for MCP with full context and formal technical phrasing.\n"
+
+
+def build_compact_prompt_block(q):
+    """Build the --compact-prompt variant of build_prompt_block's message."""
+    files = load_file_index().files
+    highlighted = normalize_highlights(q["relevant_code_files"])
+    with METRICS.timer("extract_snippets"):
+        snippets = read_snippets(q["relevant_code_files"], SNIPPET_READER)
+    header = prompt_header(q)
+    before = (len(header) + len(PROMPT_FOOTER) + legacy_prompt_size(files, snippets) + 3) // 4
+    with METRICS.timer("render_tree"):
+        tree, content = render_compact(header, PROMPT_FOOTER, files, highlighted,
+                                       snippets, TOKEN_BUDGET)
+    after = estimate_tokens(content)
+    METRICS.add("prompt_tokens_before_compaction", before)
+    METRICS.add("prompt_tokens_after_compaction", after)
+    print(f"[dim]Prompt for {q['query'][:60]!r}: ~{before} -> ~{after} tokens[/dim]")
+    return tree, {"role": "user", "content": content}
 
+
+def build_prefixed_prompt_block(q):
+    """Question-specific half of the --stable-prefix layout.
+
+    The project tree lives in PROJECT_PREFIX, so this message only names the
+    relevant files and carries their snippets.
+    """
+    highlighted = sorted(normalize_highlights(q["relevant_code_files"]))
+    with METRICS.timer("extract_snippets"):
+        if COMPACT_PROMPT:
+            snippets = format_snippets(read_snippets(q["relevant_code_files"], SNIPPET_READER))
+        else:
+            snippets = json.dumps(extract_snippets(q["relevant_code_files"]), indent=2)
+    files = "\n".join(f"- {path}" for path in highlighted)
+    content = (f"{prompt_header(q)}\nRelevant Files:\n{files}\n\n"
+               f"Relevant Code Snippets:\n{snippets}\n\n{PROMPT_FOOTER}")
+    return files, {"role": "user", "content": content}
+
+
+def build_project_prefix():
+    files = load_file_index().files
+    if COMPACT_PROMPT:
+        tree = compact_tree(files, set())
+    else:
+        tree = "\n".join(files) + "\n"
+    return project_prefix(tree)
+
+
+def build_prompt_block(q):
+    if not q.get("relevant_code_files"):
+        q = dict(q, relevant_code_files=auto_code_files(q))
+    if PROJECT_PREFIX is not None:
+        return build_prefixed_prompt_block(q)
+    if COMPACT_PROMPT:
+        return build_compact_prompt_block(q)
+    with METRICS.timer("render_tree"):
+        tree = render_tree(q["relevant_code_files"])
+    with METRICS.timer("extract_snippets"):
+        code_context = extract_snippets(q["relevant_code_files"])
+    return tree, {
+        "role": "user",
+        "content": f"""{prompt_header(q)}
 Relevant Code Snippets:
 {json.dumps(code_context, indent=2)}
 
 Folder Structure Highlighting Relevant Files:
-{tree}
+{tree_text(tree)}
 
-Please rewrite the question for MCP with full context and formal technical phrasing.
-"""
+{PROMPT_FOOTER}"""
     }
 
 
-def query_worker_ai(payload):
+def echo_token(token):
+    sys.stdout.write(token)
+    sys.stdout.flush()
+
+
+def record_call(endpoint, body, data):
+    """Count request/response bytes and, for completions, tokens.
+
+    Token counts come from the response's usage block when present and are
+    otherwise estimated at four bytes per token.
+    """
+    request_bytes = len(json.dumps(body))
+    response_bytes = len(json.dumps(data))
+    METRICS.add(f"{endpoint}_calls")
+    METRICS.add(f"{endpoint}_request_bytes", request_bytes)
+    METRICS.add(f"{endpoint}_response_bytes", response_bytes)
+    if "messages" in body:
+        usage = data.get("usage") if isinstance(data, dict) else None
+        if usage:
+            METRICS.add(f"{endpoint}_prompt_tokens", usage.get("prompt_tokens", 0))
+            METRICS.add(f"{endpoint}_completion_tokens", usage.get("completion_tokens", 0))
+            cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+            if cached:
+                METRICS.add(f"{endpoint}_cached_prompt_tokens", cached)
+        else:
+            METRICS.add(f"{endpoint}_prompt_tokens", request_bytes // 4)
+            METRICS.add(f"{endpoint}_completion_tokens", response_bytes // 4)
+            METRICS.add(f"{endpoint}_estimated_token_counts")
+
+
+def fetch(endpoint, url, body, headers, until=None):
+    """Send one request and return (ok, data)."""
+    stream = body.get("stream", False)
+    started = time.perf_counter()
+    resp = TRANSPORT.post(endpoint, url, json=body, headers=headers or {}, stream=stream,
+                          cost_tokens=len(json.dumps(body)) // 4, deadline=until)
+    if stream and resp.ok:
+        data = read_chat_stream(resp, started, on_token=echo_token if STREAM_ECHO else None)
+        timing = data["timing"]
+        if timing["time_to_first_token"] is not None:
+            METRICS.observe(f"{endpoint}_ttft", timing["time_to_first_token"])
+        METRICS.observe(f"{endpoint}_stream_total", timing["total"])
+        if STREAM_ECHO and timing["time_to_first_token"] is not None:
+            echo_token("\n")
+            print(f"[dim]{endpoint}: first token {timing['time_to_first_token']:.2f}s, "
+                  f"total {timing['total']:.2f}s[/dim]")
+    else:
+        data = resp.json()
+    return resp.ok, data
+
+
+def cached_post(endpoint, url, model, body, headers=None, until=None):
+    """POST body to url as JSON, going through the response cache when enabled.
+
+    Bodies with "stream": true are read as SSE and assembled into a regular
+    completion. `until` is the time.monotonic() deadline for the call. Only
+    2xx responses are stored, so failures are retried on the next run.
+    """
+    key = None
+    if RESPONSE_CACHE is not None:
+        key = ResponseCache.key(url, model, body)
+        cached = RESPONSE_CACHE.get(key)
+        if cached is not None:
+            return cached
+
+    if HEDGER is not None:
+        ok, data = HEDGER.call(endpoint, lambda: fetch(endpoint, url, body, headers, until), until)
+    else:
+        ok, data = fetch(endpoint, url, body, headers, until)
+    record_call(endpoint, body, data)
+    if key is not None and ok:
+        RESPONSE_CACHE.put(key, endpoint, data)
+    return data
+
+
+def query_worker_ai(payload, until=None, system=None):
     token = load_env_token()
     headers = {"Authorization": f"Bearer {token}"} if token else {}
+    messages = [payload]
+    if system is not None:
+        PREFIX_TRACKER.record(system)
+        messages = [system, payload]
     body = {
         "model": CF_MODEL,
-        "messages": [payload]
+        "messages": messages
     }
-    resp = requests.post(CF_API_URL, json=body, headers=headers)
-    return resp.json()
+    if STREAM:
+        body["stream"] = True
+        body["stream_options"] = {"include_usage": True}
+    return cached_post("worker_ai", CF_API_URL, CF_MODEL, body, headers, until)
 
 
-def query_mcp(prompt):
-    return requests.post(MCP_API_URL, json={"prompt": prompt}).json()
+def query_mcp(prompt, until=None):
+    return cached_post("mcp", MCP_API_URL, None, {"prompt": prompt}, until=until)
 
 
-def save_log(log):
-    timestamp = datetime.utcnow().isoformat()
-    file_path = LOG_DIR / f"mcp_result_{timestamp}.json"
-    with open(file_path, "w") as f:
-        json.dump(log, f, indent=2)
-    print(f"[green]Saved to {file_path}[/green]")
-    return file_path
+def open_query_log():
+    return QueryLog(QUERY_LOG_PATH, QUERY_LOG_INDEX_PATH, legacy_path=LEGACY_QUERY_LOG_PATH)
 
 
-def append_query_log(entry):
-    if QUERY_LOG_PATH.exists():
-        with open(QUERY_LOG_PATH) as f:
-            data = json.load(f)
-    else:
-        data = []
-    data.append(entry)
-    with open(QUERY_LOG_PATH, "w") as f:
-        json.dump(data, f, indent=2)
+def follow_up_prompt(q, mcp_resp):
+    return {
+        "role": "user",
+        "content": f"Original Query: {q['query']}\nMCP Response: {mcp_resp}"
+    }
+
+
+def find_similar(q):
+    """(score, archived result) for a near-duplicate of q, or None."""
+    if SIMILARITY_INDEX is None:
+        return None
+    with METRICS.timer("similarity_lookup"):
+        match = SIMILARITY_INDEX.nearest(q["query"])
+    if match is None or match[0] < SIMILAR_THRESHOLD:
+        return None
+    stored = RESULT_ARCHIVE.get(match[1])
+    return (match[0], stored) if stored else None
+
+
+def process_similar(q, match):
+    """Answer q from a near-duplicate archived result.
+
+    In "reuse" mode the stored responses are returned as they are. In "seed"
+    mode the stored MCP response is kept and only the Worker AI follow-up is
+    run again for the new wording.
+    """
+    score, stored = match
+    source = {"result_id": stored["id"], "query": stored["original"]["query"],
+              "similarity": round(score, 4)}
+    tree = f"Similar to archived result {stored['id']} ({score:.3f}): {source['query']}"
+    if SIMILAR_MODE == "reuse":
+        METRICS.add("similar_reused")
+        summary = {"original": q}
+        for field in ("prompt", "worker_first", "mcp_response", "worker_second"):
+            summary[field] = stored.get(field)
+        summary["reused_from"] = source
+        return tree, summary
+
+    METRICS.add("similar_seeded")
+    deadline = Deadline(QUESTION_DEADLINE) if QUESTION_DEADLINE else None
+    with METRICS.timer("question"):
+        try:
+            with METRICS.timer("worker_ai_follow_up"):
+                follow_ups = query_worker_ai(
+                    follow_up_prompt(q, stored["mcp_response"]),
+                    deadline.until("worker_ai_follow_up") if deadline else None)
+        except DeadlineExceeded as e:
+            return tree, {"original": q, "deadline_exceeded": str(e)}
+    summary = {
+        "original": q,
+        "prompt": None,
+        "worker_first": stored.get("worker_first"),
+        "mcp_response": stored["mcp_response"],
+        "worker_second": follow_ups,
+        "seeded_from": source,
+    }
+    return tree, summary
+
+
+def process_question(q, rewritten=None):
+    """Run the Worker AI -> MCP -> Worker AI chain for a single question.
+
+    `rewritten` is an optional (tree, prompt, first_worker_resp) produced by
+    a batched rewrite, in which case only MCP and the follow-up are run.
+    With --deadline, a question that runs out of time returns a summary with
+    a "deadline_exceeded" key instead of raising.
+    """
+    deadline = Deadline(QUESTION_DEADLINE) if QUESTION_DEADLINE else None
+
+    def until(stage):
+        return deadline.until(stage) if deadline else None
+
+    with METRICS.timer("question"):
+        if rewritten:
+            tree, prompt, first_worker_resp = rewritten
+        else:
+            tree, prompt = build_prompt_block(q)
+            first_worker_resp = None
+        try:
+            if first_worker_resp is None:
+                with METRICS.timer("worker_ai_rewrite"):
+                    first_worker_resp = query_worker_ai(prompt, until("worker_ai_rewrite"),
+                                                        system=PROJECT_PREFIX)
+                METRICS.add("worker_ai_rewrite_round_trips")
+            with METRICS.timer("mcp"):
+                mcp_resp = query_mcp(first_worker_resp["choices"][0]["message"]["content"],
+                                     until("mcp"))
+
+            with METRICS.timer("worker_ai_follow_up"):
+                follow_ups = query_worker_ai(follow_up_prompt(q, mcp_resp),
+                                             until("worker_ai_follow_up"))
+        except DeadlineExceeded as e:
+            return tree, {"original": q, "deadline_exceeded": str(e)}
+
+    summary = {
+        "original": q,
+        "prompt": prompt,
+        "worker_first": first_worker_resp,
+        "mcp_response": mcp_resp,
+        "worker_second": follow_ups
+    }
+    return tree, summary
+
+
+def process_batch(unit):
+    """Rewrite a batch of questions in one completion, then finish each one.
+
+    Returns (seq, question, tree, summary) for every (seq, question) in unit.
+    Near-duplicates of archived questions are answered by process_similar
+    and left out of the batch.
+    """
+    results = []
+    fresh = []
+    for seq, q in unit:
+        match = find_similar(q)
+        if match:
+            results.append((seq, q, *process_similar(q, match)))
+        else:
+            fresh.append((seq, q))
+    unit = fresh
+    if len(unit) <= 1:
+        results.extend((seq, q, *process_question(q)) for seq, q in unit)
+        return results
+
+    built = [build_prompt_block(q) for _, q in unit]
+    with METRICS.timer("worker_ai_rewrite_batch"):
+        batch_resp = query_worker_ai(batch_message([prompt for _, prompt in built]),
+                                     system=PROJECT_PREFIX)
+    METRICS.add("worker_ai_rewrite_round_trips")
+    METRICS.add("worker_ai_batched_questions", len(unit))
+    try:
+        answer = batch_resp["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        answer = ""
+    sections = split_batch_answer(answer, len(unit))
+
+    for i, ((seq, q), (tree, prompt), section) in enumerate(zip(unit, built, sections)):
+        if section is None:
+            # Not found in the batched answer; rewrite this one on its own.
+            METRICS.add("worker_ai_batch_fallbacks")
+            results.append((seq, q, *process_question(q, (tree, prompt, None))))
+            continue
+        first = {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": section}}],
+            "batch": {"size": len(unit), "index": i + 1, "response": batch_resp},
+        }
+        results.append((seq, q, *process_question(q, (tree, prompt, first))))
+    return results
+
+
+def run_pipeline(questions, concurrency=1, batch_size=1):
+    """Yield (question, tree, summary) per question in input order.
+
+    With concurrency > 1 up to that many units (single questions, or batches
+    with --batch-size) are in flight at once on a thread pool; each question
+    still makes its calls in order, and results are handed back in the order
+    the questions were read.
+    """
+    units = group_questions(enumerate(questions), batch_size)
+    ready = {}
+    next_seq = 0
+
+    def drain(results):
+        nonlocal next_seq
+        for seq, *result in results:
+            ready[seq] = result
+        while next_seq in ready:
+            yield tuple(ready.pop(next_seq))
+            next_seq += 1
+
+    if concurrency <= 1:
+        for unit in units:
+            yield from drain(process_batch(unit))
+        return
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = deque()
+        for unit in units:
+            pending.append(pool.submit(process_batch, unit))
+            if len(pending) >= concurrency:
+                yield from drain(pending.popleft().result())
+        while pending:
+            yield from drain(pending.popleft().result())
+
+
+def print_stage_table(stages):
+    table = Table(title="Stage latency (seconds)")
+    for column in ("stage", "count", "p50", "p95", "p99", "total"):
+        table.add_column(column, justify="left" if column == "stage" else "right")
+    for stage, st in sorted(stages.items(), key=lambda item: -item[1]["total"]):
+        table.add_row(stage, str(st["count"]), f"{st['p50']:.3f}", f"{st['p95']:.3f}",
+                      f"{st['p99']:.3f}", f"{st['total']:.2f}")
+    print(table)
 
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("input_json", help="Path to questions JSON file")
+    parser.add_argument("input_json", nargs="?",
+                        help="Path to questions file (JSON array, or JSONL with one question per line)")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Number of questions to process in parallel (default: 1)")
+    parser.add_argument("--worker-timeout", type=float, default=120,
+                        help="Read timeout in seconds for Worker AI calls (default: 120)")
+    parser.add_argument("--mcp-timeout", type=float, default=60,
+                        help="Read timeout in seconds for MCP calls (default: 60)")
+    parser.add_argument("--max-retries", type=int, default=4,
+                        help="Retries on 429/5xx or connection errors (default: 4)")
+    parser.add_argument("--worker-rpm", type=float,
+                        help="Max Worker AI requests per minute (default: unlimited)")
+    parser.add_argument("--worker-tpm", type=float,
+                        help="Max estimated Worker AI prompt tokens per minute (default: unlimited)")
+    parser.add_argument("--mcp-rpm", type=float,
+                        help="Max MCP requests per minute (default: unlimited)")
+    parser.add_argument("--worker-latency-target", type=float,
+                        help="Halve Worker AI concurrency when a call takes longer than this many seconds")
+    parser.add_argument("--mcp-latency-target", type=float,
+                        help="Halve MCP concurrency when a call takes longer than this many seconds")
+    parser.add_argument("--deadline", type=float,
+                        help="Per-question time budget in seconds, split across the three calls")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Send a duplicate request when a call outlives its endpoint's p95 latency")
+    parser.add_argument("--compact-prompt", action="store_true",
+                        help="Send a pruned tree and deduplicated snippets instead of the full project tree")
+    parser.add_argument("--token-budget", type=int, default=6000,
+                        help="Estimated token budget for --compact-prompt prompts (default: 6000)")
+    parser.add_argument("--code-top-k", type=int, default=5,
+                        help="Code spans picked by BM25 search for questions without "
+                             "relevant_code_files (default: 5)")
+    parser.add_argument("--similar-threshold", type=float, default=None,
+                        help="Answer questions whose cosine similarity to an archived question "
+                             "is at least this value (0-1) from the archive; requires numpy")
+    parser.add_argument("--similar-mode", choices=("reuse", "seed"), default="reuse",
+                        help="reuse: return the archived answer; seed: reuse its MCP response "
+                             "and rerun only the follow-up (default: reuse)")
+    parser.add_argument("--stable-prefix", action="store_true",
+                        help="Send instructions and the project tree as a fixed system message "
+                             "so providers can cache the shared prefix")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Rewrite up to N questions with the same tags in one completion "
+                             "(implies --stable-prefix)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream Worker AI completions and report time to first token")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Do not read or write the response cache")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Ignore cached responses but store fresh ones")
+    parser.add_argument("--cache-ttl", type=float, default=7 * 24,
+                        help="Hours before a cached response expires (default: 168)")
+    parser.add_argument("--export-query-log", metavar="PATH",
+                        help="Write the query log as a JSON array to PATH and exit")
+    parser.add_argument("--lookup-query", metavar="QUERY",
+                        help="List archived results for an exact query and exit")
+    parser.add_argument("--lookup-date", metavar="YYYY-MM-DD",
+                        help="List archived results created on a UTC date and exit")
+    parser.add_argument("--query-history", metavar="QUERY",
+                        help="List query log entries for an exact query (only those on "
+                             "--lookup-date if given) and exit")
+    parser.add_argument("--show-result", metavar="ID",
+                        help="Print an archived result in full and exit")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write a cProfile dump of the main thread to the log directory "
+                             "(use --concurrency 1 to include the network calls)")
+    parser.add_argument("--archive-batch", type=int, default=20,
+                        help="Results buffered per archive write (default: 20)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip questions completed by a previous run on the same input file")
     args = parser.parse_args()
 
-    with open(args.input_json) as f:
-        questions = json.load(f)
+    if args.export_query_log:
+        query_log = open_query_log()
+        archive = ResultArchive(RESULT_ARCHIVE_PATH)
+        count = query_log.export_json(args.export_query_log, resolve=archive.get)
+        archive.close()
+        query_log.close()
+        print(f"[green]Exported {count} entries to {args.export_query_log}[/green]")
+        return
+    if args.lookup_date:
+        try:
+            date.fromisoformat(args.lookup_date)
+        except ValueError:
+            parser.error(f"--lookup-date must be YYYY-MM-DD, got {args.lookup_date!r}")
+    if args.query_history:
+        since = until = None
+        if args.lookup_date:
+            since = args.lookup_date
+            until = (date.fromisoformat(args.lookup_date) + timedelta(days=1)).isoformat()
+        query_log = open_query_log()
+        for entry in query_log.find(args.query_history, since, until):
+            print(f"{entry.get('timestamp', '')}  {entry.get('result_id') or entry.get('log_file', '')}")
+        query_log.close()
+        return
+    if args.lookup_query or args.lookup_date or args.show_result:
+        archive = ResultArchive(RESULT_ARCHIVE_PATH)
+        if args.show_result:
+            print(json.dumps(archive.get(args.show_result), indent=2))
+        else:
+            for result_id, created_at, query in archive.find(args.lookup_query, args.lookup_date):
+                print(f"{result_id}  {created_at}  {query}")
+        archive.close()
+        return
+    if not args.input_json:
+        parser.error("input_json is required unless a lookup or export option is given")
 
-    for q in questions:
-        prompt = build_prompt_block(q)
-        first_worker_resp = query_worker_ai(prompt)
-        mcp_resp = query_mcp(first_worker_resp["choices"][0]["message"]["content"])
+    global TRANSPORT
+    TRANSPORT = Transport(
+        pool_size=args.concurrency,
+        timeouts={"worker_ai": (10, args.worker_timeout), "mcp": (10, args.mcp_timeout)},
+        max_retries=args.max_retries,
+        governors={
+            "worker_ai": RateGovernor("worker_ai", args.concurrency, rpm=args.worker_rpm,
+                                      tpm=args.worker_tpm, latency_target=args.worker_latency_target),
+            "mcp": RateGovernor("mcp", args.concurrency, rpm=args.mcp_rpm,
+                                latency_target=args.mcp_latency_target),
+        },
+    )
+    global STREAM, STREAM_ECHO, HEDGER, QUESTION_DEADLINE
+    STREAM = args.stream
+    STREAM_ECHO = args.stream and args.concurrency <= 1 and not args.hedge
+    QUESTION_DEADLINE = args.deadline
+    global COMPACT_PROMPT, TOKEN_BUDGET, CODE_TOP_K
+    CODE_TOP_K = args.code_top_k
+    COMPACT_PROMPT = args.compact_prompt
+    TOKEN_BUDGET = args.token_budget
+    if args.hedge:
+        HEDGER = Hedger(args.concurrency)
+    global RESPONSE_CACHE
+    if not args.no_cache:
+        RESPONSE_CACHE = ResponseCache(RESPONSE_CACHE_PATH, ttl=args.cache_ttl * 3600,
+                                       read=not args.refresh)
 
-        second_prompt = {
-            "role": "user",
-            "content": f"Original Query: {q['query']}\nMCP Response: {mcp_resp}"
-        }
-        follow_ups = query_worker_ai(second_prompt)
-
-        summary = {
-            "original": q,
-            "prompt": prompt,
-            "worker_first": first_worker_resp,
-            "mcp_response": mcp_resp,
-            "worker_second": follow_ups
-        }
+    input_id = hashlib.sha256(os.path.abspath(args.input_json).encode("utf-8")).hexdigest()[:12]
+    checkpoint = Checkpoint(LOG_DIR / f"checkpoint-{input_id}.txt", resume=args.resume)
+    skipped = 0
+
+    def pending_questions():
+        nonlocal skipped
+        for q in iter_questions(args.input_json):
+            if question_key(q) in checkpoint:
+                skipped += 1
+                continue
+            yield q
+
+    query_log = open_query_log()
+    archive = ResultArchive(RESULT_ARCHIVE_PATH, batch_size=args.archive_batch)
+    index = load_file_index()
+    print(f"[cyan]File index: {len(index.files)} files ({index.rescanned} directories rescanned)[/cyan]")
+    global PROJECT_PREFIX
+    if args.stable_prefix or args.batch_size > 1:
+        PROJECT_PREFIX = build_project_prefix()
+    global RESULT_ARCHIVE, SIMILARITY_INDEX, SIMILAR_THRESHOLD, SIMILAR_MODE
+    RESULT_ARCHIVE = archive
+    if args.similar_threshold is not None:
+        SIMILAR_THRESHOLD = args.similar_threshold
+        SIMILAR_MODE = args.similar_mode
+        start = time.perf_counter()
+        try:
+            SIMILARITY_INDEX = SimilarityIndex.open(SIMILARITY_INDEX_PATH, archive)
+        except RuntimeError as e:
+            parser.error(str(e))
+        print(f"[cyan]Similarity index: {SIMILARITY_INDEX.size} questions "
+              f"({SIMILARITY_INDEX.added} added) in {time.perf_counter() - start:.2f}s[/cyan]")
+
+    # Results are archived in batches; a question only reaches the query log
+    # and the checkpoint once its batch has been written, so --resume never
+    # skips a result that was lost in a crash.
+    completed = []
+
+    def flush_results():
+        with METRICS.timer("archive_write"):
+            archive.flush()
+        with METRICS.timer("query_log_write"):
+            for entry, _ in completed:
+                query_log.append(entry)
+            checkpoint.mark([key for _, key in completed])
+        if SIMILARITY_INDEX is not None:
+            for entry, _ in completed:
+                SIMILARITY_INDEX.add(entry["result_id"], entry["query"])
+        completed.clear()
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+
+    # Output and log writes happen here, in input order, so a concurrent run
+    # produces the same logs as a sequential one.
+    try:
+        for q, tree, summary in run_pipeline(pending_questions(), args.concurrency,
+                                                 args.batch_size):
+            print(tree)
+            if "deadline_exceeded" in summary:
+                # Not archived or checkpointed, so --resume will retry it.
+                METRICS.add("deadline_exceeded")
+                print(f"[red]Deadline exceeded: {summary['deadline_exceeded']}[/red]")
+                continue
+            result_id = archive.add(q["query"], summary)
+            print(f"[green]Archived result {result_id}[/green]")
+            completed.append(({"query": q["query"], "result_id": result_id}, question_key(q)))
+            if archive.pending >= archive.batch_size:
+                flush_results()
+    finally:
+        flush_results()
+        if profiler:
+            profiler.disable()
+        archive_stats = archive.stats()
+        archive.close()
+        if SIMILARITY_INDEX is not None:
+            SIMILARITY_INDEX.save()
+        query_log.close()
+        checkpoint.close()
+    print(f"[cyan]Archive: {archive_stats['blobs_written']} new blobs, "
+          f"{archive_stats['blobs_deduplicated']} deduplicated[/cyan]")
+    if skipped:
+        print(f"[cyan]Resumed: skipped {skipped} already completed questions[/cyan]")
+
+    stats = TRANSPORT.stats()
+    print(f"[cyan]HTTP: {stats['requests']} requests, {stats['new_connections']} new connections, "
+          f"{stats['reused_connections']} reused, {stats['retries']} retries[/cyan]")
+    governor_stats = TRANSPORT.governor_stats()
+    for name, gs in governor_stats.items():
+        if gs["throttled"] or gs["slow"] or gs["wait_seconds"] >= 0.01:
+            print(f"[cyan]Rate governor {name}: {gs['throttled']} throttled, {gs['slow']} slow, "
+                  f"concurrency limit {gs['limit']} (lowest {gs['lowest_limit']}), "
+                  f"waited {gs['wait_seconds']}s[/cyan]")
+    if RESPONSE_CACHE is not None:
+        cache_stats = RESPONSE_CACHE.stats()
+        print(f"[cyan]Cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+              f"{cache_stats['stores']} stored, {cache_stats['evictions']} evicted[/cyan]")
+        RESPONSE_CACHE.close()
+    if HEDGER is not None:
+        hedge_stats = HEDGER.stats()
+        for name, hs in sorted(hedge_stats.items()):
+            line = f"[cyan]Hedging {name}: {hs['hedges_fired']} fired, {hs['hedges_won']} won"
+            if hs["p99_saved"] is not None:
+                line += (f", p99 {hs['p99']:.3f}s vs {hs['p99_unhedged']:.3f}s unhedged "
+                         f"(saved {hs['p99_saved']:.3f}s)")
+            print(line + "[/cyan]")
+        HEDGER.close()
+    TRANSPORT.close()
+    SNIPPET_READER.close()
+
+    if CODE_INDEX is not None:
+        searches = METRICS.stage_summary().get("code_search")
+        print(f"[cyan]Code search: {searches['count'] if searches else 0} questions, "
+              f"query p50 {(searches['p50'] if searches else 0) * 1000:.2f}ms[/cyan]")
+
+    if SIMILARITY_INDEX is not None:
+        lookups = METRICS.stage_summary().get("similarity_lookup")
+        print(f"[cyan]Similar questions: {int(METRICS.counters.get('similar_reused', 0))} reused, "
+              f"{int(METRICS.counters.get('similar_seeded', 0))} seeded"
+              + (f", lookup p50 {lookups['p50'] * 1000:.3f}ms" if lookups else "") + "[/cyan]")
+
+    if PROJECT_PREFIX is not None:
+        prefix_stats = PREFIX_TRACKER.stats()
+        round_trips = int(METRICS.counters.get("worker_ai_rewrite_round_trips", 0))
+        print(f"[cyan]Prompt prefix: {prefix_stats['reused_bytes']} bytes reused across calls, "
+              f"{round_trips} rewrite round trips[/cyan]")
 
-        result_file = save_log(summary)
-        append_query_log({"query": q["query"], "log_file": str(result_file)})
+    extra = {"http": stats, "archive": archive_stats, "resumed_skipped": skipped}
+    if PROJECT_PREFIX is not None:
+        extra["prompt_prefix"] = prefix_stats
+    for name, gs in governor_stats.items():
+        extra[f"governor_{name}"] = gs
+    if HEDGER is not None:
+        for name, hs in hedge_stats.items():
+            extra[f"hedging_{name}"] = hs
+    if RESPONSE_CACHE is not None:
+        extra["cache"] = cache_stats
+    METRICS.write_json(METRICS_JSON_PATH, extra)
+    METRICS.write_prometheus(METRICS_PROM_PATH, extra)
+    print_stage_table(METRICS.stage_summary())
+    print(f"[cyan]Metrics written to {METRICS_JSON_PATH} and {METRICS_PROM_PATH}[/cyan]")
+    if profiler:
+        profile_path = LOG_DIR / f"profile-{time.strftime('%Y%m%dT%H%M%S')}.pstats"
+        profiler.dump_stats(str(profile_path))
+        print(f"[cyan]Profile written to {profile_path}[/cyan]")
 
 
 if __name__ == "__main__":
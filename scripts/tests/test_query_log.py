@@ -0,0 +1,102 @@
+"""Tests for cfdocs.query_log. Run with: python -m pytest scripts/tests"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from cfdocs.query_log import QueryLog  # noqa: E402
+
+
+def open_log(tmp_path, **kwargs):
+    return QueryLog(tmp_path / "query-log.jsonl", tmp_path / "query-log.idx.sqlite", **kwargs)
+
+
+def test_torn_tail_is_trimmed_on_open(tmp_path):
+    log = open_log(tmp_path)
+    log.append({"query": "a", "result_id": "1"})
+    log.append({"query": "b", "result_id": "2"})
+    log.close()
+    # A crash in the middle of an append leaves a partial last line.
+    with open(tmp_path / "query-log.jsonl", "ab") as f:
+        f.write(b'{"query": "c", "resu')
+
+    log = open_log(tmp_path)
+    assert [e["query"] for e in log] == ["a", "b"]
+    log.append({"query": "d", "result_id": "4"})
+    assert [e["query"] for e in log] == ["a", "b", "d"]
+    assert [e["result_id"] for e in log.find("d")] == ["4"]
+    log.close()
+
+
+def test_index_catches_up_with_lines_written_after_it(tmp_path):
+    log = open_log(tmp_path)
+    log.append({"query": "a", "timestamp": "2026-01-01T10:00:00+00:00"})
+    log.close()
+    # Lines that reached the log but not the index, as after a crash
+    # between the fsync and the index commit.
+    with open(tmp_path / "query-log.jsonl", "a") as f:
+        f.write(json.dumps({"query": "b", "timestamp": "2026-01-02T10:00:00+00:00"}) + "\n")
+        f.write(json.dumps({"query": "a", "timestamp": "2026-01-03T10:00:00+00:00"}) + "\n")
+
+    log = open_log(tmp_path)
+    assert [e["timestamp"][:10] for e in log.find("a")] == ["2026-01-01", "2026-01-03"]
+    assert [e["query"] for e in log.find(since="2026-01-02", until="2026-01-03")] == ["b"]
+    log.close()
+
+
+def test_index_is_rebuilt_when_the_log_shrinks(tmp_path):
+    log = open_log(tmp_path)
+    for query in ("a", "b", "c"):
+        log.append({"query": query})
+    log.close()
+    with open(tmp_path / "query-log.jsonl", "w") as f:
+        f.write(json.dumps({"query": "z"}) + "\n")
+
+    log = open_log(tmp_path)
+    assert log.find("a") == []
+    assert [e["query"] for e in log.find("z")] == ["z"]
+    log.close()
+
+
+def test_export_round_trips_the_legacy_array(tmp_path):
+    legacy = [
+        {"query": "How do I bind D1?", "log_file": "docs/cloudflare-docs/mcp_result_1.json"},
+        {"query": "Queues — retries?", "log_file": "docs/cloudflare-docs/mcp_result_2.json"},
+    ]
+    legacy_path = tmp_path / "query-log.json"
+    legacy_path.write_text(json.dumps(legacy, indent=2))
+
+    log = open_log(tmp_path, legacy_path=legacy_path)
+    out = tmp_path / "export.json"
+    assert log.export_json(out) == 2
+    log.close()
+
+    exported = json.loads(out.read_text())
+    assert [{k: e[k] for k in ("query", "log_file")} for e in exported] == legacy
+    assert all("timestamp" in e for e in exported)
+    assert not os.path.exists(f"{out}.tmp")
+
+
+def test_export_of_an_empty_log_is_an_empty_array(tmp_path):
+    log = open_log(tmp_path)
+    out = tmp_path / "export.json"
+    assert log.export_json(out) == 0
+    log.close()
+    assert json.loads(out.read_text()) == []
+
+
+def test_export_inlines_archived_results(tmp_path):
+    log = open_log(tmp_path)
+    log.append({"query": "a", "result_id": "r1"})
+    log.append({"query": "b", "result_id": "gone"})
+    out = tmp_path / "export.json"
+    results = {"r1": {"id": "r1", "summary": "answer"}}
+    assert log.export_json(out, resolve=results.get) == 2
+    log.close()
+
+    exported = json.loads(out.read_text())
+    assert exported[0]["result"] == {"id": "r1", "summary": "answer"}
+    assert "result" not in exported[1]
+    assert sorted(os.listdir(tmp_path)) == ["export.json", "query-log.idx.sqlite", "query-log.jsonl"]
@@ -0,0 +1,55 @@
+"""Tests for cfdocs.streaming. Run with: python -m pytest scripts/tests"""
+
+import io
+import json
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from cfdocs.streaming import read_chat_stream  # noqa: E402
+
+
+def make_response(events, content_type="text/event-stream"):
+    body = "".join(f"data: {event}\n\n" for event in events).encode("utf-8")
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.headers["Content-Type"] = content_type
+    resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+    resp.raw = io.BytesIO(body)
+    return resp
+
+
+def chunk(content=None, finish_reason=None):
+    delta = {} if content is None else {"content": content}
+    return json.dumps({"choices": [{"delta": delta, "finish_reason": finish_reason}]}, ensure_ascii=False)
+
+
+def test_non_ascii_tokens_are_decoded_as_utf8():
+    tokens = []
+    resp = make_response([chunk("café — "), chunk("✓ 日本"), chunk(finish_reason="stop"), "[DONE]"])
+    completion = read_chat_stream(resp, time.perf_counter(), on_token=tokens.append)
+    assert tokens == ["café — ", "✓ 日本"]
+    assert completion["choices"][0]["message"]["content"] == "café — ✓ 日本"
+    assert completion["choices"][0]["finish_reason"] == "stop"
+
+
+def test_content_after_finish_reason_is_ignored():
+    resp = make_response([chunk("a"), chunk(finish_reason="length"), chunk("ignored")],
+                         content_type="text/event-stream; charset=utf-8")
+    completion = read_chat_stream(resp, time.perf_counter())
+    assert completion["choices"][0]["message"]["content"] == "a"
+    assert completion["choices"][0]["finish_reason"] == "length"
+    assert "usage" not in completion
+
+
+def test_usage_chunk_after_finish_reason_is_read():
+    usage = {"prompt_tokens": 12, "completion_tokens": 2}
+    resp = make_response([chunk("a"), chunk("b", finish_reason="stop"),
+                          json.dumps({"choices": [], "usage": usage}), "[DONE]"])
+    completion = read_chat_stream(resp, time.perf_counter())
+    assert completion["choices"][0]["message"]["content"] == "ab"
+    assert completion["usage"] == usage